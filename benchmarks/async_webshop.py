@@ -0,0 +1,138 @@
+"""Benchmark for webshop reads: synchronous workers versus a single asyncio process.
+
+Run with `PYTHONPATH=src DATABASE_URL=... python benchmarks/async_webshop.py [seconds] [mode]`,
+against a scratch database with the migrations applied. Mode is "single" or "multi", as for
+WEBSHOP_QUERY, and defaults to "multi". It creates its own orgs, then for a range of concurrency
+levels keeps that many clients busy fetching webshops, with the cache bypassed, and reports
+throughput and latency percentiles:
+
+* sync: as many workers as gunicorn would run, each with a connection of its own, serving the
+  clients through Model. Clients beyond the worker count wait for one to free up, and that wait
+  counts towards their latency, as it would in gunicorn's backlog. The workers are threads, so
+  they share one GIL where gunicorn would have separate processes.
+* async: one event loop serving all the clients through AsyncModel, with DATABASE_POOL_SIZE
+  connections.
+"""
+
+import asyncio
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+import sqlalchemy as sql
+
+import inventory.async_model as async_model
+import inventory.model as model
+
+
+CONCURRENCIES = [1, 10, 50, 200]
+
+
+class _Clock(object):
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _seed(the_model, orgs, sections, items):
+    base_user_id = random.randint(10**6, 10**9)
+    image_set = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+    opening_hours = {'weekday': {}, 'saturday': {}, 'sunday': {}}
+    menu_item = {'name': 'Item', 'description': 'An item', 'keywords': [], 'ingredients': [],
+                 'imageSet': image_set}
+    subdomains = []
+
+    for o in range(orgs):
+        user_id = base_user_id + o
+        the_model.create_org(
+            user_id, 'Async {} {}'.format(base_user_id, o), 'A restaurant', [], 'Main Street',
+            opening_hours, image_set)
+        the_model.import_menu(user_id, [
+            {'name': 'Section', 'description': 'A section', 'items': [menu_item] * items}
+            for _ in range(sections)])
+        subdomains.append(the_model.get_platforms_website(user_id)['subdomain'])
+
+    return subdomains
+
+
+def _percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+
+def _report(name, concurrency, latencies, seconds):
+    print('{:<6} {:>6} {:>10.0f} {:>10.2f} {:>10.2f}'.format(
+        name, concurrency, len(latencies) / seconds, _percentile(latencies, 0.5) * 1000,
+        _percentile(latencies, 0.99) * 1000))
+
+
+def _run_sync(sql_engine, mode, subdomains, workers, concurrency, seconds):
+    the_model = model.Model(_Clock(), sql_engine, webshop_query=mode, compiled_cache={})
+    free_workers = threading.Semaphore(workers)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            with free_workers:
+                the_model.get_webshop_info(random.choice(subdomains))
+            latencies.append(time.perf_counter() - started)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+
+    _report('sync', concurrency, latencies, seconds)
+
+
+async def _run_async(pool, mode, subdomains, concurrency, seconds):
+    the_model = async_model.AsyncModel(pool, webshop_query=mode)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await the_model.get_webshop_info(random.choice(subdomains))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+
+    _report('async', concurrency, latencies, seconds)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    mode = sys.argv[2] if len(sys.argv) > 2 else model.Model.WEBSHOP_QUERY_MULTI
+    workers = multiprocessing.cpu_count() * 2 + 1
+    pool_size = int(os.getenv('DATABASE_POOL_SIZE', '10'))
+
+    sql_engine = sql.create_engine(
+        os.environ['DATABASE_URL'], pool_size=workers, max_overflow=0)
+    subdomains = _seed(model.Model(_Clock(), sql_engine), 50, 10, 10)
+
+    print('{} sync workers, {} async connections, "{}" webshop query'.format(
+        workers, pool_size, mode))
+    print('{:<6} {:>6} {:>10} {:>10} {:>10}'.format('server', 'conc', 'req/s', 'p50 ms', 'p99 ms'))
+
+    for concurrency in CONCURRENCIES:
+        _run_sync(sql_engine, mode, subdomains, workers, concurrency, seconds)
+
+    loop = asyncio.get_event_loop()
+    pool = loop.run_until_complete(async_model.create_pool(
+        os.environ['DATABASE_URL'], min_size=pool_size, max_size=pool_size))
+
+    for concurrency in CONCURRENCIES:
+        loop.run_until_complete(_run_async(pool, mode, subdomains, concurrency, seconds))
+
+    loop.run_until_complete(pool.close())
+
+
+if __name__ == '__main__':
+    main()
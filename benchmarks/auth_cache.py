@@ -0,0 +1,75 @@
+"""Benchmark for authenticated requests: every token sent to identity versus a token cache.
+
+Run with `PYTHONPATH=src python benchmarks/auth_cache.py [requests] [users] [latency-ms]`. A
+stand-in for the identity service answers after the given latency and counts its calls. The same
+mix of requests, spread over the users' tokens, goes through the bare stand-in and then through
+CachingAuthMiddleware. Reports requests per second for both, and the identity calls avoided.
+"""
+
+import random
+import sys
+import time
+
+import falcon
+import falcon.testing
+
+import inventory.auth as auth
+
+
+class _StandInIdentityMiddleware(object):
+    """Resolves tokens like identity.AuthMiddleware, with a fixed latency for each call."""
+
+    def __init__(self, users, latency):
+        self.users = users
+        self.latency = latency
+        self.calls = 0
+
+    def process_resource(self, req, resp, resource, params=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        user = self.users.get(req.get_header('Authorization'))
+        if user is None:
+            raise falcon.HTTPUnauthorized(title='Unauthorized', description='Unauthorized')
+        req.context['user'] = user
+
+
+class _UserResource(object):
+    def on_get(self, req, resp):
+        resp.body = str(req.context['user']['id'])
+
+
+def _run(middleware, tokens):
+    api = falcon.API(middleware=[middleware])
+    api.add_route('/user', _UserResource())
+    client = falcon.testing.TestClient(api)
+
+    started = time.perf_counter()
+    for token in tokens:
+        assert client.simulate_get('/user', headers={'Authorization': token}).status_code == 200
+    return len(tokens) / (time.perf_counter() - started)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005
+
+    identity_users = {'Bearer token-{}'.format(u): {'id': u} for u in range(users)}
+    tokens = [random.choice(list(identity_users)) for _ in range(requests)]
+
+    bare = _StandInIdentityMiddleware(identity_users, latency)
+    bare_rate = _run(bare, tokens)
+
+    behind_cache = _StandInIdentityMiddleware(identity_users, latency)
+    token_cache = auth.TokenCache(max_size=10000, ttl=60)
+    cached_rate = _run(auth.CachingAuthMiddleware(behind_cache, token_cache), tokens)
+
+    print('{:<20} {:>12} {:>15}'.format('auth', 'requests/s', 'identity calls'))
+    print('{:<20} {:>12.1f} {:>15}'.format('identity', bare_rate, bare.calls))
+    print('{:<20} {:>12.1f} {:>15}'.format('cached', cached_rate, behind_cache.calls))
+    print('identity calls avoided {} of {}, speedup {:.1f}x'.format(
+        bare.calls - behind_cache.calls, bare.calls, cached_rate / bare_rate))
+
+
+if __name__ == '__main__':
+    main()
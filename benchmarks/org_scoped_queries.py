@@ -0,0 +1,115 @@
+"""Benchmark for org-scoped reads: joining through org_user versus a cached org id.
+
+Run with `PYTHONPATH=src DATABASE_URL=... python benchmarks/org_scoped_queries.py [orgs] [items]`,
+against a scratch database with the migrations applied. It creates its own orgs, prints the
+EXPLAIN ANALYZE output of both forms of the menu item lookup, then reports lookups per second for
+the old join-based statement and for Model.get_menu_item with a warm org id cache.
+"""
+
+import datetime
+import os
+import random
+import sys
+import timeit
+
+import sqlalchemy as sql
+
+import inventory.cache as cache
+import inventory.model as model
+
+
+class _Clock(object):
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _join_based_fetch_menu_item(user_id, item_id):
+    # The shape of the org-scoped statements before org ids were resolved separately.
+    return sql \
+        .select(model._menu_item_columns) \
+        .select_from(model._org_user
+                     .join(model._org, model._org.c.id == model._org_user.c.org_id)
+                     .join(model._menu_item,
+                           model._menu_item.c.org_id == model._org_user.c.org_id)) \
+        .where(sql.and_(
+            model._org_user.c.user_id == user_id,
+            model._menu_item.c.id == item_id,
+            model._menu_item.c.time_archived == None))
+
+
+def _seed(the_model, orgs, items):
+    base_user_id = random.randint(10**6, 10**9)
+    image_set = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+    opening_hours = {'weekday': {}, 'saturday': {}, 'sunday': {}}
+    lookups = []
+
+    for o in range(orgs):
+        user_id = base_user_id + o
+        the_model.create_org(
+            user_id, 'Benchmark {} {}'.format(base_user_id, o), 'A restaurant', [], 'Main Street',
+            opening_hours, image_set)
+        section = the_model.create_menu_section(user_id, 'Section', 'A section')
+        for i in range(items):
+            item = the_model.create_menu_item(
+                user_id, section['id'], 'Item {}'.format(i), 'An item', [], [], image_set)
+            lookups.append((user_id, item['id']))
+
+    return lookups
+
+
+def _rate(fn, min_time=1.0):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            return number / elapsed
+        number *= 2
+
+
+def _explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    result = conn.execute('EXPLAIN ANALYZE {}'.format(compiled))
+    plan = '\n'.join('    ' + row[0] for row in result)
+    result.close()
+    return plan
+
+
+def main():
+    orgs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    sql_engine = sql.create_engine(os.environ['DATABASE_URL'])
+    the_model = model.Model(_Clock(), sql_engine, org_id_cache=cache.LruCache(orgs))
+    lookups = _seed(the_model, orgs, items)
+    user_id, item_id = lookups[len(lookups) // 2]
+
+    with sql_engine.begin() as conn:
+        conn.execute('ANALYZE').close()
+        print('join through org_user and org:')
+        print(_explain(conn, _join_based_fetch_menu_item(user_id, item_id)))
+        print('filter on the cached org id:')
+        print(_explain(conn, model._fetch_menu_item.params(
+            org_id=the_model._resolve_org_id(conn, user_id), item_id=item_id)))
+
+    def join_based():
+        user_id, item_id = random.choice(lookups)
+        with sql_engine.begin() as conn:
+            result = conn.execute(_join_based_fetch_menu_item(user_id, item_id))
+            result.fetchone()
+            result.close()
+
+    def org_scoped():
+        user_id, item_id = random.choice(lookups)
+        the_model.get_menu_item(user_id, item_id)
+
+    baseline = _rate(join_based)
+    optimized = _rate(org_scoped)
+
+    print('{:<30} {:>10}'.format('statement', 'lookups/s'))
+    print('{:<30} {:>10.0f}'.format('join through org_user', baseline))
+    print('{:<30} {:>10.0f}'.format('cached org id', optimized))
+    print('speedup {:.2f}x'.format(optimized / baseline))
+
+
+if __name__ == '__main__':
+    main()
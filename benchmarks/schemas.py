@@ -0,0 +1,99 @@
+"""Microbenchmark for schema validation: jsonschema.validate versus the compiled validators.
+
+Run with `PYTHONPATH=src python benchmarks/schemas.py [menu-size]`. Reports validations per
+second, for a representative instance of every request and response schema.
+"""
+
+import sys
+import timeit
+
+import jsonschema
+
+import inventory.compiled_schemas as compiled_schemas
+import inventory.schemas as schemas
+
+
+def _samples(menu_size):
+    image_set = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 1600, 'height': 900}]
+    interval = {'start': {'hour': 8, 'minute': 0}, 'end': {'hour': 22, 'minute': 30}}
+    opening_hours = {'weekday': interval, 'saturday': interval, 'sunday': interval}
+    restaurant = {
+        'id': 1, 'timeCreatedTs': 1000, 'name': 'Ocelot', 'description': 'A restaurant',
+        'keywords': ['pizza', 'pasta'], 'address': 'Main Street 1', 'openingHours': opening_hours,
+        'imageSet': image_set
+    }
+    menu_item = {
+        'id': 1, 'timeCreatedTs': 1000, 'name': 'Pizza', 'description': 'With cheese',
+        'keywords': ['cheese'], 'ingredients': ['flour', 'cheese'], 'imageSet': image_set
+    }
+    menu_section = {'id': 1, 'timeCreatedTs': 1000, 'name': 'Pizzas', 'description': 'Round'}
+    website = {'id': 1, 'timeCreatedTs': 1000, 'subdomain': 'ocelot'}
+    callcenter = {'id': 1, 'timeCreatedTs': 1000, 'phoneNumber': '0744 000 000'}
+    emailcenter = {'id': 1, 'timeCreatedTs': 1000, 'emailName': 'contact'}
+    sections = {}
+    for s in range(max(1, menu_size // 20)):
+        sections[str(s)] = dict(menu_section, id=s, items={})
+    for i in range(menu_size):
+        sections[str(i % len(sections))]['items'][str(i)] = dict(menu_item, id=i)
+
+    return [
+        ('ORG_CREATION_REQUEST', {
+            'name': 'Ocelot', 'description': 'A restaurant', 'keywords': ['pizza'],
+            'address': 'Main Street 1', 'openingHours': opening_hours, 'imageSet': image_set}),
+        ('ORG_RESPONSE', {'org': {'id': 1, 'timeCreatedTs': 1000}}),
+        ('RESTAURANT_UPDATE_REQUEST', {'name': 'Ocelot', 'openingHours': opening_hours}),
+        ('RESTAURANT_RESPONSE', {'restaurant': restaurant}),
+        ('MENU_SECTIONS_CREATION_REQUEST', {'name': 'Pizzas', 'description': 'Round'}),
+        ('MENU_SECTIONS_RESPONSE', {'menuSections': [menu_section] * 20}),
+        ('MENU_SECTION_UPDATE_REQUEST', {'description': 'Round and tasty'}),
+        ('MENU_SECTION_RESPONSE', {'menuSection': sections['0']}),
+        ('MENU_ITEMS_CREATION_REQUEST', {
+            'sectionId': 1, 'name': 'Pizza', 'description': 'With cheese',
+            'keywords': ['cheese'], 'ingredients': ['flour'], 'imageSet': image_set}),
+        ('MENU_ITEMS_BULK_CREATION_REQUEST', [{
+            'sectionId': 1, 'name': 'Pizza', 'description': 'With cheese',
+            'keywords': ['cheese'], 'ingredients': ['flour'], 'imageSet': image_set
+        }] * menu_size),
+        ('MENU_ITEMS_RESPONSE', {'menuItems': [menu_item] * menu_size}),
+        ('MENU_ITEM_UPDATE_REQUEST', {'name': 'Pizza', 'ingredients': ['flour']}),
+        ('MENU_ITEM_RESPONSE', {'menuItem': menu_item}),
+        ('PLATFORMS_WEBSITE_UPDATE_REQUEST', {'subdomain': 'ocelot'}),
+        ('PLATFORMS_WEBSITE_RESPONSE', {'platformsWebsite': website}),
+        ('PLATFORMS_CALLCENTER_UPDATE_REQUEST', {'phoneNumber': '0744 000 000'}),
+        ('PLATFORMS_CALLCENTER_RESPONSE', {'platformsCallcenter': callcenter}),
+        ('PLATFORMS_EMAILCENTER_UPDATE_REQUEST', {'emailName': 'contact'}),
+        ('PLATFORMS_EMAILCENTER_RESPONSE', {'platformsEmailcenter': emailcenter}),
+        ('WEBSHOP_INFO_RESPONSE', {'webshopInfo': {
+            'general': restaurant,
+            'menu': {'sections': sections},
+            'platforms': {'website': website, 'callcenter': callcenter, 'emailcenter': emailcenter}
+        }}),
+    ]
+
+
+def _rate(fn, min_time=0.2):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            return number / elapsed
+        number *= 2
+
+
+def main():
+    menu_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    print('{:<40} {:>14} {:>14} {:>8}'.format('schema', 'jsonschema/s', 'compiled/s', 'speedup'))
+    for name, instance in _samples(menu_size):
+        schema = getattr(schemas, name)
+        compiled = getattr(compiled_schemas, name)
+
+        baseline = _rate(lambda: jsonschema.validate(instance, schema))
+        optimized = _rate(lambda: compiled.validate(instance))
+
+        print('{:<40} {:>14.0f} {:>14.0f} {:>7.1f}x'.format(
+            name, baseline, optimized, optimized / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark for turning rows into their external form: _i2e versus the precomputed serializers.
+
+Run with `PYTHONPATH=src python benchmarks/serialization.py [menu-size]`. Reports conversions per
+second of a whole menu worth of menu item rows. With DATABASE_URL pointing at a scratch database
+with the migrations applied, it also times get_all_menu_items and the multi query
+get_webshop_info for an org with a menu of that size.
+"""
+
+import datetime
+import os
+import random
+import sys
+import timeit
+
+import inflection
+import sqlalchemy as sql
+
+import inventory.cache as cache
+import inventory.model as model
+
+
+class _Clock(object):
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _legacy_i2e(d):
+    # The per-key conversion used before the serializers.
+    o = {}
+    for k, v in d.items():
+        if isinstance(v, datetime.datetime):
+            o[inflection.camelize(k, False) + 'Ts'] = int(v.timestamp())
+        else:
+            o[inflection.camelize(k, False)] = v
+    return o
+
+
+def _rate(fn, min_time=0.5):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            return number / elapsed
+        number *= 2
+
+
+def _rows(menu_size):
+    right_now = _Clock().now()
+    image_set = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+
+    return [{
+        'id': i, 'time_created': right_now, 'name': 'Item {}'.format(i), 'description': 'An item',
+        'keywords': ['cheese'], 'ingredients': ['flour', 'tomatoes'], 'image_set': image_set
+    } for i in range(menu_size)]
+
+
+def _model_rates(menu_size):
+    sql_engine = sql.create_engine(os.environ['DATABASE_URL'])
+    the_model = model.Model(
+        _Clock(), sql_engine, webshop_query=model.Model.WEBSHOP_QUERY_MULTI,
+        org_id_cache=cache.LruCache(1), compiled_cache={})
+    image_set = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+    opening_hours = {'weekday': {}, 'saturday': {}, 'sunday': {}}
+
+    user_id = random.randint(10**6, 10**9)
+    the_model.create_org(
+        user_id, 'Serialization {}'.format(user_id), 'A restaurant', [], 'Main Street',
+        opening_hours, image_set)
+    subdomain = the_model.get_platforms_website(user_id)['subdomain']
+    sections = [the_model.create_menu_section(user_id, 'Section', 'A section') for _ in range(20)]
+    for i in range(menu_size):
+        the_model.create_menu_item(
+            user_id, sections[i % len(sections)]['id'], 'Item {}'.format(i), 'An item',
+            ['cheese'], ['flour', 'tomatoes'], image_set)
+
+    return [
+        ('get_all_menu_items', _rate(lambda: the_model.get_all_menu_items(user_id))),
+        ('get_webshop_info (multi)', _rate(lambda: the_model.get_webshop_info(subdomain)))
+    ]
+
+
+def main():
+    menu_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rows = _rows(menu_size)
+
+    baseline = _rate(lambda: [_legacy_i2e(r) for r in rows])
+    optimized = _rate(lambda: [model._menu_item_serializer(r) for r in rows])
+
+    print('{:<30} {:>12}'.format('conversion', 'menus/s'))
+    print('{:<30} {:>12.1f}'.format('_i2e', baseline))
+    print('{:<30} {:>12.1f}'.format('serializer', optimized))
+    print('speedup {:.1f}x'.format(optimized / baseline))
+
+    if 'DATABASE_URL' in os.environ:
+        print('{:<30} {:>12}'.format('model call', 'calls/s'))
+        for name, rate in _model_rates(menu_size):
+            print('{:<30} {:>12.1f}'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""Add a content version to the org, bumped by every change to its data."""
+
+from yoyo import step
+
+
+__depends__ = ['0007.create_menu']
+
+
+step("""
+ALTER TABLE inventory.org
+    ADD COLUMN content_version BIGINT NOT NULL DEFAULT 1;
+""", """
+ALTER TABLE inventory.org
+    DROP COLUMN IF EXISTS content_version;
+""")
@@ -0,0 +1,23 @@
+"""Index live menu rows by org and id, for keyset pagination of sections and items."""
+
+from yoyo import step
+
+
+__depends__ = ['0008.add_org_content_version']
+
+
+step("""
+CREATE INDEX menu_section_ix_org_id_id_live
+    ON inventory.menu_section (org_id, id)
+    WHERE time_archived IS NULL;
+""", """
+DROP INDEX IF EXISTS inventory.menu_section_ix_org_id_id_live;
+""")
+
+step("""
+CREATE INDEX menu_item_ix_org_id_id_live
+    ON inventory.menu_item (org_id, id)
+    WHERE time_archived IS NULL;
+""", """
+DROP INDEX IF EXISTS inventory.menu_item_ix_org_id_id_live;
+""")
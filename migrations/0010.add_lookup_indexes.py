@@ -0,0 +1,25 @@
+"""Index the lookups which are not served by a primary key or unique constraint.
+
+Live menu items by org are already covered by menu_item_ix_org_id_id_live, from 0009.
+"""
+
+from yoyo import step
+
+
+__depends__ = ['0009.add_menu_pagination_indexes']
+
+
+step("""
+CREATE INDEX platforms_website_ix_subdomain
+    ON inventory.platforms_website (subdomain);
+""", """
+DROP INDEX IF EXISTS inventory.platforms_website_ix_subdomain;
+""")
+
+step("""
+CREATE INDEX menu_item_ix_section_id_org_id_live
+    ON inventory.menu_item (section_id, org_id)
+    WHERE time_archived IS NULL;
+""", """
+DROP INDEX IF EXISTS inventory.menu_item_ix_section_id_org_id_live;
+""")
@@ -0,0 +1,60 @@
+"""Add a full-text search document to menu items, kept up to date by a trigger.
+
+The document weighs the name most, then the keywords and ingredients, then the description. It
+uses the simple configuration, without stemming or stop words, as menus come in many languages.
+A trigger, rather than a generated column, keeps it working on Postgres before 12.
+"""
+
+from yoyo import step
+
+
+__depends__ = ['0010.add_lookup_indexes']
+
+
+step("""
+CREATE FUNCTION inventory.menu_item_search_document(
+    name TEXT, description TEXT, keywords TEXT[], ingredients JSON)
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('simple', name), 'A') ||
+        setweight(to_tsvector('simple', array_to_string(keywords, ' ')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(i, ' ')
+            FROM json_array_elements_text(ingredients) AS i), '')), 'B') ||
+        setweight(to_tsvector('simple', description), 'C');
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE FUNCTION inventory.menu_item_set_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_document := inventory.menu_item_search_document(
+        NEW.name, NEW.description, NEW.keywords, NEW.ingredients);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE inventory.menu_item ADD COLUMN search_document TSVECTOR;
+
+UPDATE inventory.menu_item
+    SET search_document = inventory.menu_item_search_document(
+        name, description, keywords, ingredients);
+
+ALTER TABLE inventory.menu_item ALTER COLUMN search_document SET NOT NULL;
+
+CREATE TRIGGER menu_item_tr_search_document
+    BEFORE INSERT OR UPDATE OF name, description, keywords, ingredients
+    ON inventory.menu_item
+    FOR EACH ROW EXECUTE PROCEDURE inventory.menu_item_set_search_document();
+""", """
+DROP TRIGGER IF EXISTS menu_item_tr_search_document ON inventory.menu_item;
+ALTER TABLE inventory.menu_item DROP COLUMN IF EXISTS search_document;
+DROP FUNCTION IF EXISTS inventory.menu_item_set_search_document();
+DROP FUNCTION IF EXISTS inventory.menu_item_search_document(TEXT, TEXT, TEXT[], JSON);
+""")
+
+step("""
+CREATE INDEX menu_item_ix_search_document_live
+    ON inventory.menu_item USING GIN (search_document)
+    WHERE time_archived IS NULL;
+""", """
+DROP INDEX IF EXISTS inventory.menu_item_ix_search_document_live;
+""")
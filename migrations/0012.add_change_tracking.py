@@ -0,0 +1,48 @@
+"""Track when, and as of which org content version, each row of an org's data last changed.
+
+Existing rows are taken to have last changed when they were created, or archived, and as of the
+current content version of their org.
+"""
+
+from yoyo import step
+
+
+__depends__ = ['0011.add_menu_item_search']
+
+
+_TABLES = ['restaurant', 'menu_section', 'menu_item', 'platforms_website', 'platforms_callcenter',
+           'platforms_emailcenter']
+_ARCHIVABLE_TABLES = ['menu_section', 'menu_item']
+
+
+for table in _TABLES:
+    time_changed = 'COALESCE(t.time_archived, t.time_created)' \
+        if table in _ARCHIVABLE_TABLES else 't.time_created'
+
+    step("""
+    ALTER TABLE inventory.{table}
+        ADD COLUMN time_updated TIMESTAMP,
+        ADD COLUMN content_version BIGINT;
+
+    UPDATE inventory.{table} AS t
+        SET time_updated = {time_changed}, content_version = o.content_version
+        FROM inventory.org AS o
+        WHERE o.id = t.org_id;
+
+    ALTER TABLE inventory.{table}
+        ALTER COLUMN time_updated SET NOT NULL,
+        ALTER COLUMN content_version SET NOT NULL;
+    """.format(table=table, time_changed=time_changed), """
+    ALTER TABLE inventory.{table}
+        DROP COLUMN IF EXISTS time_updated,
+        DROP COLUMN IF EXISTS content_version;
+    """.format(table=table))
+
+
+for table in _ARCHIVABLE_TABLES:
+    step("""
+    CREATE INDEX {table}_ix_org_id_content_version
+        ON inventory.{table} (org_id, content_version);
+    """.format(table=table), """
+    DROP INDEX IF EXISTS inventory.{table}_ix_org_id_content_version;
+    """.format(table=table))
@@ -29,6 +29,9 @@ setup(
     py_modules=[splitext(basename(path))[0] for path in glob('src/*.py')],
     install_requires=[
         # Duplicated from requirements.txt file.
+        'aiohttp>=2,<4',
+        'asyncpg>=0.12,<1',
+        'brotli>=1,<2',
         'clock==0.0.5',
         'falcon>=1,<2',
         'falcon-cors>=1,<2',
@@ -43,6 +46,11 @@ setup(
         'startup-miragtions==0.0.2',
         'validate_email>=1,<2'
         ],
+    entry_points={
+        'console_scripts': [
+            'inventory-migrate = inventory.migrate:main'
+        ]
+    },
     test_suite='tests',
     tests_require=[
         # Duplicated from requirements.txt.
@@ -0,0 +1,295 @@
+"""Read access to the inventory data for asyncio, on top of asyncpg.
+
+AsyncModel serves a subset of the reads of inventory.model.Model, as coroutines returning the same
+documents and raising the same errors. It has the org and webshop reads, but always returns whole
+documents, as if no fields were selected. Searches, exports, webshop changes and webshop routes
+are only in Model. The SQL is that of the Model statements, compiled once at import. Writes stay
+with the synchronous Model.
+"""
+
+import re
+
+import asyncpg
+from sqlalchemy.dialects import postgresql
+
+import inventory.cache as cache
+import inventory.codec as codec
+import inventory.model as model
+
+
+_dialect = postgresql.dialect(paramstyle='numeric')
+# Numeric parameters are rendered as :1, :2, ... and asyncpg wants $1, $2, ... instead. Casts, like
+# ::json, are never followed by a digit.
+_NUMERIC_PARAMETER_RE = re.compile(r'(?<![:\w]):(\d+)')
+
+
+class _Statement(object):
+    """A Model statement as asyncpg SQL, with its parameters in positional order."""
+
+    def __init__(self, statement):
+        compiled = statement.compile(dialect=_dialect)
+        self.sql = _NUMERIC_PARAMETER_RE.sub(r'$\1', compiled.string)
+        self._names = list(compiled.positiontup)
+
+    def args(self, **params):
+        return [params[name] for name in self._names]
+
+
+_fetch_webshop_info = _Statement(model._fetch_webshop_info)
+_fetch_org_id = _Statement(model._fetch_org_id)
+_fetch_org = _Statement(model._fetch_org)
+_fetch_org_content_version = _Statement(model._fetch_org_content_version)
+_fetch_webshop_content_version = _Statement(model._fetch_webshop_content_version)
+_fetch_org_by_subdomain = _Statement(model._fetch_org_by_subdomain)
+_fetch_restaurant = _Statement(model._fetch_restaurant)
+_fetch_menu_sections = _Statement(model._fetch_menu_sections)
+_fetch_menu_sections_page = _Statement(model._fetch_menu_sections_page)
+_fetch_menu_section = _Statement(model._fetch_menu_section)
+_fetch_menu_items = _Statement(model._fetch_menu_items)
+_fetch_menu_items_page = _Statement(model._fetch_menu_items_page)
+_fetch_menu_items_with_section_id = _Statement(model._fetch_menu_items_with_section_id)
+_fetch_menu_items_for_section = _Statement(model._fetch_menu_items_for_section)
+_fetch_menu_item = _Statement(model._fetch_menu_item)
+_fetch_platforms_website = _Statement(model._fetch_platforms_website)
+_fetch_platforms_callcenter = _Statement(model._fetch_platforms_callcenter)
+_fetch_platforms_emailcenter = _Statement(model._fetch_platforms_emailcenter)
+
+
+async def _init_connection(conn):
+    # Decode JSON columns like psycopg2 does, so rows serialize the same way for both models.
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(
+            type_name, schema='pg_catalog', encoder=lambda v: codec.dumps(v).decode('utf-8'),
+            decoder=codec.loads)
+
+
+async def create_pool(dsn, min_size=10, max_size=10):
+    """A connection pool set up the way AsyncModel expects."""
+
+    return await asyncpg.create_pool(
+        dsn, min_size=min_size, max_size=max_size, init=_init_connection)
+
+
+async def _fetchrow(conn, statement, **params):
+    return await conn.fetchrow(statement.sql, *statement.args(**params))
+
+
+async def _fetch(conn, statement, **params):
+    return await conn.fetch(statement.sql, *statement.args(**params))
+
+
+class AsyncModel(object):
+    WEBSHOP_QUERY_SINGLE = model.Model.WEBSHOP_QUERY_SINGLE
+    WEBSHOP_QUERY_MULTI = model.Model.WEBSHOP_QUERY_MULTI
+
+    def __init__(self, pool, webshop_query=WEBSHOP_QUERY_SINGLE, org_id_cache=None):
+        if webshop_query not in (self.WEBSHOP_QUERY_SINGLE, self.WEBSHOP_QUERY_MULTI):
+            raise ValueError('Invalid webshop query mode "{}"'.format(webshop_query))
+
+        self._pool = pool
+        self._webshop_query = webshop_query
+        self._org_id_cache = org_id_cache if org_id_cache is not None else cache.LruCache(0)
+
+    async def get_org(self, user_id):
+        return model._org_serializer(
+            await self._fetch_org_row(user_id, _fetch_org, model.OrgDoesNotExistError))
+
+    async def get_restaurant(self, user_id):
+        return model._restaurant_serializer(
+            await self._fetch_org_row(user_id, _fetch_restaurant, model.OrgDoesNotExistError))
+
+    async def get_all_menu_sections(self, user_id):
+        return [model._menu_section_serializer(ms)
+                for ms in await self._fetch_org_rows(user_id, _fetch_menu_sections)]
+
+    async def get_menu_sections_page(self, user_id, limit, after_id=0):
+        return await self._get_page(
+            _fetch_menu_sections_page, model._menu_section_serializer, user_id, limit, after_id)
+
+    async def get_menu_section(self, user_id, section_id):
+        async with self._pool.acquire() as conn:
+            org_id = await self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise model.MenuSectionDoesNotExistError()
+
+            async with conn.transaction():
+                menu_section_row = await _fetchrow(
+                    conn, _fetch_menu_section, org_id=org_id, section_id=section_id)
+
+                if menu_section_row is None:
+                    raise model.MenuSectionDoesNotExistError()
+
+                menu_items_rows = await _fetch(
+                    conn, _fetch_menu_items_for_section, org_id=org_id, section_id=section_id)
+
+        menu_section = model._menu_section_serializer(menu_section_row)
+        menu_section['items'] = {
+            str(mi['id']): model._menu_item_serializer(mi) for mi in menu_items_rows}
+
+        return menu_section
+
+    async def get_all_menu_items(self, user_id):
+        return [model._menu_item_serializer(mi)
+                for mi in await self._fetch_org_rows(user_id, _fetch_menu_items)]
+
+    async def get_menu_items_page(self, user_id, limit, after_id=0):
+        return await self._get_page(
+            _fetch_menu_items_page, model._menu_item_serializer, user_id, limit, after_id)
+
+    async def get_menu_item(self, user_id, item_id):
+        return model._menu_item_serializer(await self._fetch_org_row(
+            user_id, _fetch_menu_item, model.MenuItemDoesNotExistError, item_id=item_id))
+
+    async def get_platforms_website(self, user_id):
+        return model._platforms_website_serializer(await self._fetch_org_row(
+            user_id, _fetch_platforms_website, model.OrgDoesNotExistError))
+
+    async def get_platforms_callcenter(self, user_id):
+        return model._platforms_callcenter_serializer(await self._fetch_org_row(
+            user_id, _fetch_platforms_callcenter, model.OrgDoesNotExistError))
+
+    async def get_platforms_emailcenter(self, user_id):
+        return model._platforms_emailcenter_serializer(await self._fetch_org_row(
+            user_id, _fetch_platforms_emailcenter, model.OrgDoesNotExistError))
+
+    async def get_org_content_version(self, user_id):
+        org_row = await self._fetch_org_row(
+            user_id, _fetch_org_content_version, model.OrgDoesNotExistError)
+        return org_row['id'], org_row['content_version']
+
+    async def get_webshop_content_version(self, subdomain):
+        async with self._pool.acquire() as conn:
+            org_row = await _fetchrow(conn, _fetch_webshop_content_version, subdomain=subdomain)
+
+        if org_row is None:
+            raise model.OrgDoesNotExistError()
+
+        return org_row['id'], org_row['content_version']
+
+    async def get_webshop_info(self, subdomain):
+        _, _, webshop_info = await self.get_webshop_info_with_version(subdomain)
+        return webshop_info
+
+    async def get_webshop_info_with_version(self, subdomain):
+        if self._webshop_query == self.WEBSHOP_QUERY_SINGLE:
+            return await self._get_webshop_info_single_query(subdomain)
+        else:
+            return await self._get_webshop_info_multi_query(subdomain)
+
+    async def _get_webshop_info_single_query(self, subdomain):
+        async with self._pool.acquire() as conn:
+            webshop_info_row = await _fetchrow(conn, _fetch_webshop_info, subdomain=subdomain)
+
+        if webshop_info_row is None or \
+           webshop_info_row['general'] is None or \
+           webshop_info_row['website'] is None or \
+           webshop_info_row['callcenter'] is None or \
+           webshop_info_row['emailcenter'] is None:
+            raise model.OrgDoesNotExistError()
+
+        webshop_info = {
+            'general': webshop_info_row['general'],
+            'menu': {'sections': webshop_info_row['sections'] or {}},
+            'platforms': {
+                'website': webshop_info_row['website'],
+                'callcenter': webshop_info_row['callcenter'],
+                'emailcenter': webshop_info_row['emailcenter']
+            }
+        }
+
+        return webshop_info_row['org_id'], webshop_info_row['content_version'], webshop_info
+
+    async def _get_webshop_info_multi_query(self, subdomain):
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                org_row = await _fetchrow(conn, _fetch_org_by_subdomain, subdomain=subdomain)
+
+                if org_row is None:
+                    raise model.OrgDoesNotExistError()
+
+                org_id = org_row['id']
+                restaurant_row = await _fetchrow(conn, _fetch_restaurant, org_id=org_id)
+                menu_section_rows = await _fetch(conn, _fetch_menu_sections, org_id=org_id)
+                menu_item_rows = await _fetch(
+                    conn, _fetch_menu_items_with_section_id, org_id=org_id)
+                platforms_website_row = await _fetchrow(
+                    conn, _fetch_platforms_website, org_id=org_id)
+                platforms_callcenter_row = await _fetchrow(
+                    conn, _fetch_platforms_callcenter, org_id=org_id)
+                platforms_emailcenter_row = await _fetchrow(
+                    conn, _fetch_platforms_emailcenter, org_id=org_id)
+
+        if restaurant_row is None or \
+           platforms_website_row is None or \
+           platforms_callcenter_row is None or \
+           platforms_emailcenter_row is None:
+            raise model.OrgDoesNotExistError()
+
+        menu_sections = {
+            str(ms['id']): model._menu_section_serializer(ms) for ms in menu_section_rows}
+
+        for ms in menu_sections.values():
+            ms['items'] = {}
+        for mi in menu_item_rows:
+            menu_sections[str(mi['section_id'])]['items'][str(mi['id'])] = \
+                model._menu_item_serializer(mi)
+
+        webshop_info = {
+            'general': model._restaurant_serializer(restaurant_row),
+            'menu': {'sections': menu_sections},
+            'platforms': {
+                'website': model._platforms_website_serializer(platforms_website_row),
+                'callcenter': model._platforms_callcenter_serializer(platforms_callcenter_row),
+                'emailcenter': model._platforms_emailcenter_serializer(platforms_emailcenter_row)
+            }
+        }
+
+        return org_row['id'], org_row['content_version'], webshop_info
+
+    async def _fetch_org_row(self, user_id, statement, not_found_error, **params):
+        async with self._pool.acquire() as conn:
+            org_id = await self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise not_found_error()
+
+            row = await _fetchrow(conn, statement, org_id=org_id, **params)
+
+        if row is None:
+            raise not_found_error()
+
+        return row
+
+    async def _fetch_org_rows(self, user_id, statement):
+        async with self._pool.acquire() as conn:
+            org_id = await self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                return []
+
+            return await _fetch(conn, statement, org_id=org_id)
+
+    async def _get_page(self, statement, serializer, user_id, limit, after_id):
+        async with self._pool.acquire() as conn:
+            org_id = await self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                return [], None
+
+            rows = await _fetch(conn, statement, org_id=org_id, after_id=after_id, limit=limit + 1)
+
+        if len(rows) > limit:
+            return [serializer(r) for r in rows[:limit]], rows[limit - 1]['id']
+
+        return [serializer(r) for r in rows], None
+
+    async def _resolve_org_id(self, conn, user_id):
+        org_id = self._org_id_cache.get(user_id)
+        if org_id is not None:
+            return org_id
+
+        org_user_row = await _fetchrow(conn, _fetch_org_id, user_id=user_id)
+
+        # Users without an org are not cached, since they can create one at any moment.
+        if org_user_row is None:
+            return None
+
+        self._org_id_cache.put(user_id, org_user_row['org_id'])
+        return org_user_row['org_id']
@@ -0,0 +1,192 @@
+"""Inventory service asyncio entry point, for serving webshops.
+
+It serves GET /webshop, and /metrics if enabled, from AsyncModel, so a single process keeps many
+storefront requests in flight at once. Everything else stays with the synchronous server. Run it
+with `python -m inventory.async_server`, or under gunicorn with
+`--worker-class aiohttp.GunicornWebWorker inventory.async_server:app`.
+"""
+
+import os
+
+from aiohttp import web
+
+import inventory.async_model as async_model
+import inventory.cache as cache
+import inventory.codec as codec
+import inventory.compiled_schemas as compiled_schemas
+import inventory.compression as compression
+import inventory.config as config
+import inventory.etags as etags
+import inventory.model as model
+import inventory.validation as validation
+
+
+host_to_subdomain_validator = validation.HostToSubdomainValidator()
+response_validator = validation.ResponseValidator(
+    mode=config.RESPONSE_VALIDATION,
+    sample_rate=config.RESPONSE_VALIDATION_SAMPLE_RATE)
+
+# Orgs are changed through the synchronous server, so this cache is never told about changes, and
+# the TTL alone bounds how stale it gets. Same as for the caches of the other workers.
+webshop_cache = cache.WebshopCache(
+    max_size=config.WEBSHOP_CACHE_SIZE,
+    ttl=config.WEBSHOP_CACHE_TTL)
+# Likewise the routes are only learned from requests, and known ones are dropped when they 404.
+webshop_routes = cache.WebshopRoutes(
+    master_domain=config.MASTER_DOMAIN,
+    negative_cache_size=config.WEBSHOP_NEGATIVE_CACHE_SIZE,
+    negative_ttl=config.WEBSHOP_NEGATIVE_CACHE_TTL)
+compressor = compression.Compressor(
+    min_size=config.COMPRESSION_MIN_SIZE,
+    gzip_level=config.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=config.COMPRESSION_BROTLI_QUALITY)
+
+
+def _error(status, title, description):
+    return web.Response(
+        status=status, content_type='application/json',
+        body=codec.dumps({'title': title, 'description': description}))
+
+
+def _not_modified(request, etag, encoding=None, compressible=False):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is None or not etags.etag_matches(if_none_match, etag):
+        return None
+
+    headers = {'ETag': compression.encoded_etag(etag, encoding) if encoding is not None else etag}
+    if compressible:
+        headers['Vary'] = 'Accept-Encoding'
+    return web.Response(status=304, headers=headers)
+
+
+def _with_cors(request, response):
+    origin = request.headers.get('Origin')
+    if origin is not None and origin in config.CLIENTS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+    return response
+
+
+async def webshop_info(request):
+    """Retrieve all information needed by a webshop."""
+
+    the_model = request.app['model']
+
+    subdomain = webshop_routes.get(request.host)
+
+    if subdomain is None:
+        if webshop_routes.is_missing(request.host):
+            return _error(404, 'Webshop does not exist', 'Webshop does not exist')
+
+        try:
+            subdomain = host_to_subdomain_validator.validate(request.host)
+        except validation.Error:
+            return _error(
+                400, 'Invalid host header', 'Invalid host header "{}"'.format(request.host))
+
+    webshop_info_response = webshop_cache.get(subdomain)
+
+    if webshop_info_response is None:
+        if 'If-None-Match' in request.headers:
+            try:
+                org_id, content_version = await the_model.get_webshop_content_version(subdomain)
+            except model.OrgDoesNotExistError:
+                webshop_routes.missing(request.host)
+                return _error(404, 'Webshop does not exist', 'Webshop does not exist')
+
+            webshop_routes.found(request.host, subdomain, org_id)
+
+            # As in the synchronous server, a client holding the compressed representation it
+            # would get now can be answered before the body is read.
+            encoding = compressor.preferred(request.headers.get('Accept-Encoding'))
+            etag = etags.content_etag(org_id, content_version)
+            if encoding is not None and etags.etag_listed(
+                    request.headers['If-None-Match'], compression.encoded_etag(etag, encoding)):
+                return _with_cors(
+                    request, _not_modified(request, etag, encoding, compressible=True))
+
+        generation = webshop_cache.generation()
+
+        try:
+            org_id, content_version, webshop_info = \
+                await the_model.get_webshop_info_with_version(subdomain)
+        except model.OrgDoesNotExistError:
+            webshop_routes.missing(request.host)
+            return _error(404, 'Webshop does not exist', 'Webshop does not exist')
+
+        webshop_routes.found(request.host, subdomain, org_id)
+
+        response = {'webshopInfo': webshop_info}
+
+        response_validator.validate(
+            'GET /webshop', response, compiled_schemas.WEBSHOP_INFO_RESPONSE)
+
+        webshop_info_response = cache.WebshopResponse(
+            org_id=org_id,
+            etag=etags.content_etag(org_id, content_version),
+            body=codec.dumps(response),
+            encoded_bodies={})
+        webshop_cache.put(subdomain, webshop_info_response, generation)
+
+    body = webshop_info_response.body
+    not_modified = _not_modified(
+        request, webshop_info_response.etag,
+        compressor.negotiate(request.headers.get('Accept-Encoding'), len(body)),
+        compressor.compressible(len(body)))
+    if not_modified is not None:
+        return _with_cors(request, not_modified)
+
+    headers = {'ETag': webshop_info_response.etag}
+
+    if compressor.compressible(len(body)):
+        headers['Vary'] = 'Accept-Encoding'
+        body, encoding = compressor.encode(
+            request.headers.get('Accept-Encoding'), body, webshop_info_response.encoded_bodies)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            headers['ETag'] = compression.encoded_etag(webshop_info_response.etag, encoding)
+
+    return _with_cors(request, web.Response(
+        status=200, content_type='application/json', headers=headers, body=body))
+
+
+async def metrics(request):
+    """Retrieve the metrics gathered by this process."""
+
+    response = {
+        'responseValidation': response_validator.stats(),
+        'webshopCache': webshop_cache.stats(),
+        'webshopRoutes': webshop_routes.stats(),
+        'compression': compressor.stats(),
+        'pid': os.getpid()
+    }
+
+    return web.Response(status=200, content_type='application/json', body=codec.dumps(response))
+
+
+async def _start_model(app):
+    app['pool'] = await async_model.create_pool(
+        config.DATABASE_URL,
+        min_size=config.DATABASE_POOL_SIZE,
+        max_size=config.DATABASE_POOL_SIZE + max(config.DATABASE_MAX_OVERFLOW, 0))
+    app['model'] = async_model.AsyncModel(
+        app['pool'],
+        webshop_query=config.WEBSHOP_QUERY,
+        org_id_cache=cache.LruCache(max_size=config.ORG_ID_CACHE_SIZE))
+
+
+async def _stop_model(app):
+    await app['pool'].close()
+
+
+app = web.Application()
+app.on_startup.append(_start_model)
+app.on_cleanup.append(_stop_model)
+
+app.router.add_get('/webshop', webshop_info)
+
+if config.EXPOSE_METRICS:
+    app.router.add_get('/metrics', metrics)
+
+
+if __name__ == '__main__':
+    web.run_app(app, host=config.ADDRESS, port=int(config.PORT))
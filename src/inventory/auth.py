@@ -0,0 +1,248 @@
+"""Caching in front of the identity service's AuthMiddleware, and local checks of tokens.
+
+Resolving a token to a user takes a call to the identity service. The users are cached here by
+token for a bounded time, so repeats of a token skip the call. Tokens which are HS256 JSON Web
+Tokens can also be verified locally, against the keys shared with the identity service. Forged or
+expired ones are turned away without a call, and no user is cached past the expiry of its token.
+Any other token is left to the identity service. A user is only ever cached for the exact token
+the identity service accepted, so local verification only ever turns more tokens away.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import falcon
+
+import inventory.cache as cache
+
+
+class Error(Exception):
+    """Error raised for tokens which fail local verification."""
+
+    def __init__(self, reason):
+        super(Error, self).__init__(reason)
+        self.reason = reason
+
+
+def _b64decode(segment):
+    # JSON Web Tokens drop the padding.
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _bearer_token(authorization):
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() == 'bearer' and token.strip() != '':
+        return token.strip()
+    return authorization.strip()
+
+
+class TokenVerifier(object):
+    """Verifies HS256 JSON Web Tokens against a set of keys, without calling out.
+
+    More than one key can be given, so keys can be rotated without turning tokens away.
+    """
+
+    ALGORITHM = 'HS256'
+
+    def __init__(self, keys, audience=None, leeway=0, the_time=time.time):
+        if len(keys) == 0:
+            raise ValueError('No keys to verify tokens with')
+
+        self._keys = [k.encode('utf-8') if isinstance(k, str) else k for k in keys]
+        self._audience = audience
+        self._leeway = leeway
+        self._the_time = the_time
+        self._lock = threading.Lock()
+        self._stats = {'verified': 0, 'rejected': 0, 'notVerifiable': 0}
+
+    def verify(self, token):
+        """The claims of a token, or None if it cannot be verified locally.
+
+        Raises Error for tokens which can be verified locally, but are invalid.
+        """
+
+        try:
+            claims = self._verify(token)
+        except Error:
+            self._count('rejected')
+            raise
+
+        self._count('verified' if claims is not None else 'notVerifiable')
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _verify(self, token):
+        segments = token.split('.')
+        if len(segments) != 3:
+            return None
+
+        try:
+            header = json.loads(_b64decode(segments[0]).decode('utf-8'))
+        except (binascii.Error, ValueError):
+            return None
+
+        if not isinstance(header, dict) or header.get('alg') != self.ALGORITHM:
+            return None
+
+        try:
+            signature = _b64decode(segments[2])
+            signing_input = '{}.{}'.format(segments[0], segments[1]).encode('ascii')
+        except (binascii.Error, ValueError) as e:
+            raise Error('Malformed token') from e
+
+        if not any(hmac.compare_digest(self._sign(k, signing_input), signature)
+                   for k in self._keys):
+            raise Error('Invalid signature')
+
+        try:
+            claims = json.loads(_b64decode(segments[1]).decode('utf-8'))
+        except (binascii.Error, ValueError) as e:
+            raise Error('Malformed claims') from e
+
+        if not isinstance(claims, dict):
+            raise Error('Malformed claims')
+
+        right_now = self._the_time()
+
+        for claim in ('exp', 'nbf'):
+            if claim in claims and (not isinstance(claims[claim], (int, float)) or
+                                    isinstance(claims[claim], bool)):
+                raise Error('Malformed "{}" claim'.format(claim))
+
+        if 'exp' in claims and claims['exp'] + self._leeway <= right_now:
+            raise Error('Expired token')
+
+        if 'nbf' in claims and claims['nbf'] - self._leeway > right_now:
+            raise Error('Token not yet valid')
+
+        if self._audience is not None:
+            audiences = claims.get('aud')
+            if not isinstance(audiences, list):
+                audiences = [audiences]
+            if self._audience not in audiences:
+                raise Error('Invalid audience')
+
+        return claims
+
+    @staticmethod
+    def _sign(key, signing_input):
+        return hmac.new(key, signing_input, hashlib.sha256).digest()
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+
+class TokenCache(object):
+    """The users behind recently accepted tokens.
+
+    Entries expire a fixed time to live after they were put in the cache, or when their token
+    does, whichever comes first. Tokens are kept as digests, so the cache holds no credentials.
+    """
+
+    def __init__(self, max_size, ttl, the_time=time.time):
+        self._the_time = the_time
+        self._entries = cache.LruCache(max_size, ttl, the_time)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._revoked = 0
+
+    def get(self, token):
+        """The user for a token, or None."""
+
+        key = self._key(token)
+        entry = self._entries.get(key)
+
+        if entry is not None and entry[1] is not None and entry[1] <= self._the_time():
+            self._entries.pop(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+
+        return entry[0]
+
+    def put(self, token, user, expires_at=None):
+        self._entries.put(self._key(token), (user, expires_at))
+
+    def revoke(self, token):
+        """Forget a token, so its next use goes to the identity service again."""
+
+        if self._entries.pop(self._key(token)) is not None:
+            with self._lock:
+                self._revoked += 1
+
+    def revoke_user(self, user_id):
+        """Forget all the tokens of a user."""
+
+        self._entries.pop_where(lambda entry: entry[0].get('id') == user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'revoked': self._revoked
+            }
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class CachingAuthMiddleware(object):
+    """Wraps an auth middleware, such as identity.AuthMiddleware, with a cache of its users.
+
+    The wrapped middleware must put the user in req.context['user'], and leave resources marked
+    AUTH_NOT_REQUIRED alone, as identity.AuthMiddleware does. Only tokens it accepted are cached.
+    """
+
+    def __init__(self, auth_middleware, token_cache, token_verifier=None):
+        self._auth_middleware = auth_middleware
+        self._token_cache = token_cache
+        self._token_verifier = token_verifier
+
+    def process_resource(self, req, resp, resource, params=None):
+        authorization = req.get_header('Authorization')
+
+        if getattr(resource, 'AUTH_NOT_REQUIRED', False) or authorization is None:
+            self._auth_middleware.process_resource(req, resp, resource, params)
+            return
+
+        expires_at = None
+
+        if self._token_verifier is not None:
+            try:
+                claims = self._token_verifier.verify(_bearer_token(authorization))
+            except Error as e:
+                self._token_cache.revoke(authorization)
+                raise falcon.HTTPUnauthorized(
+                    title='Invalid token',
+                    description='Invalid token: {}'.format(e.reason)) from e
+
+            if claims is not None:
+                expires_at = claims.get('exp')
+
+        user = self._token_cache.get(authorization)
+        if user is not None:
+            req.context['user'] = user
+            return
+
+        self._auth_middleware.process_resource(req, resp, resource, params)
+
+        user = req.context.get('user')
+        if user is not None:
+            self._token_cache.put(authorization, user, expires_at)
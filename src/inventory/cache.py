@@ -0,0 +1,240 @@
+"""In-process caches for the inventory service."""
+
+import collections
+import logging
+import threading
+import time
+
+
+_log = logging.getLogger(__name__)
+
+
+class LruCache(object):
+    """A bounded mapping which evicts the least recently used entries first.
+
+    Entries can optionally expire a fixed time to live after they were put in the cache. A cache
+    with a maximum size of zero holds nothing.
+    """
+
+    def __init__(self, max_size, ttl=None, the_time=time.monotonic):
+        if max_size < 0:
+            raise ValueError('Invalid cache size {}'.format(max_size))
+
+        self._max_size = max_size
+        self._ttl = ttl
+        self._the_time = the_time
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._entries[key]
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at <= self._the_time():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self._max_size == 0:
+            return
+
+        expires_at = None if self._ttl is None else self._the_time() + self._ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value, _ = self._entries.pop(key, (default, None))
+            return value
+
+    def pop_where(self, predicate):
+        """Remove all the entries whose value satisfies the predicate."""
+
+        with self._lock:
+            keys = [k for k, (v, _) in self._entries.items() if predicate(v)]
+            for key in keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# The compressed variants of the body are added to encoded_bodies as clients ask for them, so they
+# are cached along with it.
+WebshopResponse = collections.namedtuple(
+    'WebshopResponse', ['org_id', 'etag', 'body', 'encoded_bodies'])
+
+
+class WebshopCache(object):
+    """Cache of serialized webshop responses and their ETags, by subdomain.
+
+    Entries are invalidated when the model reports that their org changed. Invalidation is only
+    seen by the worker which performed the write, so the time to live bounds how stale the other
+    workers can be.
+    """
+
+    def __init__(self, max_size, ttl, the_time=time.monotonic):
+        self._entries = LruCache(max_size, ttl, the_time)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, subdomain):
+        entry = self._entries.get(subdomain)
+
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            else:
+                self._hits += 1
+                return entry
+
+    def generation(self):
+        """A token to grab before loading a response, and to hand back to put."""
+
+        with self._lock:
+            return self._generation
+
+    def put(self, subdomain, webshop_response, generation):
+        """Store a response, unless some org changed since the generation was grabbed.
+
+        This keeps a response loaded before a write, but stored after it, out of the cache.
+        """
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._entries.put(subdomain, webshop_response)
+
+    def on_org_changed(self, org_id):
+        with self._lock:
+            self._generation += 1
+
+        self._entries.pop_where(lambda entry: entry.org_id == org_id)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self._hits, 'misses': self._misses}
+
+
+class WebshopRoutes(object):
+    """The webshop subdomain and org behind each host, as far as this worker knows.
+
+    Known hosts skip validation altogether. Hosts found to have no webshop are kept in a bounded
+    negative cache for a while, so repeats of them are turned away without a database round trip.
+    The table is loaded whole on the first lookup, so in the worker rather than in a master process
+    which forks it, and follows the subdomain changes made through this worker. Changes made
+    through other workers are picked up as requests come in: unknown hosts are checked against the
+    database, and known ones which turn out to be gone are dropped. So a webshop created elsewhere
+    can be turned away for up to the negative time to live, by workers which saw a request for its
+    host just before it existed.
+    """
+
+    def __init__(self, master_domain, negative_cache_size, negative_ttl, load_routes=None,
+                 the_time=time.monotonic):
+        self._master_domain = master_domain
+        self._load_routes = load_routes
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._hosts_by_org_id = {}
+        self._missing = LruCache(negative_cache_size, negative_ttl, the_time)
+        self._known = 0
+        self._turned_away = 0
+
+    def load(self, routes):
+        """Add the routes for an iterable of (subdomain, org_id) pairs."""
+
+        for subdomain, org_id in routes:
+            self.on_subdomain_changed(org_id, subdomain)
+
+    def get(self, host):
+        """The subdomain for a known host, or None."""
+
+        if self._load_routes is not None:
+            self._load()
+
+        with self._lock:
+            route = self._routes.get(host)
+            if route is not None:
+                self._known += 1
+                return route[0]
+
+        return None
+
+    def is_missing(self, host):
+        """Whether the host was recently found to have no webshop."""
+
+        if self._missing.get(host, False):
+            with self._lock:
+                self._turned_away += 1
+            return True
+
+        return False
+
+    def found(self, host, subdomain, org_id):
+        with self._lock:
+            self._add(host, subdomain, org_id)
+
+    def missing(self, host):
+        with self._lock:
+            route = self._routes.pop(host, None)
+            if route is not None and self._hosts_by_org_id.get(route[1]) == host:
+                del self._hosts_by_org_id[route[1]]
+
+        self._missing.put(host, True)
+
+    def on_subdomain_changed(self, org_id, subdomain):
+        host = '{}.{}'.format(subdomain, self._master_domain)
+
+        with self._lock:
+            self._add(host, subdomain, org_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._routes),
+                'missingSize': len(self._missing),
+                'known': self._known,
+                'turnedAway': self._turned_away
+            }
+
+    def _load(self):
+        with self._load_lock:
+            load_routes, self._load_routes = self._load_routes, None
+            if load_routes is None:
+                return
+
+            # Loading is only tried once. Otherwise the table fills up from requests.
+            try:
+                self.load(load_routes())
+            except Exception:
+                _log.exception('Could not load the webshop routes')
+
+    def _add(self, host, subdomain, org_id):
+        previous_host = self._hosts_by_org_id.get(org_id)
+        if previous_host is not None and previous_host != host:
+            self._routes.pop(previous_host, None)
+
+        self._routes[host] = (subdomain, org_id)
+        self._hosts_by_org_id[org_id] = host
+        self._missing.pop(host)
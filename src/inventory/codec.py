@@ -0,0 +1,53 @@
+"""JSON encoding and decoding, with the fastest implementation which is installed.
+
+Both directions work on UTF-8 encoded bytes, which is what requests are read as and responses are
+written as. Decoding also accepts str. Malformed input raises a ValueError whatever the
+implementation.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_loads(data):
+    # json.loads only accepts bytes from Python 3.6 onwards.
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+
+def _ujson_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return ujson.loads(data)
+
+
+def _ujson_dumps(obj):
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+if orjson is not None:
+    IMPLEMENTATION = 'orjson'
+    loads = orjson.loads
+    dumps = orjson.dumps
+elif ujson is not None:
+    IMPLEMENTATION = 'ujson'
+    loads = _ujson_loads
+    dumps = _ujson_dumps
+else:
+    IMPLEMENTATION = 'json'
+    loads = _stdlib_loads
+    dumps = _stdlib_dumps
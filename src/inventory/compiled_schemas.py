@@ -0,0 +1,293 @@
+"""Compiled validators for the inventory APIs objects.
+
+Every schema in inventory.schemas is checked and compiled exactly once, at import time, into a
+tree of specialized checking functions. These answer "is this instance valid?" without going
+through the generic jsonschema machinery. Only when an instance fails the fast check do we hand
+it to a prebuilt jsonschema validator, so the errors raised are exactly the ones
+jsonschema.validate would have raised.
+"""
+
+import numbers
+import re
+
+import jsonschema
+
+import inventory.schemas as schemas
+
+
+class _UnsupportedSchemaError(Exception):
+    pass
+
+
+_ANNOTATION_KEYWORDS = frozenset(['$schema', 'title', 'description'])
+
+
+def _is_integer(instance):
+    return isinstance(instance, int) and not isinstance(instance, bool)
+
+
+def _is_number(instance):
+    return isinstance(instance, numbers.Number) and not isinstance(instance, bool)
+
+
+_TYPE_CHECKS = {
+    'array': lambda instance: isinstance(instance, list),
+    'boolean': lambda instance: isinstance(instance, bool),
+    'integer': _is_integer,
+    'null': lambda instance: instance is None,
+    'number': _is_number,
+    'object': lambda instance: isinstance(instance, dict),
+    'string': lambda instance: isinstance(instance, str),
+}
+
+
+def _compile_type(types):
+    if isinstance(types, str):
+        types = [types]
+
+    try:
+        type_checks = [_TYPE_CHECKS[t] for t in types]
+    except KeyError as e:
+        raise _UnsupportedSchemaError('Unknown type {}'.format(e)) from e
+
+    if len(type_checks) == 1:
+        return type_checks[0]
+
+    def check_type(instance):
+        return any(type_check(instance) for type_check in type_checks)
+
+    return check_type
+
+
+def _compile_object(schema):
+    properties = [(name, _compile(subschema))
+                  for name, subschema in schema.get('properties', {}).items()]
+    pattern_properties = [(re.compile(pattern), _compile(subschema))
+                          for pattern, subschema in schema.get('patternProperties', {}).items()]
+    required = tuple(schema.get('required', ()))
+    known_properties = frozenset(schema.get('properties', {}))
+    additional_properties = schema.get('additionalProperties', True)
+
+    if additional_properties is True:
+        check_additional = None
+    elif additional_properties is False:
+        def check_additional(value):
+            return False
+    elif isinstance(additional_properties, dict):
+        check_additional = _compile(additional_properties)
+    else:
+        raise _UnsupportedSchemaError('Invalid additionalProperties')
+
+    def check_object(instance):
+        if not isinstance(instance, dict):
+            return True
+
+        for name in required:
+            if name not in instance:
+                return False
+
+        for name, check_property in properties:
+            if name in instance and not check_property(instance[name]):
+                return False
+
+        for key, value in instance.items():
+            matched = False
+            for pattern, check_pattern in pattern_properties:
+                if pattern.search(key):
+                    matched = True
+                    if not check_pattern(value):
+                        return False
+            if check_additional is not None and not matched and key not in known_properties:
+                if not check_additional(value):
+                    return False
+
+        return True
+
+    return check_object
+
+
+def _compile_array(schema):
+    items = schema.get('items', {})
+
+    if not isinstance(items, dict):
+        raise _UnsupportedSchemaError('Only uniform "items" are supported')
+
+    # With a single schema for "items", "additionalItems" does not apply.
+    check_item = _compile(items)
+    min_items = schema.get('minItems', 0)
+    max_items = schema.get('maxItems')
+
+    def check_array(instance):
+        if not isinstance(instance, list):
+            return True
+
+        if len(instance) < min_items:
+            return False
+
+        if max_items is not None and len(instance) > max_items:
+            return False
+
+        for item in instance:
+            if not check_item(item):
+                return False
+
+        return True
+
+    return check_array
+
+
+def _compile_bounds(schema):
+    minimum = schema.get('minimum')
+    maximum = schema.get('maximum')
+
+    if schema.get('exclusiveMinimum') or schema.get('exclusiveMaximum'):
+        raise _UnsupportedSchemaError('Exclusive bounds are not supported')
+
+    def check_bounds(instance):
+        if not _is_number(instance):
+            return True
+
+        if minimum is not None and instance < minimum:
+            return False
+
+        if maximum is not None and instance > maximum:
+            return False
+
+        return True
+
+    return check_bounds
+
+
+def _compile_any_of(subschemas):
+    checks = [_compile(subschema) for subschema in subschemas]
+
+    def check_any_of(instance):
+        for check in checks:
+            if check(instance):
+                return True
+        return False
+
+    return check_any_of
+
+
+_OBJECT_KEYWORDS = frozenset(['properties', 'patternProperties', 'required',
+                              'additionalProperties'])
+_ARRAY_KEYWORDS = frozenset(['items', 'additionalItems', 'minItems', 'maxItems'])
+_BOUNDS_KEYWORDS = frozenset(['minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum'])
+_SUPPORTED_KEYWORDS = _ANNOTATION_KEYWORDS | _OBJECT_KEYWORDS | _ARRAY_KEYWORDS | \
+    _BOUNDS_KEYWORDS | frozenset(['type', 'anyOf'])
+
+
+def _compile(schema):
+    unsupported = set(schema) - _SUPPORTED_KEYWORDS
+    if unsupported:
+        raise _UnsupportedSchemaError('Unsupported keywords {}'.format(sorted(unsupported)))
+
+    checks = []
+
+    if 'type' in schema:
+        checks.append(_compile_type(schema['type']))
+    if _OBJECT_KEYWORDS & set(schema):
+        checks.append(_compile_object(schema))
+    if _ARRAY_KEYWORDS & set(schema):
+        checks.append(_compile_array(schema))
+    if _BOUNDS_KEYWORDS & set(schema):
+        checks.append(_compile_bounds(schema))
+    if 'anyOf' in schema:
+        checks.append(_compile_any_of(schema['anyOf']))
+
+    if len(checks) == 0:
+        return lambda instance: True
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(instance):
+        for check in checks:
+            if not check(instance):
+                return False
+        return True
+
+    return check_all
+
+
+class CompiledSchema(object):
+    """A schema which has been checked and compiled once, ready to validate many instances."""
+
+    def __init__(self, schema):
+        jsonschema.Draft4Validator.check_schema(schema)
+        self._validator = jsonschema.Draft4Validator(schema)
+
+        try:
+            self._check = _compile(schema)
+        except _UnsupportedSchemaError:
+            self._check = self._validator.is_valid
+
+    def is_valid(self, instance):
+        return self._check(instance)
+
+    def validate(self, instance):
+        """Validate an instance, raising jsonschema.ValidationError when it does not conform."""
+
+        if not self._check(instance):
+            self._validator.validate(instance)
+
+
+TIME_IN_DAY = CompiledSchema(schemas.TIME_IN_DAY)
+INTERVAL_IN_DAY = CompiledSchema(schemas.INTERVAL_IN_DAY)
+IMAGE = CompiledSchema(schemas.IMAGE)
+IMAGE_SET = CompiledSchema(schemas.IMAGE_SET)
+KEYWORDS = CompiledSchema(schemas.KEYWORDS)
+INGREDIENTS = CompiledSchema(schemas.INGREDIENTS)
+RESTAURANT_OPENING_HOURS = CompiledSchema(schemas.RESTAURANT_OPENING_HOURS)
+RESTAURANT = CompiledSchema(schemas.RESTAURANT)
+MENU_ITEM = CompiledSchema(schemas.MENU_ITEM)
+MENU_SECTION = CompiledSchema(schemas.MENU_SECTION)
+PLATFORMS_WEBSITE = CompiledSchema(schemas.PLATFORMS_WEBSITE)
+PLATFORMS_CALLCENTER = CompiledSchema(schemas.PLATFORMS_CALLCENTER)
+PLATFORMS_EMAILCENTER = CompiledSchema(schemas.PLATFORMS_EMAILCENTER)
+ORG = CompiledSchema(schemas.ORG)
+WEBSHOP_INFO = CompiledSchema(schemas.WEBSHOP_INFO)
+ORG_CREATION_REQUEST = CompiledSchema(schemas.ORG_CREATION_REQUEST)
+ORG_RESPONSE = CompiledSchema(schemas.ORG_RESPONSE)
+RESTAURANT_UPDATE_REQUEST = CompiledSchema(schemas.RESTAURANT_UPDATE_REQUEST)
+RESTAURANT_RESPONSE = CompiledSchema(schemas.RESTAURANT_RESPONSE)
+MENU_SECTIONS_CREATION_REQUEST = CompiledSchema(schemas.MENU_SECTIONS_CREATION_REQUEST)
+MENU_SECTIONS_RESPONSE = CompiledSchema(schemas.MENU_SECTIONS_RESPONSE)
+MENU_SECTIONS_PAGE_RESPONSE = CompiledSchema(schemas.MENU_SECTIONS_PAGE_RESPONSE)
+MENU_SECTION_UPDATE_REQUEST = CompiledSchema(schemas.MENU_SECTION_UPDATE_REQUEST)
+MENU_SECTION_RESPONSE = CompiledSchema(schemas.MENU_SECTION_RESPONSE)
+MENU_ITEMS_CREATION_REQUEST = CompiledSchema(schemas.MENU_ITEMS_CREATION_REQUEST)
+MENU_ITEMS_BULK_CREATION_REQUEST = CompiledSchema(schemas.MENU_ITEMS_BULK_CREATION_REQUEST)
+MENU_IMPORT_ITEM = CompiledSchema(schemas.MENU_IMPORT_ITEM)
+MENU_IMPORT_SECTION = CompiledSchema(schemas.MENU_IMPORT_SECTION)
+MENU_IMPORT_REQUEST = CompiledSchema(schemas.MENU_IMPORT_REQUEST)
+MENU_ITEMS_RESPONSE = CompiledSchema(schemas.MENU_ITEMS_RESPONSE)
+MENU_ITEMS_PAGE_RESPONSE = CompiledSchema(schemas.MENU_ITEMS_PAGE_RESPONSE)
+MENU_ITEMS_SEARCH_RESPONSE = CompiledSchema(schemas.MENU_ITEMS_SEARCH_RESPONSE)
+MENU_ITEM_UPDATE_REQUEST = CompiledSchema(schemas.MENU_ITEM_UPDATE_REQUEST)
+MENU_ITEM_RESPONSE = CompiledSchema(schemas.MENU_ITEM_RESPONSE)
+PLATFORMS_WEBSITE_UPDATE_REQUEST = CompiledSchema(schemas.PLATFORMS_WEBSITE_UPDATE_REQUEST)
+PLATFORMS_WEBSITE_RESPONSE = CompiledSchema(schemas.PLATFORMS_WEBSITE_RESPONSE)
+PLATFORMS_CALLCENTER_UPDATE_REQUEST = CompiledSchema(schemas.PLATFORMS_CALLCENTER_UPDATE_REQUEST)
+PLATFORMS_CALLCENTER_RESPONSE = CompiledSchema(schemas.PLATFORMS_CALLCENTER_RESPONSE)
+PLATFORMS_EMAILCENTER_UPDATE_REQUEST = CompiledSchema(schemas.PLATFORMS_EMAILCENTER_UPDATE_REQUEST)
+PLATFORMS_EMAILCENTER_RESPONSE = CompiledSchema(schemas.PLATFORMS_EMAILCENTER_RESPONSE)
+WEBSHOP_INFO_RESPONSE = CompiledSchema(schemas.WEBSHOP_INFO_RESPONSE)
+RESTAURANT_PROJECTION_RESPONSE = CompiledSchema(schemas.RESTAURANT_PROJECTION_RESPONSE)
+MENU_SECTIONS_PROJECTION_RESPONSE = CompiledSchema(schemas.MENU_SECTIONS_PROJECTION_RESPONSE)
+MENU_SECTIONS_PAGE_PROJECTION_RESPONSE = CompiledSchema(
+    schemas.MENU_SECTIONS_PAGE_PROJECTION_RESPONSE)
+MENU_ITEMS_PROJECTION_RESPONSE = CompiledSchema(schemas.MENU_ITEMS_PROJECTION_RESPONSE)
+MENU_ITEMS_PAGE_PROJECTION_RESPONSE = CompiledSchema(schemas.MENU_ITEMS_PAGE_PROJECTION_RESPONSE)
+MENU_ITEMS_SEARCH_PROJECTION_RESPONSE = CompiledSchema(
+    schemas.MENU_ITEMS_SEARCH_PROJECTION_RESPONSE)
+MENU_ITEM_PROJECTION_RESPONSE = CompiledSchema(schemas.MENU_ITEM_PROJECTION_RESPONSE)
+RESTAURANT_CHANGE = CompiledSchema(schemas.RESTAURANT_CHANGE)
+MENU_SECTION_CHANGE = CompiledSchema(schemas.MENU_SECTION_CHANGE)
+MENU_ITEM_CHANGE = CompiledSchema(schemas.MENU_ITEM_CHANGE)
+PLATFORMS_WEBSITE_CHANGE = CompiledSchema(schemas.PLATFORMS_WEBSITE_CHANGE)
+PLATFORMS_CALLCENTER_CHANGE = CompiledSchema(schemas.PLATFORMS_CALLCENTER_CHANGE)
+PLATFORMS_EMAILCENTER_CHANGE = CompiledSchema(schemas.PLATFORMS_EMAILCENTER_CHANGE)
+WEBSHOP_CHANGES = CompiledSchema(schemas.WEBSHOP_CHANGES)
+WEBSHOP_CHANGES_RESPONSE = CompiledSchema(schemas.WEBSHOP_CHANGES_RESPONSE)
@@ -0,0 +1,197 @@
+"""Response compression, with gzip and brotli.
+
+Clients list the encodings they accept in Accept-Encoding, and the one they prefer among those the
+server has wins, with brotli before gzip on ties. Bodies below a minimum size gain little and are
+sent as they are. A compressed representation gets its own ETag, the plain one with the encoding
+appended, since strong ETags must differ between representations.
+"""
+
+import gzip
+import threading
+
+# Brotli is a dependency, but responses can still be sent with gzip alone when it is missing.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# The encodings which can be produced, most preferred first.
+if brotli is not None:
+    ENCODINGS = (BROTLI, GZIP)
+else:
+    ENCODINGS = (GZIP,)
+
+
+def encoded_etag(etag, encoding):
+    """The ETag of the representation of a body with the given ETag in the given encoding."""
+
+    # The quotes are part of the ETag, so the encoding goes inside them.
+    return '{}-{}"'.format(etag[:-1], encoding)
+
+
+def decoded_etag(etag):
+    """The ETag of the plain representation, for an ETag produced by encoded_etag or a plain one."""
+
+    for encoding in (BROTLI, GZIP):
+        suffix = '-{}"'.format(encoding)
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+
+    return etag
+
+
+def _parse_accept_encoding(accept_encoding):
+    """The quality of each coding listed in an Accept-Encoding header, by coding."""
+
+    qualities = {}
+
+    for part in accept_encoding.split(','):
+        coding, _, parameters = part.partition(';')
+        coding = coding.strip().lower()
+        if coding == '':
+            continue
+
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith('q='):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+
+        qualities[coding] = quality
+
+    return qualities
+
+
+class Compressor(object):
+    """Picks the encoding for a response body, and compresses it in that encoding."""
+
+    def __init__(self, min_size, gzip_level=6, brotli_quality=5, encodings=ENCODINGS):
+        if not set(encodings) <= set(ENCODINGS):
+            raise ValueError('Unsupported encodings {}'.format(
+                ', '.join(sorted(set(encodings) - set(ENCODINGS)))))
+
+        self._min_size = min_size
+        self._gzip_level = gzip_level
+        self._brotli_quality = brotli_quality
+        self._encodings = tuple(encodings)
+        self._lock = threading.Lock()
+        self._stats = {e: {'compressed': 0, 'reused': 0, 'bytesIn': 0, 'bytesOut': 0}
+                       for e in self._encodings}
+
+    def compressible(self, size):
+        """Whether a body of size bytes is worth compressing, for clients which accept it."""
+
+        return size >= self._min_size
+
+    def negotiate(self, accept_encoding, size):
+        """The encoding to send a body of size bytes in, or None to send it as it is."""
+
+        if not self.compressible(size):
+            return None
+
+        return self.preferred(accept_encoding)
+
+    def preferred(self, accept_encoding):
+        """The encoding to send a body worth compressing in, or None to send it as it is."""
+
+        if accept_encoding is None:
+            return None
+
+        qualities = _parse_accept_encoding(accept_encoding)
+        best_encoding, best_quality = None, 0.0
+
+        for encoding in self._encodings:
+            quality = qualities.get(encoding, qualities.get('*', 0.0))
+            if quality > best_quality:
+                best_encoding, best_quality = encoding, quality
+
+        return best_encoding
+
+    def encode(self, accept_encoding, body, encoded_bodies=None):
+        """Return the body to send to a client with the given Accept-Encoding, and its encoding.
+
+        The encoding is None when the body is to be sent as it is. When encoded_bodies is given it
+        holds the body already compressed, by encoding, and is filled in as new encodings are
+        asked for. Two threads might both compress the same body, but either result is fine.
+        """
+
+        encoding = self.negotiate(accept_encoding, len(body))
+        if encoding is None:
+            return body, None
+
+        encoded_body = encoded_bodies.get(encoding) if encoded_bodies is not None else None
+
+        if encoded_body is not None:
+            with self._lock:
+                self._stats[encoding]['reused'] += 1
+            return encoded_body, encoding
+
+        encoded_body = self.compress(encoding, body)
+        if encoded_bodies is not None:
+            encoded_bodies[encoding] = encoded_body
+
+        return encoded_body, encoding
+
+    def compress(self, encoding, data):
+        if encoding == GZIP:
+            compressed = gzip.compress(data, self._gzip_level)
+        elif encoding == BROTLI:
+            compressed = brotli.compress(data, quality=self._brotli_quality)
+        else:
+            raise ValueError('Unsupported encoding {}'.format(encoding))
+
+        with self._lock:
+            stats = self._stats[encoding]
+            stats['compressed'] += 1
+            stats['bytesIn'] += len(data)
+            stats['bytesOut'] += len(compressed)
+
+        return compressed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'minSize': self._min_size,
+                'encodings': {e: dict(s) for e, s in self._stats.items()}
+            }
+
+
+def encode_response(compressor, req, resp, encoded_bodies=None):
+    """Compress the data of a Falcon response, if the client accepts it and it is worth it.
+
+    Responses which are streamed, or which were already through this, are left alone.
+    """
+
+    if resp.data is None or resp.get_header('Content-Encoding') is not None or \
+       'Accept-Encoding' in (resp.get_header('Vary') or ''):
+        return
+
+    if not compressor.compressible(len(resp.data)):
+        return
+
+    # Caches must tell apart clients which get different encodings.
+    resp.append_header('Vary', 'Accept-Encoding')
+
+    resp.data, encoding = compressor.encode(
+        req.get_header('Accept-Encoding'), resp.data, encoded_bodies)
+
+    if encoding is not None:
+        resp.set_header('Content-Encoding', encoding)
+        if resp.etag is not None:
+            resp.etag = encoded_etag(resp.etag, encoding)
+
+
+class CompressionMiddleware(object):
+    """Compresses the responses of the resources which did not already do so themselves."""
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        encode_response(self._compressor, req, resp)
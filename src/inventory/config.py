@@ -1,6 +1,8 @@
 import json
 import multiprocessing
 import os
+import sys
+import time
 
 
 # Application config.
@@ -9,9 +11,37 @@ ADDRESS = os.getenv('ADDRESS')
 PORT = os.getenv('PORT')
 MASTER_DOMAIN = os.getenv('MASTER_DOMAIN')
 IDENTITY_SERVICE_DOMAIN = os.getenv('IDENTITY_SERVICE_DOMAIN')
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', '60'))
+AUTH_TOKEN_KEYS = [k for k in os.getenv('AUTH_TOKEN_KEYS', '').split(',') if k != '']
+AUTH_TOKEN_AUDIENCE = os.getenv('AUTH_TOKEN_AUDIENCE')
 MIGRATIONS_PATH = os.getenv('MIGRATIONS_PATH')
 DATABASE_URL = os.getenv('DATABASE_URL')
+DATABASE_REPLICA_URLS = [u for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u != '']
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', '10'))
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', '30'))
+DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', '-1'))
+DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', 'false') == 'true'
+DATABASE_ECHO = os.getenv('DATABASE_ECHO', 'false') == 'true'
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', '5'))
 CLIENTS = ['http://{}'.format(c) for c in os.getenv('CLIENTS').split(',')]
+RESPONSE_VALIDATION = os.getenv('RESPONSE_VALIDATION', 'always')
+RESPONSE_VALIDATION_SAMPLE_RATE = float(os.getenv('RESPONSE_VALIDATION_SAMPLE_RATE', '0.01'))
+WEBSHOP_QUERY = os.getenv('WEBSHOP_QUERY', 'single')
+WEBSHOP_CACHE_SIZE = int(os.getenv('WEBSHOP_CACHE_SIZE', '1000'))
+WEBSHOP_CACHE_TTL = float(os.getenv('WEBSHOP_CACHE_TTL', '60'))
+WEBSHOP_SNAPSHOTS_PATH = os.getenv('WEBSHOP_SNAPSHOTS_PATH')
+WEBSHOP_NEGATIVE_CACHE_SIZE = int(os.getenv('WEBSHOP_NEGATIVE_CACHE_SIZE', '10000'))
+WEBSHOP_NEGATIVE_CACHE_TTL = float(os.getenv('WEBSHOP_NEGATIVE_CACHE_TTL', '30'))
+ORG_ID_CACHE_SIZE = int(os.getenv('ORG_ID_CACHE_SIZE', '10000'))
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+SQL_COMPILED_CACHE = os.getenv('SQL_COMPILED_CACHE', 'true') == 'true'
+SQL_COMPILED_CACHE_SIZE = int(os.getenv('SQL_COMPILED_CACHE_SIZE', '500'))
+EXPOSE_METRICS = os.getenv('EXPOSE_METRICS', 'false') == 'true'
 
 if ENV == 'LOCAL':
     with open('/ocelot-saas/var/secrets.json') as f:
@@ -22,5 +52,27 @@ else:
 # WSGI config. Not exported, technically.
 bind = '{}:{}'.format(ADDRESS, PORT)
 workers = multiprocessing.cpu_count() * 2 + 1
+preload_app = os.getenv('PRELOAD_APP', 'false') == 'true'
 accesslog = '-'
 errorlog = '-'
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+    # Only matters when the app is preloaded in the master, and with it the engine. Otherwise the
+    # engine is only created once the worker imports the app, after this.
+    import inventory.database as database
+    database.after_fork()
+
+
+def post_worker_init(worker):
+    # The synchronous server times how long building its app took. The worker phase spans
+    # everything from the fork until the worker is ready to serve, imports included.
+    server_module = sys.modules.get('inventory.server')
+    if server_module is None:
+        return
+
+    startup_timer = server_module.startup_timer
+    startup_timer.record('worker', time.perf_counter() - worker.forked_at)
+    worker.log.info('Worker {} started: {}'.format(worker.pid, startup_timer.describe()))
@@ -0,0 +1,46 @@
+"""The SQL engine of a worker process, and the connection pool behind it."""
+
+import weakref
+
+import sqlalchemy
+
+import inventory.instrumentation as instrumentation
+
+
+# The engines created by this process, and the pools they had before it forked. See after_fork.
+_engines = weakref.WeakSet()
+_inherited_pools = []
+
+
+def create_engine(url, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=-1,
+                  pool_pre_ping=False, echo=False):
+    """An engine with a metered connection pool, which after_fork can replace in a child."""
+
+    options = {
+        'poolclass': instrumentation.MeteredQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'echo': echo
+    }
+
+    if pool_pre_ping:
+        # Only understood by SQLAlchemy 1.2 onwards, so it is not passed unless asked for.
+        options['pool_pre_ping'] = True
+
+    sql_engine = sqlalchemy.create_engine(url, **options)
+    _engines.add(sql_engine)
+    return sql_engine
+
+
+def after_fork():
+    """Give every engine an empty pool of its own, to be called in a freshly forked child.
+
+    Connections opened before the fork are shared with the parent. Closing them here would close
+    them for the parent as well, so the old pools are just kept around, never to be used again.
+    """
+
+    for sql_engine in list(_engines):
+        _inherited_pools.append(sql_engine.pool)
+        sql_engine.pool = sql_engine.pool.recreate()
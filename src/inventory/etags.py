@@ -0,0 +1,34 @@
+"""ETags for the org-owned resources and webshops, shared by the servers."""
+
+import inventory.compression as compression
+
+
+def content_etag(org_id, content_version):
+    """The ETag of everything an org owns, at a content version."""
+
+    return '"{}-{}"'.format(org_id, content_version)
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches an ETag, in any of its encodings."""
+
+    if if_none_match.strip() == '*':
+        return True
+
+    # Encodings are irrelevant, as the plain and compressed representations have the same content.
+    return any(compression.decoded_etag(c) == etag for c in _candidates(if_none_match))
+
+
+def etag_listed(if_none_match, etag):
+    """Whether an If-None-Match header lists exactly an ETag, encoding included."""
+
+    return any(c == etag for c in _candidates(if_none_match))
+
+
+def _candidates(if_none_match):
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        # If-None-Match uses the weak comparison, so the W/ prefix is irrelevant.
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        yield candidate
@@ -1,22 +1,26 @@
 """Handlers for HTTP resources for the inventory service."""
 
-import json
 import hashlib
+import os
 
 import falcon
-import jsonschema
 
+import inventory.cache as cache
+import inventory.codec as codec
+import inventory.compiled_schemas as compiled_schemas
+import inventory.compression as compression
+import inventory.etags as etags
 import inventory.model as model
 import inventory.validation as validation
-import inventory.schemas as schemas
 
 
 class OrgResource(object):
     """The collection of organizations."""
 
-    def __init__(self, org_creation_request_validator, model):
+    def __init__(self, org_creation_request_validator, model, response_validator):
         self._org_creation_request_validator = org_creation_request_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_post(self, req, resp):
         """Create the organization and restaurant for a user."""
@@ -24,13 +28,14 @@ class OrgResource(object):
         user = req.context['user']
 
         try:
-            org_creation_request_raw = req.stream.read().decode('utf-8')
+            org_creation_request_raw = req.stream.read()
             org_creation_request = \
                 self._org_creation_request_validator.validate(org_creation_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid org creation data',
-                description='Invalid data "{}"'.format(org_creation_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    org_creation_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             org = self._model.create_org(
@@ -44,16 +49,21 @@ class OrgResource(object):
 
         response = {'org': org}
 
-        jsonschema.validate(response, schemas.ORG_RESPONSE)
+        self._response_validator.validate(
+            'POST /org', response, compiled_schemas.ORG_RESPONSE)
 
         resp.status = falcon.HTTP_201
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
     def on_get(self, req, resp):
         """Retrieve a particular organization, with info for the restaurant as well."""
 
         user = req.context['user']
 
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
         try:
             org = self._model.get_org(user['id'])
         except model.OrgDoesNotExistError as e:
@@ -63,26 +73,36 @@ class OrgResource(object):
 
         response = {'org': org}
 
-        jsonschema.validate(response, schemas.ORG_RESPONSE)
+        self._response_validator.validate(
+            'GET /org', response, compiled_schemas.ORG_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
 
 class RestaurantResource(object):
     """The restaurant for an organization."""
 
-    def __init__(self, restaurant_update_request_validator, model):
+    def __init__(self, restaurant_update_request_validator, fields_validator, model,
+                 response_validator):
         self._restaurant_update_request_validator = restaurant_update_request_validator
+        self._fields_validator = fields_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_get(self, req, resp):
         """Get the restaurant for an organization."""
 
         user = req.context['user']
+        fields = _fields(self._fields_validator, req)
+
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
 
         try:
-            restaurant = self._model.get_restaurant(user['id'])
+            restaurant = self._model.get_restaurant(user['id'], fields)
         except model.OrgDoesNotExistError as e:
             raise falcon.HTTPNotFound(
                 title='Restaurant does not exist',
@@ -90,10 +110,14 @@ class RestaurantResource(object):
 
         response = {'restaurant': restaurant}
 
-        jsonschema.validate(response, schemas.RESTAURANT_RESPONSE)
+        self._response_validator.validate(
+            'GET /org/restaurant', response,
+            compiled_schemas.RESTAURANT_RESPONSE if fields is None
+            else compiled_schemas.RESTAURANT_PROJECTION_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
     def on_put(self, req, resp):
         """Update the restaurant for an organization."""
@@ -101,13 +125,14 @@ class RestaurantResource(object):
         user = req.context['user']
 
         try:
-            restaurant_update_request_raw = req.stream.read().decode('utf-8')
+            restaurant_update_request_raw = req.stream.read()
             restaurant_update_request = \
                 self._restaurant_update_request_validator.validate(restaurant_update_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid restaurant update data',
-                description='Invalid data "{}"'.format(restaurant_update_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    restaurant_update_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             restaurant = self._model.update_restaurant(user['id'], **restaurant_update_request)
@@ -118,18 +143,23 @@ class RestaurantResource(object):
 
         response = {'restaurant': restaurant}
 
-        jsonschema.validate(response, schemas.RESTAURANT_RESPONSE)
+        self._response_validator.validate(
+            'PUT /org/restaurant', response, compiled_schemas.RESTAURANT_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
 
 class MenuSectionsResource(object):
     """All the sections in the menu for an organization."""
 
-    def __init__(self, menu_sections_creation_request_validator, model):
+    def __init__(self, menu_sections_creation_request_validator, page_request_validator,
+                 fields_validator, model, response_validator):
         self._menu_sections_creation_request_validator = menu_sections_creation_request_validator
+        self._page_request_validator = page_request_validator
+        self._fields_validator = fields_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_post(self, req, resp):
         """Create a menu section."""
@@ -137,14 +167,15 @@ class MenuSectionsResource(object):
         user = req.context['user']
 
         try:
-            menu_sections_creation_request_raw = req.stream.read().decode('utf-8')
+            menu_sections_creation_request_raw = req.stream.read()
             menu_sections_creation_request = \
                 self._menu_sections_creation_request_validator.validate(
                     menu_sections_creation_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid menu section creation data',
-                description='Invalid data "{}"'.format(menu_sections_creation_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    menu_sections_creation_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             menu_section = self._model.create_menu_section(
@@ -157,37 +188,53 @@ class MenuSectionsResource(object):
 
         response = {'menuSections': [menu_section]}
 
-        jsonschema.validate(response, schemas.MENU_SECTIONS_RESPONSE)
+        self._response_validator.validate(
+            'POST /org/menu/sections', response, compiled_schemas.MENU_SECTIONS_RESPONSE)
 
         resp.status = falcon.HTTP_201
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
     def on_get(self, req, resp):
-        """Get a particular menu section."""
+        """Get all the menu sections, or a page of them."""
 
         user = req.context['user']
-
-        try:
-            menu_sections = self._model.get_all_menu_sections(user['id'])
-        except model.OrgDoesNotExistError as e:
-            raise falcon.HTTPNotFound(
-                title='Org does not exist',
-                description='Org does not exist')
-
-        response = {'menuSections': menu_sections}
-
-        jsonschema.validate(response, schemas.MENU_SECTIONS_RESPONSE)
+        page_request = _page_request(self._page_request_validator, req)
+        fields = _fields(self._fields_validator, req)
+
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
+        if page_request is None:
+            menu_sections = self._model.get_all_menu_sections(user['id'], fields)
+            response = {'menuSections': menu_sections}
+            response_schema = compiled_schemas.MENU_SECTIONS_RESPONSE if fields is None \
+                else compiled_schemas.MENU_SECTIONS_PROJECTION_RESPONSE
+        else:
+            limit, after_id = page_request
+            menu_sections, next_after_id = self._model.get_menu_sections_page(
+                user['id'], limit, after_id, fields)
+            response = {
+                'menuSections': menu_sections,
+                'next': _next_cursor(self._page_request_validator, next_after_id)
+            }
+            response_schema = compiled_schemas.MENU_SECTIONS_PAGE_RESPONSE if fields is None \
+                else compiled_schemas.MENU_SECTIONS_PAGE_PROJECTION_RESPONSE
+
+        self._response_validator.validate('GET /org/menu/sections', response, response_schema)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
 
 class MenuSectionResource(object):
     """A section in the menu for an organization."""
 
-    def __init__(self, menu_section_update_request_validator, model):
+    def __init__(self, menu_section_update_request_validator, model, response_validator):
         self._menu_section_update_request_validator = menu_section_update_request_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_get(self, req, resp, section_id):
         """Get a particular menu section."""
@@ -195,6 +242,10 @@ class MenuSectionResource(object):
         section_id = self._validate_section_id(section_id)
         user = req.context['user']
 
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
         try:
             menu_section = self._model.get_menu_section(user['id'], section_id)
         except model.MenuSectionDoesNotExistError as e:
@@ -204,10 +255,12 @@ class MenuSectionResource(object):
 
         response = {'menuSection': menu_section}
 
-        jsonschema.validate(response, schemas.MENU_SECTION_RESPONSE)
+        self._response_validator.validate(
+            'GET /org/menu/sections/{section_id}', response, compiled_schemas.MENU_SECTION_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
     def on_put(self, req, resp, section_id):
         """Update a particular menu section."""
@@ -216,14 +269,15 @@ class MenuSectionResource(object):
         user = req.context['user']
 
         try:
-            menu_section_update_request_raw = req.stream.read().decode('utf-8')
+            menu_section_update_request_raw = req.stream.read()
             menu_section_update_request = \
                 self._menu_section_update_request_validator.validate(
                     menu_section_update_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid menu section update data',
-                description='Invalid data "{}"'.format(menu_section_update_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    menu_section_update_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             menu_section = self._model.update_menu_section(
@@ -235,10 +289,11 @@ class MenuSectionResource(object):
 
         response = {'menuSection': menu_section}
 
-        jsonschema.validate(response, schemas.MENU_SECTION_RESPONSE)
+        self._response_validator.validate(
+            'PUT /org/menu/sections/{section_id}', response, compiled_schemas.MENU_SECTION_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
     def on_delete(self, req, resp, section_id):
         """Remove a particular menu section."""
@@ -268,77 +323,143 @@ class MenuSectionResource(object):
 class MenuItemsResource(object):
     """All the items in the menu for an organization."""
 
-    def __init__(self, menu_items_creation_request_validator, model):
+    def __init__(self, menu_items_creation_request_validator, page_request_validator,
+                 fields_validator, model, response_validator):
         self._menu_items_creation_request_validator = menu_items_creation_request_validator
+        self._page_request_validator = page_request_validator
+        self._fields_validator = fields_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_post(self, req, resp):
-        """Create a menu item."""
+        """Create a menu item, or several of them at once."""
 
         user = req.context['user']
 
         try:
-            menu_items_creation_request_raw = req.stream.read().decode('utf-8')
+            menu_items_creation_request_raw = req.stream.read()
             menu_items_creation_request = \
                 self._menu_items_creation_request_validator.validate(
                     menu_items_creation_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid menu item creation data',
-                description='Invalid data "{}"'.format(menu_items_creation_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    menu_items_creation_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
-            menu_item = self._model.create_menu_item(
-                user['id'], menu_items_creation_request['sectionId'], menu_items_creation_request['name'],
-                menu_items_creation_request['description'], menu_items_creation_request['keywords'],
-                menu_items_creation_request['ingredients'], menu_items_creation_request['imageSet'])
+            menu_items = self._model.create_menu_items(user['id'], menu_items_creation_request)
         except model.OrgDoesNotExistError as e:
             raise falcon.HTTPNotFound(
                 title='Org does not exist',
                 description='Org does not exist')
+        except model.MenuSectionDoesNotExistError as e:
+            raise falcon.HTTPNotFound(
+                title='Menu section does not exist',
+                description='Menu section does not exist') from e
 
-        response = {'menuItems': [menu_item]}
+        response = {'menuItems': menu_items}
 
-        jsonschema.validate(response, schemas.MENU_ITEMS_RESPONSE)
+        self._response_validator.validate(
+            'POST /org/menu/items', response, compiled_schemas.MENU_ITEMS_RESPONSE)
 
         resp.status = falcon.HTTP_201
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
     def on_get(self, req, resp):
-        """Get a particular menu item."""
+        """Get all the menu items, or a page of them."""
 
         user = req.context['user']
+        page_request = _page_request(self._page_request_validator, req)
+        fields = _fields(self._fields_validator, req)
+
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
+        if page_request is None:
+            menu_items = self._model.get_all_menu_items(user['id'], fields)
+            response = {'menuItems': menu_items}
+            response_schema = compiled_schemas.MENU_ITEMS_RESPONSE if fields is None \
+                else compiled_schemas.MENU_ITEMS_PROJECTION_RESPONSE
+        else:
+            limit, after_id = page_request
+            menu_items, next_after_id = self._model.get_menu_items_page(
+                user['id'], limit, after_id, fields)
+            response = {
+                'menuItems': menu_items,
+                'next': _next_cursor(self._page_request_validator, next_after_id)
+            }
+            response_schema = compiled_schemas.MENU_ITEMS_PAGE_RESPONSE if fields is None \
+                else compiled_schemas.MENU_ITEMS_PAGE_PROJECTION_RESPONSE
+
+        self._response_validator.validate('GET /org/menu/items', response, response_schema)
 
-        try:
-            menu_items = self._model.get_all_menu_items(user['id'])
-        except model.OrgDoesNotExistError as e:
-            raise falcon.HTTPNotFound(
-                title='Org does not exist',
-                description='Org does not exist')
+        resp.status = falcon.HTTP_200
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
-        response = {'menuItems': menu_items}
 
-        jsonschema.validate(response, schemas.MENU_ITEMS_RESPONSE)
+class MenuItemsSearchResource(object):
+    """Full-text search over the menu items of an organization."""
+
+    def __init__(self, search_request_validator, fields_validator, model, response_validator):
+        self._search_request_validator = search_request_validator
+        self._fields_validator = fields_validator
+        self._model = model
+        self._response_validator = response_validator
+
+    def on_get(self, req, resp):
+        """Get a page of the menu items matching a query, best matches first."""
+
+        user = req.context['user']
+        terms, limit, offset = _search_request(self._search_request_validator, req)
+        fields = _fields(self._fields_validator, req)
+
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
+        menu_items, next_offset = self._model.search_menu_items(
+            user['id'], terms, limit, offset, fields)
+        response = {
+            'menuItems': menu_items,
+            'next': _next_cursor(self._search_request_validator, next_offset)
+        }
+
+        self._response_validator.validate(
+            'GET /org/menu/items/search', response,
+            compiled_schemas.MENU_ITEMS_SEARCH_RESPONSE if fields is None
+            else compiled_schemas.MENU_ITEMS_SEARCH_PROJECTION_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
 
 class MenuItemResource(object):
     """A item in the menu for an organization."""
 
-    def __init__(self, menu_item_update_request_validator, model):
+    def __init__(self, menu_item_update_request_validator, fields_validator, model,
+                 response_validator):
         self._menu_item_update_request_validator = menu_item_update_request_validator
+        self._fields_validator = fields_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_get(self, req, resp, item_id):
         """Get a particular menu item."""
 
         item_id = self._validate_item_id(item_id)
         user = req.context['user']
+        fields = _fields(self._fields_validator, req)
+
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
 
         try:
-            menu_item = self._model.get_menu_item(user['id'], item_id)
+            menu_item = self._model.get_menu_item(user['id'], item_id, fields)
         except model.MenuItemDoesNotExistError as e:
             raise falcon.HTTPNotFound(
                 title='Item does not exist',
@@ -346,10 +467,14 @@ class MenuItemResource(object):
 
         response = {'menuItem': menu_item}
 
-        jsonschema.validate(response, schemas.MENU_ITEM_RESPONSE)
+        self._response_validator.validate(
+            'GET /org/menu/items/{item_id}', response,
+            compiled_schemas.MENU_ITEM_RESPONSE if fields is None
+            else compiled_schemas.MENU_ITEM_PROJECTION_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
     def on_put(self, req, resp, item_id):
         """Update a particular menu item."""
@@ -358,14 +483,15 @@ class MenuItemResource(object):
         user = req.context['user']
 
         try:
-            menu_item_update_request_raw = req.stream.read().decode('utf-8')
+            menu_item_update_request_raw = req.stream.read()
             menu_item_update_request = \
                 self._menu_item_update_request_validator.validate(
                     menu_item_update_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid menu item update data',
-                description='Invalid data "{}"'.format(menu_item_update_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    menu_item_update_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             menu_item = self._model.update_menu_item(
@@ -377,10 +503,11 @@ class MenuItemResource(object):
 
         response = {'menuItem': menu_item}
 
-        jsonschema.validate(response, schemas.MENU_ITEM_RESPONSE)
+        self._response_validator.validate(
+            'PUT /org/menu/items/{item_id}', response, compiled_schemas.MENU_ITEM_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
     def on_delete(self, req, resp, item_id):
         """Remove a particular menu item."""
@@ -407,19 +534,91 @@ class MenuItemResource(object):
                 description='Invalid item id "{}"'.format(item_id)) from e
 
 
+class MenuImportResource(object):
+    """A whole menu imported at once, for an organization."""
+
+    def __init__(self, menu_import_request_validator, model, response_validator):
+        self._menu_import_request_validator = menu_import_request_validator
+        self._model = model
+        self._response_validator = response_validator
+
+    def on_post(self, req, resp):
+        """Create menu sections together with their menu items."""
+
+        user = req.context['user']
+
+        try:
+            menu_import_request_raw = req.stream.read()
+            menu_import_request = self._menu_import_request_validator.validate(
+                menu_import_request_raw)
+        except validation.Error as e:
+            raise falcon.HTTPBadRequest(
+                title='Invalid menu import data',
+                description='Invalid data "{}"'.format(
+                    menu_import_request_raw.decode('utf-8', 'replace'))) from e
+
+        try:
+            menu_sections = self._model.import_menu(user['id'], menu_import_request['sections'])
+        except model.OrgDoesNotExistError as e:
+            raise falcon.HTTPNotFound(
+                title='Org does not exist',
+                description='Org does not exist')
+
+        response = {'menuSections': menu_sections}
+
+        self._response_validator.validate(
+            'POST /org/menu/import', response, compiled_schemas.MENU_SECTIONS_RESPONSE)
+
+        resp.status = falcon.HTTP_201
+        resp.data = codec.dumps(response)
+
+
+class MenuExportResource(object):
+    """The whole menu of an organization, as newline delimited JSON."""
+
+    def __init__(self, model):
+        self._model = model
+
+    def on_get(self, req, resp):
+        """Stream the menu sections and then the menu items, one per line."""
+
+        user = req.context['user']
+
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
+        try:
+            batches = self._model.export_menu(user['id'])
+        except model.OrgDoesNotExistError as e:
+            raise falcon.HTTPNotFound(
+                title='Org does not exist',
+                description='Org does not exist')
+
+        resp.status = falcon.HTTP_200
+        resp.content_type = 'application/x-ndjson'
+        resp.etag = etag
+        resp.stream = _ndjson(batches)
+
+
 class PlatformsWebsiteResource(object):
     """The website platform for an organization."""
 
-    def __init__(self, platforms_website_update_request_validator, model):
+    def __init__(self, platforms_website_update_request_validator, model, response_validator):
         self._platforms_website_update_request_validator = \
             platforms_website_update_request_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_get(self, req, resp):
         """Get the website platform for an organization."""
 
         user = req.context['user']
 
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
         try:
             platforms_website = self._model.get_platforms_website(user['id'])
         except model.OrgDoesNotExistError as e:
@@ -429,10 +628,12 @@ class PlatformsWebsiteResource(object):
 
         response = {'platformsWebsite': platforms_website}
 
-        jsonschema.validate(response, schemas.PLATFORMS_WEBSITE_RESPONSE)
+        self._response_validator.validate(
+            'GET /org/platforms/website', response, compiled_schemas.PLATFORMS_WEBSITE_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
     def on_put(self, req, resp):
         """Update the website platform for an organization."""
@@ -440,14 +641,15 @@ class PlatformsWebsiteResource(object):
         user = req.context['user']
 
         try:
-            platforms_website_update_request_raw = req.stream.read().decode('utf-8')
+            platforms_website_update_request_raw = req.stream.read()
             platforms_website_update_request = \
                 self._platforms_website_update_request_validator.validate(
                     platforms_website_update_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid website update data',
-                description='Invalid data "{}"'.format(platforms_website_update_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    platforms_website_update_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             platforms_website = self._model.update_platforms_website(user['id'], **platforms_website_update_request)
@@ -460,25 +662,31 @@ class PlatformsWebsiteResource(object):
         
         response['platformsWebsite'].update(platforms_website_update_request)
 
-        jsonschema.validate(response, schemas.PLATFORMS_WEBSITE_RESPONSE)
+        self._response_validator.validate(
+            'PUT /org/platforms/website', response, compiled_schemas.PLATFORMS_WEBSITE_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
 
 class PlatformsCallcenterResource(object):
     """The callcenter platform for an organization."""
 
-    def __init__(self, platforms_callcenter_update_request_validator, model):
+    def __init__(self, platforms_callcenter_update_request_validator, model, response_validator):
         self._platforms_callcenter_update_request_validator = \
             platforms_callcenter_update_request_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_get(self, req, resp):
         """Get the callcenter platform for an organization."""
 
         user = req.context['user']
 
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
         try:
             platforms_callcenter = self._model.get_platforms_callcenter(user['id'])
         except model.OrgDoesNotExistError as e:
@@ -488,10 +696,13 @@ class PlatformsCallcenterResource(object):
 
         response = {'platformsCallcenter': platforms_callcenter}
 
-        jsonschema.validate(response, schemas.PLATFORMS_CALLCENTER_RESPONSE)
+        self._response_validator.validate(
+            'GET /org/platforms/callcenter', response,
+            compiled_schemas.PLATFORMS_CALLCENTER_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
     def on_put(self, req, resp):
         """Update the callcenter platform for an organization."""
@@ -499,14 +710,15 @@ class PlatformsCallcenterResource(object):
         user = req.context['user']
 
         try:
-            platforms_callcenter_update_request_raw = req.stream.read().decode('utf-8')
+            platforms_callcenter_update_request_raw = req.stream.read()
             platforms_callcenter_update_request = \
                 self._platforms_callcenter_update_request_validator.validate(
                     platforms_callcenter_update_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid callcenter update data',
-                description='Invalid data "{}"'.format(platforms_callcenter_update_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    platforms_callcenter_update_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             platforms_callcenter = self._model.update_platforms_callcenter(user['id'], **platforms_callcenter_update_request)
@@ -519,25 +731,32 @@ class PlatformsCallcenterResource(object):
         
         response['platformsCallcenter'].update(platforms_callcenter_update_request)
 
-        jsonschema.validate(response, schemas.PLATFORMS_CALLCENTER_RESPONSE)
+        self._response_validator.validate(
+            'PUT /org/platforms/callcenter', response,
+            compiled_schemas.PLATFORMS_CALLCENTER_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
 
 class PlatformsEmailcenterResource(object):
     """The emailcenter platform for an organization."""
 
-    def __init__(self, platforms_emailcenter_update_request_validator, model):
+    def __init__(self, platforms_emailcenter_update_request_validator, model, response_validator):
         self._platforms_emailcenter_update_request_validator = \
             platforms_emailcenter_update_request_validator
         self._model = model
+        self._response_validator = response_validator
 
     def on_get(self, req, resp):
         """Get the emailcenter platform for an organization."""
 
         user = req.context['user']
 
+        etag = _org_content_etag(self._model, user['id'])
+        if _not_modified(req, resp, etag):
+            return
+
         try:
             platforms_emailcenter = self._model.get_platforms_emailcenter(user['id'])
         except model.OrgDoesNotExistError as e:
@@ -547,10 +766,13 @@ class PlatformsEmailcenterResource(object):
 
         response = {'platformsEmailcenter': platforms_emailcenter}
 
-        jsonschema.validate(response, schemas.PLATFORMS_EMAILCENTER_RESPONSE)
+        self._response_validator.validate(
+            'GET /org/platforms/emailcenter', response,
+            compiled_schemas.PLATFORMS_EMAILCENTER_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
 
     def on_put(self, req, resp):
         """Update the emailcenter platform for an organization."""
@@ -558,14 +780,15 @@ class PlatformsEmailcenterResource(object):
         user = req.context['user']
 
         try:
-            platforms_emailcenter_update_request_raw = req.stream.read().decode('utf-8')
+            platforms_emailcenter_update_request_raw = req.stream.read()
             platforms_emailcenter_update_request = \
                 self._platforms_emailcenter_update_request_validator.validate(
                     platforms_emailcenter_update_request_raw)
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
                 title='Invalid emailcenter update data',
-                description='Invalid data "{}"'.format(platforms_emailcenter_update_request_raw)) from e
+                description='Invalid data "{}"'.format(
+                    platforms_emailcenter_update_request_raw.decode('utf-8', 'replace'))) from e
 
         try:
             platforms_emailcenter = self._model.update_platforms_emailcenter(
@@ -579,10 +802,12 @@ class PlatformsEmailcenterResource(object):
         
         response['platformsEmailcenter'].update(platforms_emailcenter_update_request)
 
-        jsonschema.validate(response, schemas.PLATFORMS_EMAILCENTER_RESPONSE)
+        self._response_validator.validate(
+            'PUT /org/platforms/emailcenter', response,
+            compiled_schemas.PLATFORMS_EMAILCENTER_RESPONSE)
 
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.data = codec.dumps(response)
 
 
 class WebshopInfoResource(object):
@@ -590,31 +815,351 @@ class WebshopInfoResource(object):
 
     AUTH_NOT_REQUIRED = True
 
-    def __init__(self, host_to_subdomain_validator, model):
+    def __init__(self, host_to_subdomain_validator, webshop_routes, model, response_validator,
+                 webshop_cache, compressor, snapshot_store=None, snapshot_publisher=None):
         self._host_to_subdomain_validator = host_to_subdomain_validator
+        self._webshop_routes = webshop_routes
         self._model = model
-
+        self._response_validator = response_validator
+        self._webshop_cache = webshop_cache
+        self._compressor = compressor
+        self._snapshot_store = snapshot_store
+        self._snapshot_publisher = snapshot_publisher
 
     def on_get(self, req, resp):
         """Retrieve all information needed by a webshop."""
 
+        subdomain = _webshop_subdomain(self._host_to_subdomain_validator, self._webshop_routes, req)
+
+        if self._snapshot_store is not None:
+            snapshot = self._snapshot_store.open(subdomain, req.get_header('Accept-Encoding'))
+            if snapshot is not None:
+                self._serve_snapshot(req, resp, snapshot)
+                return
+
+        webshop_info_response = self._webshop_cache.get(subdomain)
+
+        if webshop_info_response is None:
+            if req.if_none_match is not None:
+                try:
+                    org_id, content_version = self._model.get_webshop_content_version(subdomain)
+                except model.OrgDoesNotExistError as e:
+                    raise _webshop_does_not_exist(self._webshop_routes, req) from e
+
+                self._webshop_routes.found(req.host, subdomain, org_id)
+
+                # Whether the body is worth compressing is only known once it is read, but it was
+                # for a client which holds the compressed representation it would get now.
+                encoding = self._compressor.preferred(req.get_header('Accept-Encoding'))
+                etag = etags.content_etag(org_id, content_version)
+                if encoding is not None and etags.etag_listed(
+                        req.if_none_match, compression.encoded_etag(etag, encoding)):
+                    _not_modified(req, resp, etag, encoding, compressible=True)
+                    return
+
+            generation = self._webshop_cache.generation()
+
+            try:
+                org_id, content_version, webshop_info = \
+                    self._model.get_webshop_info_with_version(subdomain)
+            except model.OrgDoesNotExistError as e:
+                raise _webshop_does_not_exist(self._webshop_routes, req) from e
+
+            self._webshop_routes.found(req.host, subdomain, org_id)
+
+            response = {'webshopInfo': webshop_info}
+
+            self._response_validator.validate(
+                'GET /webshop', response, compiled_schemas.WEBSHOP_INFO_RESPONSE)
+
+            webshop_info_response = cache.WebshopResponse(
+                org_id=org_id,
+                etag=etags.content_etag(org_id, content_version),
+                body=codec.dumps(response),
+                encoded_bodies={})
+            self._webshop_cache.put(subdomain, webshop_info_response, generation)
+
+            # Webshops which were not changed since snapshots were turned on have none yet.
+            if self._snapshot_publisher is not None:
+                self._snapshot_publisher.on_org_changed(org_id)
+
+        size = len(webshop_info_response.body)
+        encoding = self._compressor.negotiate(req.get_header('Accept-Encoding'), size)
+        if _not_modified(req, resp, webshop_info_response.etag, encoding,
+                         self._compressor.compressible(size)):
+            return
+
+        resp.status = falcon.HTTP_200
+        resp.etag = webshop_info_response.etag
+        resp.data = webshop_info_response.body
+        compression.encode_response(
+            self._compressor, req, resp, webshop_info_response.encoded_bodies)
+
+    def _serve_snapshot(self, req, resp, snapshot):
+        if _not_modified(req, resp, snapshot.etag, snapshot.encoding, snapshot.compressible):
+            snapshot.stream.close()
+            return
+
+        resp.status = falcon.HTTP_200
+        resp.etag = snapshot.etag
+        if snapshot.compressible:
+            resp.append_header('Vary', 'Accept-Encoding')
+        if snapshot.encoding is not None:
+            resp.set_header('Content-Encoding', snapshot.encoding)
+            resp.etag = compression.encoded_etag(snapshot.etag, snapshot.encoding)
+        # Falcon hands files to the server's wsgi.file_wrapper, which can send them with sendfile.
+        resp.set_stream(snapshot.stream, snapshot.length)
+
+
+class WebshopMenuItemsSearchResource(object):
+    """Full-text search over the menu items of a webshop."""
+
+    AUTH_NOT_REQUIRED = True
+
+    def __init__(self, host_to_subdomain_validator, webshop_routes, search_request_validator,
+                 fields_validator, model, response_validator):
+        self._host_to_subdomain_validator = host_to_subdomain_validator
+        self._webshop_routes = webshop_routes
+        self._search_request_validator = search_request_validator
+        self._fields_validator = fields_validator
+        self._model = model
+        self._response_validator = response_validator
+
+    def on_get(self, req, resp):
+        """Get a page of the menu items matching a query, best matches first."""
+
+        subdomain = _webshop_subdomain(self._host_to_subdomain_validator, self._webshop_routes, req)
+
+        terms, limit, offset = _search_request(self._search_request_validator, req)
+        fields = _fields(self._fields_validator, req)
+
+        try:
+            org_id, content_version, menu_items, next_offset = \
+                self._model.search_webshop_menu_items_with_version(
+                    subdomain, terms, limit, offset, fields)
+        except model.OrgDoesNotExistError as e:
+            raise _webshop_does_not_exist(self._webshop_routes, req) from e
+
+        self._webshop_routes.found(req.host, subdomain, org_id)
+
+        etag = etags.content_etag(org_id, content_version)
+        if _not_modified(req, resp, etag):
+            return
+
+        response = {
+            'menuItems': menu_items,
+            'next': _next_cursor(self._search_request_validator, next_offset)
+        }
+
+        self._response_validator.validate(
+            'GET /webshop/search', response,
+            compiled_schemas.MENU_ITEMS_SEARCH_RESPONSE if fields is None
+            else compiled_schemas.MENU_ITEMS_SEARCH_PROJECTION_RESPONSE)
+
+        resp.status = falcon.HTTP_200
+        resp.etag = etag
+        resp.data = codec.dumps(response)
+
+
+class WebshopChangesResource(object):
+    """What changed in a webshop after a content version, for clients keeping a copy of it."""
+
+    AUTH_NOT_REQUIRED = True
+
+    def __init__(self, host_to_subdomain_validator, webshop_routes, changes_request_validator,
+                 model, response_validator):
+        self._host_to_subdomain_validator = host_to_subdomain_validator
+        self._webshop_routes = webshop_routes
+        self._changes_request_validator = changes_request_validator
+        self._model = model
+        self._response_validator = response_validator
+
+    def on_get(self, req, resp):
+        """Get the changes after the since content version, archived sections and items included.
+
+        The response holds the content version to ask for changes since next time.
+        """
+
+        subdomain = _webshop_subdomain(self._host_to_subdomain_validator, self._webshop_routes, req)
+
         try:
-            subdomain = self._host_to_subdomain_validator.validate(req.host)
+            since = self._changes_request_validator.validate(req.get_param('since'))
         except validation.Error as e:
             raise falcon.HTTPBadRequest(
-                title='Invalid host header',
-                description='Invalid host header "{}"'.format(req.host)) from e
+                title='Invalid changes request',
+                description='Invalid since "{}"'.format(req.get_param('since'))) from e
 
         try:
-            webshop_info = self._model.get_webshop_info(subdomain)
+            org_id, content_version, webshop_changes = \
+                self._model.get_webshop_changes(subdomain, since)
         except model.OrgDoesNotExistError as e:
-            raise falcon.HTTPNotFound(
-                title='Webshop does not exist',
-                description= 'Webshop does not exist') from e
+            raise _webshop_does_not_exist(self._webshop_routes, req) from e
 
-        response = {'webshopInfo': webshop_info}
+        self._webshop_routes.found(req.host, subdomain, org_id)
+
+        etag = etags.content_etag(org_id, content_version)
+        if _not_modified(req, resp, etag):
+            return
+
+        response = {'webshopChanges': webshop_changes}
+
+        self._response_validator.validate(
+            'GET /webshop/changes', response, compiled_schemas.WEBSHOP_CHANGES_RESPONSE)
 
-        jsonschema.validate(response, schemas.WEBSHOP_INFO_RESPONSE)
-        
         resp.status = falcon.HTTP_200
-        resp.body = json.dumps(response)
+        resp.etag = etag
+        resp.data = codec.dumps(response)
+
+
+class MetricsResource(object):
+    """Internal metrics for the worker which serves the request."""
+
+    AUTH_NOT_REQUIRED = True
+
+    def __init__(self, sources):
+        self._sources = sources
+
+    def on_get(self, req, resp):
+        """Retrieve the metrics gathered by this worker."""
+
+        response = {name: source() for name, source in self._sources.items()}
+        response['pid'] = os.getpid()
+
+        resp.status = falcon.HTTP_200
+        resp.data = codec.dumps(response)
+
+
+class ReadYourWritesMiddleware(object):
+    """Keeps the reads of a client which just wrote on the primary, whichever process serves them.
+
+    Responses to writes carry the time until which the client's reads should go to the primary,
+    and clients send back the last such time they got, in the same header.
+    """
+
+    HEADER = 'X-Primary-Until'
+
+    def __init__(self, model):
+        self._model = model
+
+    def process_request(self, req, resp):
+        pinned_until_raw = req.get_header(self.HEADER)
+
+        try:
+            pinned_until = float(pinned_until_raw) if pinned_until_raw is not None else None
+        except ValueError:
+            pinned_until = None
+
+        self._model.start_request(pinned_until)
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        pinned_until = self._model.finish_request()
+        if pinned_until is not None:
+            resp.set_header(self.HEADER, '{:.3f}'.format(pinned_until))
+
+
+def _page_request(page_request_validator, req):
+    try:
+        return page_request_validator.validate(req.get_param('limit'), req.get_param('cursor'))
+    except validation.Error as e:
+        raise falcon.HTTPBadRequest(
+            title='Invalid page request',
+            description='Invalid limit "{}" or cursor "{}"'.format(
+                req.get_param('limit'), req.get_param('cursor'))) from e
+
+
+def _next_cursor(page_request_validator, next_after_id):
+    return page_request_validator.cursor(next_after_id) if next_after_id is not None else None
+
+
+def _fields(fields_validator, req):
+    # Falcon splits comma separated values into lists, so these are read as lists too.
+    fields_raw = req.get_param_as_list('fields')
+
+    try:
+        return fields_validator.validate(fields_raw)
+    except validation.Error as e:
+        raise falcon.HTTPBadRequest(
+            title='Invalid fields',
+            description='Invalid fields "{}"'.format(','.join(fields_raw))) from e
+
+
+def _search_request(search_request_validator, req):
+    query_raw = req.get_param_as_list('q')
+    query_raw = ','.join(query_raw) if query_raw is not None else None
+
+    try:
+        return search_request_validator.validate(
+            query_raw, req.get_param('limit'), req.get_param('cursor'))
+    except validation.Error as e:
+        raise falcon.HTTPBadRequest(
+            title='Invalid search request',
+            description='Invalid query "{}", limit "{}" or cursor "{}"'.format(
+                query_raw, req.get_param('limit'), req.get_param('cursor'))) from e
+
+
+def _webshop_subdomain(host_to_subdomain_validator, webshop_routes, req):
+    subdomain = webshop_routes.get(req.host)
+    if subdomain is not None:
+        return subdomain
+
+    # Not marked as missing again, so its time in the negative cache runs out even under load.
+    if webshop_routes.is_missing(req.host):
+        raise falcon.HTTPNotFound(
+            title='Webshop does not exist',
+            description='Webshop does not exist')
+
+    try:
+        return host_to_subdomain_validator.validate(req.host)
+    except validation.Error as e:
+        raise falcon.HTTPBadRequest(
+            title='Invalid host header',
+            description='Invalid host header "{}"'.format(req.host)) from e
+
+
+def _webshop_does_not_exist(webshop_routes, req):
+    webshop_routes.missing(req.host)
+    return falcon.HTTPNotFound(
+        title='Webshop does not exist',
+        description='Webshop does not exist')
+
+
+def _ndjson(batches):
+    # One chunk per batch, rather than per line. Closing this closes the batches, and with them the
+    # database cursor, when the client goes away before the end.
+    try:
+        for batch in batches:
+            yield b''.join(codec.dumps(record) + b'\n' for record in batch)
+    finally:
+        batches.close()
+
+
+def _org_content_etag(the_model, user_id):
+    """The ETag for the org-owned resources of a user, or None if the user has no org.
+
+    The version is read before the resource itself, so a concurrent write can at worst make the
+    ETag older than the body, which costs the client a refetch, never a stale hit.
+    """
+
+    try:
+        org_id, content_version = the_model.get_org_content_version(user_id)
+    except model.OrgDoesNotExistError:
+        return None
+
+    return etags.content_etag(org_id, content_version)
+
+
+def _not_modified(req, resp, etag, encoding=None, compressible=False):
+    """Answer 304 if the client has the body with the given ETag, as the 200 would be sent.
+
+    The encoding the 200 would be sent in picks the ETag, and compressible bodies vary with
+    Accept-Encoding, so caches can freshen the representation they hold.
+    """
+
+    if etag is None or req.if_none_match is None or not etags.etag_matches(req.if_none_match, etag):
+        return False
+
+    resp.status = falcon.HTTP_304
+    resp.etag = compression.encoded_etag(etag, encoding) if encoding is not None else etag
+    if compressible:
+        resp.append_header('Vary', 'Accept-Encoding')
+    return True
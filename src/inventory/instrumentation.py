@@ -0,0 +1,180 @@
+"""Instrumentation for the inventory service."""
+
+import contextlib
+import threading
+import time
+
+import sqlalchemy
+import sqlalchemy.pool
+
+
+class StartupTimer(object):
+    """Times the phases of starting up a process, in the order they ran."""
+
+    def __init__(self, the_time=time.perf_counter):
+        self._the_time = the_time
+        self._phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = self._the_time()
+        try:
+            yield
+        finally:
+            self.record(name, self._the_time() - started)
+
+    def record(self, name, seconds):
+        self._phases.append((name, seconds))
+
+    def describe(self):
+        return ', '.join('{} {:.3f}s'.format(name, seconds) for name, seconds in self._phases)
+
+    def stats(self):
+        return {
+            'phases': [{'name': name, 'seconds': seconds} for name, seconds in self._phases],
+            'seconds': sum(seconds for _, seconds in self._phases)
+        }
+
+
+class StatementPreparationTimer(object):
+    """Measures the time spent turning statements into SQL text, overall and per request.
+
+    This is the time between the before_execute and before_cursor_execute engine events, which is
+    dominated by compiling the statement whenever it is not found in a compiled cache.
+    """
+
+    def __init__(self, the_time=time.perf_counter):
+        self._the_time = the_time
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._statements = 0
+        self._seconds = 0.0
+        self._requests = 0
+        self._request_seconds = 0.0
+        self._max_request_seconds = 0.0
+
+    def install(self, sql_engine):
+        sqlalchemy.event.listen(
+            sql_engine, 'before_execute', self._on_before_execute, named=True)
+        sqlalchemy.event.listen(
+            sql_engine, 'before_cursor_execute', self._on_before_cursor_execute, named=True)
+
+    def begin_request(self):
+        self._local.request_seconds = 0.0
+
+    def end_request(self):
+        request_seconds = getattr(self._local, 'request_seconds', None)
+        if request_seconds is None:
+            return
+
+        self._local.request_seconds = None
+
+        with self._lock:
+            self._requests += 1
+            self._request_seconds += request_seconds
+            self._max_request_seconds = max(self._max_request_seconds, request_seconds)
+
+    def stats(self):
+        with self._lock:
+            requests = max(self._requests, 1)
+
+            return {
+                'statements': self._statements,
+                'seconds': self._seconds,
+                'requests': self._requests,
+                'secondsPerRequest': self._request_seconds / requests,
+                'maxSecondsPerRequest': self._max_request_seconds
+            }
+
+    def _on_before_execute(self, **kwargs):
+        self._local.started = self._the_time()
+
+    def _on_before_cursor_execute(self, **kwargs):
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return
+
+        self._local.started = None
+        elapsed = self._the_time() - started
+
+        if getattr(self._local, 'request_seconds', None) is not None:
+            self._local.request_seconds += elapsed
+
+        with self._lock:
+            self._statements += 1
+            self._seconds += elapsed
+
+
+class StatementPreparationMiddleware(object):
+    """Attributes the statement preparation time of a request to it."""
+
+    def __init__(self, statement_preparation_timer):
+        self._statement_preparation_timer = statement_preparation_timer
+
+    def process_request(self, req, resp):
+        self._statement_preparation_timer.begin_request()
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        self._statement_preparation_timer.end_request()
+
+
+class MeteredQueuePool(sqlalchemy.pool.QueuePool):
+    """A QueuePool which measures how long checkouts wait, and how close it comes to running out.
+
+    The wait covers everything Pool.connect does, so it includes opening new connections while
+    the pool is filling up. Timeouts are checkouts which gave up waiting for a connection.
+    """
+
+    def __init__(self, creator, max_overflow=10, **kwargs):
+        super().__init__(creator, max_overflow=max_overflow, **kwargs)
+        self._the_time = time.perf_counter
+        self._capacity_overflow = max_overflow
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._max_checked_out = 0
+        self._timeouts = 0
+
+    def connect(self):
+        started = self._the_time()
+
+        try:
+            connection = super().connect()
+        except sqlalchemy.exc.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise
+
+        wait_seconds = self._the_time() - started
+        checked_out = self.checkedout()
+
+        with self._lock:
+            self._checkouts += 1
+            self._wait_seconds += wait_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+            self._max_checked_out = max(self._max_checked_out, checked_out)
+
+        return connection
+
+    def stats(self):
+        # A negative max overflow means the pool can grow without bound.
+        capacity = self.size() + self._capacity_overflow if self._capacity_overflow >= 0 else None
+        checked_out = self.checkedout()
+
+        with self._lock:
+            checkouts = max(self._checkouts, 1)
+
+            return {
+                'size': self.size(),
+                'maxOverflow': self._capacity_overflow,
+                'checkedOut': checked_out,
+                'maxCheckedOut': self._max_checked_out,
+                'saturation': checked_out / capacity if capacity else None,
+                'maxSaturation': self._max_checked_out / capacity if capacity else None,
+                'checkouts': self._checkouts,
+                'waitSeconds': self._wait_seconds,
+                'waitSecondsPerCheckout': self._wait_seconds / checkouts,
+                'maxWaitSeconds': self._max_wait_seconds,
+                'timeouts': self._timeouts
+            }
@@ -0,0 +1,26 @@
+"""Inventory service migrations entry point.
+
+Migrations are applied once per deploy, by running this before the servers start, rather than by
+every worker as it boots.
+"""
+
+import logging
+import time
+
+import startup_migrations
+
+import inventory.config as config
+
+
+def main():
+    """Migrations entry point."""
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    startup_migrations.migrate(config.DATABASE_URL, config.MIGRATIONS_PATH)
+    logging.getLogger(__name__).info(
+        'Migrations applied in {:.3f}s'.format(time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,24 @@
 """Model actions for the inventory service."""
 
-import datetime
+import random
+import threading
+import time
 
 import inflection
 import slugify
 import sqlalchemy as sql
 import sqlalchemy.dialects.postgresql as postgresql
 
+import inventory.cache as cache
+
 
 _metadata = sql.MetaData(schema='inventory')
 
 _org = sql.Table(
     'org', _metadata,
     sql.Column('id', sql.Integer, primary_key=True, info={'export': True}),
-    sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}))
+    sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}),
+    sql.Column('content_version', sql.BigInteger))
 
 _org_user = sql.Table(
     'org_user', _metadata,
@@ -32,7 +37,9 @@ _restaurant = sql.Table(
     sql.Column('keywords', postgresql.ARRAY(sql.Text), info={'export': True}),
     sql.Column('address', sql.Text(), info={'export': True}),
     sql.Column('opening_hours', postgresql.JSON(), info={'export': True}),
-    sql.Column('image_set', postgresql.JSON(), info={'export': True}))
+    sql.Column('image_set', postgresql.JSON(), info={'export': True}),
+    sql.Column('time_updated', sql.DateTime(timezone=True)),
+    sql.Column('content_version', sql.BigInteger))
 
 _menu_section = sql.Table(
     'menu_section', _metadata,
@@ -40,6 +47,8 @@ _menu_section = sql.Table(
     sql.Column('org_id', sql.Integer, sql.ForeignKey(_org.c.id)),
     sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}),
     sql.Column('time_archived', sql.DateTime(timezone=True), nullable=True),
+    sql.Column('time_updated', sql.DateTime(timezone=True)),
+    sql.Column('content_version', sql.BigInteger),
     sql.Column('name', sql.Text(), info={'export': True}),
     sql.Column('description', sql.Text(), info={'export': True}),
     sql.UniqueConstraint('id', 'org_id', name='menu_section_uk_id_org_id'))
@@ -51,11 +60,15 @@ _menu_item = sql.Table(
     sql.Column('org_id', sql.Integer),
     sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}),
     sql.Column('time_archived', sql.DateTime(timezone=True), nullable=True),
+    sql.Column('time_updated', sql.DateTime(timezone=True)),
+    sql.Column('content_version', sql.BigInteger),
     sql.Column('name', sql.Text(), info={'export': True}),
     sql.Column('description', sql.Text(), info={'export': True}),
     sql.Column('keywords', postgresql.ARRAY(sql.Text), info={'export': True}),
     sql.Column('ingredients', postgresql.JSON(), info={'export': True}),
     sql.Column('image_set', postgresql.JSON(), info={'export': True}),
+    # Maintained by a trigger, from the name, description, keywords and ingredients.
+    sql.Column('search_document', postgresql.TSVECTOR()),
     sql.ForeignKeyConstraint(
         ['section_id', 'org_id'], [_menu_section.c.id, _menu_section.c.org_id]),
     sql.UniqueConstraint('id', 'section_id', 'org_id'))
@@ -66,21 +79,27 @@ _platforms_website = sql.Table(
     sql.Column('id', sql.Integer, primary_key=True, info={'export': True}),
     sql.Column('org_id', sql.Integer, sql.ForeignKey(_org.c.id), unique=True),
     sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}),
-    sql.Column('subdomain', sql.Text(), info={'export': True}))
+    sql.Column('subdomain', sql.Text(), info={'export': True}),
+    sql.Column('time_updated', sql.DateTime(timezone=True)),
+    sql.Column('content_version', sql.BigInteger))
 
 _platforms_callcenter = sql.Table(
     'platforms_callcenter', _metadata,
     sql.Column('id', sql.Integer, primary_key=True, info={'export': True}),
     sql.Column('org_id', sql.Integer, sql.ForeignKey(_org.c.id), unique=True),
     sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}),
-    sql.Column('phone_number', sql.Text(), info={'export': True}))
+    sql.Column('phone_number', sql.Text(), info={'export': True}),
+    sql.Column('time_updated', sql.DateTime(timezone=True)),
+    sql.Column('content_version', sql.BigInteger))
 
 _platforms_emailcenter = sql.Table(
     'platforms_emailcenter', _metadata,
     sql.Column('id', sql.Integer, primary_key=True, info={'export': True}),
     sql.Column('org_id', sql.Integer, sql.ForeignKey(_org.c.id), unique=True),
     sql.Column('time_created', sql.DateTime(timezone=True), info={'export': True}),
-    sql.Column('email_name', sql.Text(), info={'export': True}))
+    sql.Column('email_name', sql.Text(), info={'export': True}),
+    sql.Column('time_updated', sql.DateTime(timezone=True)),
+    sql.Column('content_version', sql.BigInteger))
 
 
 def _ec(t):
@@ -95,6 +114,452 @@ _platforms_website_columns = _ec(_platforms_website)
 _platforms_callcenter_columns = _ec(_platforms_callcenter)
 _platforms_emailcenter_columns = _ec(_platforms_emailcenter)
 
+# Changes carry when each row last changed, and whether it is archived, so clients can merge them.
+_restaurant_change_columns = _restaurant_columns + [_restaurant.c.time_updated]
+_menu_section_change_columns = _menu_section_columns + [
+    _menu_section.c.time_updated, _menu_section.c.time_archived]
+_menu_item_change_columns = _menu_item_columns + [
+    _menu_item.c.section_id, _menu_item.c.time_updated, _menu_item.c.time_archived]
+_platforms_website_change_columns = _platforms_website_columns + [
+    _platforms_website.c.time_updated]
+_platforms_callcenter_change_columns = _platforms_callcenter_columns + [
+    _platforms_callcenter.c.time_updated]
+_platforms_emailcenter_change_columns = _platforms_emailcenter_columns + [
+    _platforms_emailcenter.c.time_updated]
+
+
+def _external_name(column):
+    """The key a column is exposed under: camelCase, and suffixed with Ts for timestamps."""
+
+    if isinstance(column.type, sql.DateTime):
+        return inflection.camelize(column.name, False) + 'Ts'
+    else:
+        return inflection.camelize(column.name, False)
+
+
+class _RowSerializer(object):
+    """Converts rows with a fixed set of columns to their external form.
+
+    The keys are worked out once, when the serializer is built, rather than for every row.
+    Timestamps become integer seconds since the epoch.
+    """
+
+    def __init__(self, columns):
+        self._fields = [
+            (c.name, _external_name(c)) for c in columns
+            if not isinstance(c.type, sql.DateTime)]
+        self._timestamp_fields = [
+            (c.name, _external_name(c)) for c in columns
+            if isinstance(c.type, sql.DateTime)]
+
+    def __call__(self, row):
+        o = {key: row[name] for name, key in self._fields}
+        for name, key in self._timestamp_fields:
+            value = row[name]
+            o[key] = int(value.timestamp()) if value is not None else None
+        return o
+
+
+_org_serializer = _RowSerializer(_org_columns)
+_restaurant_serializer = _RowSerializer(_restaurant_columns)
+_menu_section_serializer = _RowSerializer(_menu_section_columns)
+_menu_item_serializer = _RowSerializer(_menu_item_columns)
+_menu_item_with_section_id_serializer = _RowSerializer(
+    _menu_item_columns + [_menu_item.c.section_id])
+_platforms_website_serializer = _RowSerializer(_platforms_website_columns)
+_platforms_callcenter_serializer = _RowSerializer(_platforms_callcenter_columns)
+_platforms_emailcenter_serializer = _RowSerializer(_platforms_emailcenter_columns)
+_restaurant_change_serializer = _RowSerializer(_restaurant_change_columns)
+_menu_section_change_serializer = _RowSerializer(_menu_section_change_columns)
+_menu_item_change_serializer = _RowSerializer(_menu_item_change_columns)
+_platforms_website_change_serializer = _RowSerializer(_platforms_website_change_columns)
+_platforms_callcenter_change_serializer = _RowSerializer(_platforms_callcenter_change_columns)
+_platforms_emailcenter_change_serializer = _RowSerializer(_platforms_emailcenter_change_columns)
+
+# The fields which can be selected from each kind of object. The id is always included.
+RESTAURANT_FIELDS = frozenset(_external_name(c) for c in _restaurant_columns)
+MENU_SECTION_FIELDS = frozenset(_external_name(c) for c in _menu_section_columns)
+MENU_ITEM_FIELDS = frozenset(_external_name(c) for c in _menu_item_columns)
+
+_projections = {}
+
+
+def _project(statement, serializer, columns, fields):
+    """The statement and serializer, cut down to the id and the given fields, if any are given.
+
+    Each projection is built once, and then reused, so it is compiled once as well.
+    """
+
+    if fields is None:
+        return statement, serializer
+
+    key = (statement, fields)
+    projection = _projections.get(key)
+
+    if projection is None:
+        projected_columns = [c for c in columns if c.name == 'id' or _external_name(c) in fields]
+        projection = (
+            statement.with_only_columns(projected_columns), _RowSerializer(projected_columns))
+        _projections[key] = projection
+
+    return projection
+
+
+_internal_names = {
+    inflection.camelize(c.name, False): c.name for t in _metadata.tables.values() for c in t.c}
+
+
+def _json_object(columns, extra=()):
+    """A json_build_object() with the same keys and values a _RowSerializer produces for a row."""
+
+    arguments = []
+
+    for column in columns:
+        arguments.append(_json_key(_external_name(column)))
+        if isinstance(column.type, sql.DateTime):
+            arguments.append(sql.cast(sql.func.floor(sql.extract('epoch', column)), sql.BigInteger))
+        else:
+            arguments.append(column)
+
+    for key, value in extra:
+        arguments.append(_json_key(key))
+        arguments.append(value)
+
+    return sql.func.json_build_object(*arguments, type_=postgresql.JSON)
+
+
+def _json_key(key):
+    return sql.literal_column("'{}'".format(key))
+
+
+def _json_object_by_id(table, json_object):
+    return sql.func.json_object_agg(
+        sql.cast(table.c.id, sql.Text), json_object, type_=postgresql.JSON)
+
+
+def _build_fetch_webshop_info():
+    """Build the statement which fetches the whole webshop document in one round trip.
+
+    The document is assembled in the database, with archived menu sections and items left out.
+    """
+
+    webshop_org = sql \
+        .select([_platforms_website.c.org_id, _org.c.content_version]) \
+        .select_from(_platforms_website.join(_org, _org.c.id == _platforms_website.c.org_id)) \
+        .where(_platforms_website.c.subdomain == sql.bindparam('subdomain')) \
+        .cte('webshop_org')
+
+    webshop_items = sql \
+        .select([
+            _menu_item.c.section_id,
+            _json_object_by_id(_menu_item, _json_object(_menu_item_columns)).label('items')]) \
+        .select_from(_menu_item.join(webshop_org, _menu_item.c.org_id == webshop_org.c.org_id)) \
+        .where(_menu_item.c.time_archived == None) \
+        .group_by(_menu_item.c.section_id) \
+        .cte('webshop_items')
+
+    menu_section = _json_object(_menu_section_columns, extra=[
+        ('items', sql.func.coalesce(webshop_items.c['items'], sql.literal_column("'{}'::json")))])
+
+    webshop_sections = sql \
+        .select([_json_object_by_id(_menu_section, menu_section).label('sections')]) \
+        .select_from(_menu_section
+                     .join(webshop_org, _menu_section.c.org_id == webshop_org.c.org_id)
+                     .outerjoin(webshop_items, webshop_items.c.section_id == _menu_section.c.id)) \
+        .where(_menu_section.c.time_archived == None) \
+        .cte('webshop_sections')
+
+    def for_org(table, columns):
+        return sql \
+            .select([_json_object(columns)]) \
+            .where(table.c.org_id == webshop_org.c.org_id) \
+            .as_scalar()
+
+    return sql \
+        .select([
+            webshop_org.c.org_id,
+            webshop_org.c.content_version,
+            for_org(_restaurant, _restaurant_columns).label('general'),
+            sql.select([webshop_sections.c.sections]).as_scalar().label('sections'),
+            for_org(_platforms_website, _platforms_website_columns).label('website'),
+            for_org(_platforms_callcenter, _platforms_callcenter_columns).label('callcenter'),
+            for_org(_platforms_emailcenter, _platforms_emailcenter_columns).label('emailcenter')]) \
+        .select_from(webshop_org)
+
+
+_fetch_webshop_info = _build_fetch_webshop_info()
+
+# The statements below are built once, and executed with bound parameters. With a compiled cache
+# they are also compiled to SQL just once per shape. Updates take the values to set from the
+# execution parameters, so their WHERE clause parameters are named so as not to clash with them.
+
+_create_org = _org \
+    .insert() \
+    .returning(*(_org_columns + [_org.c.content_version]))
+
+_create_org_user = _org_user.insert()
+
+_create_restaurant = _restaurant.insert()
+
+_create_platforms_website = _platforms_website.insert()
+
+_create_platforms_callcenter = _platforms_callcenter.insert()
+
+_create_platforms_emailcenter = _platforms_emailcenter.insert()
+
+_fetch_org_id = sql \
+    .select([_org_user.c.org_id]) \
+    .where(_org_user.c.user_id == sql.bindparam('user_id'))
+
+_fetch_org = sql \
+    .select(_org_columns) \
+    .where(_org.c.id == sql.bindparam('org_id'))
+
+_fetch_org_content_version = sql \
+    .select([_org.c.id, _org.c.content_version]) \
+    .where(_org.c.id == sql.bindparam('org_id'))
+
+_fetch_webshop_content_version = sql \
+    .select([_org.c.id, _org.c.content_version]) \
+    .select_from(_platforms_website.join(_org, _org.c.id == _platforms_website.c.org_id)) \
+    .where(_platforms_website.c.subdomain == sql.bindparam('subdomain'))
+
+# Reads every webshop, for loading them all at once.
+_fetch_webshop_routes = sql \
+    .select([_platforms_website.c.subdomain, _platforms_website.c.org_id])
+
+_fetch_org_by_subdomain = sql \
+    .select(_org_columns + [_org.c.content_version]) \
+    .select_from(_org.join(_platforms_website, _org.c.id == _platforms_website.c.org_id)) \
+    .where(_platforms_website.c.subdomain == sql.bindparam('subdomain'))
+
+_bump_content_version = _org \
+    .update() \
+    .values(content_version=_org.c.content_version + 1) \
+    .where(_org.c.id == sql.bindparam('org_id')) \
+    .returning(_org.c.content_version)
+
+_fetch_restaurant = sql \
+    .select(_restaurant_columns) \
+    .where(_restaurant.c.org_id == sql.bindparam('org_id'))
+
+_update_restaurant = _restaurant \
+    .update() \
+    .returning(*_restaurant_columns, _restaurant.c.org_id) \
+    .where(_restaurant.c.org_id == sql.bindparam('where_org_id'))
+
+_create_menu_section = _menu_section \
+    .insert() \
+    .returning(*_menu_section_columns, _menu_section.c.org_id)
+
+_fetch_menu_sections = sql \
+    .select(_menu_section_columns) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('org_id'),
+        _menu_section.c.time_archived == None))
+
+_fetch_menu_sections_page = sql \
+    .select(_menu_section_columns) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('org_id'),
+        _menu_section.c.id > sql.bindparam('after_id'),
+        _menu_section.c.time_archived == None)) \
+    .order_by(_menu_section.c.id) \
+    .limit(sql.bindparam('limit'))
+
+_fetch_menu_section = sql \
+    .select(_menu_section_columns) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('org_id'),
+        _menu_section.c.id == sql.bindparam('section_id'),
+        _menu_section.c.time_archived == None))
+
+_fetch_menu_section_ids = sql \
+    .select([_menu_section.c.id]) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('org_id'),
+        _menu_section.c.id == sql.func.any(
+            sql.bindparam('section_ids', type_=postgresql.ARRAY(sql.Integer))),
+        _menu_section.c.time_archived == None))
+
+_update_menu_section = _menu_section \
+    .update() \
+    .returning(*_menu_section_columns, _menu_section.c.org_id) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('where_org_id'),
+        _menu_section.c.id == sql.bindparam('where_id'),
+        _menu_section.c.time_archived == None))
+
+_archive_menu_section = _menu_section \
+    .update() \
+    .returning(_menu_section.c.org_id) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('where_org_id'),
+        _menu_section.c.id == sql.bindparam('where_id'),
+        _menu_section.c.time_archived == None))
+
+_create_menu_item = _menu_item \
+    .insert() \
+    .returning(*_menu_item_columns, _menu_item.c.org_id)
+
+_import_menu_items = _menu_item \
+    .insert() \
+    .returning(*_menu_item_columns, _menu_item.c.section_id)
+
+_fetch_menu_items = sql \
+    .select(_menu_item_columns) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.time_archived == None))
+
+_fetch_menu_items_page = sql \
+    .select(_menu_item_columns) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.id > sql.bindparam('after_id'),
+        _menu_item.c.time_archived == None)) \
+    .order_by(_menu_item.c.id) \
+    .limit(sql.bindparam('limit'))
+
+_search_query = sql.func.to_tsquery(sql.literal_column("'simple'"), sql.bindparam('query'))
+
+_search_menu_items = sql \
+    .select(_menu_item_columns) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.search_document.op('@@')(_search_query),
+        _menu_item.c.time_archived == None)) \
+    .order_by(sql.func.ts_rank(_menu_item.c.search_document, _search_query).desc(),
+              _menu_item.c.id) \
+    .offset(sql.bindparam('offset')) \
+    .limit(sql.bindparam('limit'))
+
+_fetch_menu_items_with_section_id = sql \
+    .select(_menu_item_columns + [_menu_item.c.section_id]) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.time_archived == None))
+
+_export_menu_sections = sql \
+    .select(_menu_section_columns) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('org_id'),
+        _menu_section.c.time_archived == None)) \
+    .order_by(_menu_section.c.id)
+
+_export_menu_items = sql \
+    .select(_menu_item_columns + [_menu_item.c.section_id]) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.time_archived == None)) \
+    .order_by(_menu_item.c.section_id, _menu_item.c.id)
+
+_fetch_menu_items_for_section = sql \
+    .select(_menu_item_columns) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.section_id == sql.bindparam('section_id'),
+        _menu_item.c.time_archived == None))
+
+_fetch_menu_item = sql \
+    .select(_menu_item_columns) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.id == sql.bindparam('item_id'),
+        _menu_item.c.time_archived == None))
+
+_update_menu_item = _menu_item \
+    .update() \
+    .returning(*_menu_item_columns, _menu_item.c.org_id) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('where_org_id'),
+        _menu_item.c.id == sql.bindparam('where_id'),
+        _menu_item.c.time_archived == None))
+
+_archive_menu_item = _menu_item \
+    .update() \
+    .returning(_menu_item.c.org_id) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('where_org_id'),
+        _menu_item.c.id == sql.bindparam('where_id'),
+        _menu_item.c.time_archived == None))
+
+_archive_menu_items_for_section = _menu_item \
+    .update() \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('where_org_id'),
+        _menu_item.c.section_id == sql.bindparam('where_section_id'),
+        _menu_item.c.time_archived == None))
+
+_fetch_platforms_website = sql \
+    .select(_platforms_website_columns) \
+    .where(_platforms_website.c.org_id == sql.bindparam('org_id'))
+
+_update_platforms_website = _platforms_website \
+    .update() \
+    .returning(*_platforms_website_columns, _platforms_website.c.org_id) \
+    .where(_platforms_website.c.org_id == sql.bindparam('where_org_id'))
+
+_fetch_platforms_callcenter = sql \
+    .select(_platforms_callcenter_columns) \
+    .where(_platforms_callcenter.c.org_id == sql.bindparam('org_id'))
+
+_update_platforms_callcenter = _platforms_callcenter \
+    .update() \
+    .returning(*_platforms_callcenter_columns, _platforms_callcenter.c.org_id) \
+    .where(_platforms_callcenter.c.org_id == sql.bindparam('where_org_id'))
+
+_fetch_platforms_emailcenter = sql \
+    .select(_platforms_emailcenter_columns) \
+    .where(_platforms_emailcenter.c.org_id == sql.bindparam('org_id'))
+
+_update_platforms_emailcenter = _platforms_emailcenter \
+    .update() \
+    .returning(*_platforms_emailcenter_columns, _platforms_emailcenter.c.org_id) \
+    .where(_platforms_emailcenter.c.org_id == sql.bindparam('where_org_id'))
+
+# Every write stamps the rows it changes with the content version it moved the org to. Versions
+# follow commit order, unlike the times rows were written at, so "changed after version N" misses
+# nothing which committed late.
+
+_fetch_restaurant_changes = sql \
+    .select(_restaurant_change_columns) \
+    .where(sql.and_(
+        _restaurant.c.org_id == sql.bindparam('org_id'),
+        _restaurant.c.content_version > sql.bindparam('since')))
+
+_fetch_menu_section_changes = sql \
+    .select(_menu_section_change_columns) \
+    .where(sql.and_(
+        _menu_section.c.org_id == sql.bindparam('org_id'),
+        _menu_section.c.content_version > sql.bindparam('since'))) \
+    .order_by(_menu_section.c.id)
+
+_fetch_menu_item_changes = sql \
+    .select(_menu_item_change_columns) \
+    .where(sql.and_(
+        _menu_item.c.org_id == sql.bindparam('org_id'),
+        _menu_item.c.content_version > sql.bindparam('since'))) \
+    .order_by(_menu_item.c.id)
+
+_fetch_platforms_website_changes = sql \
+    .select(_platforms_website_change_columns) \
+    .where(sql.and_(
+        _platforms_website.c.org_id == sql.bindparam('org_id'),
+        _platforms_website.c.content_version > sql.bindparam('since')))
+
+_fetch_platforms_callcenter_changes = sql \
+    .select(_platforms_callcenter_change_columns) \
+    .where(sql.and_(
+        _platforms_callcenter.c.org_id == sql.bindparam('org_id'),
+        _platforms_callcenter.c.content_version > sql.bindparam('since')))
+
+_fetch_platforms_emailcenter_changes = sql \
+    .select(_platforms_emailcenter_change_columns) \
+    .where(sql.and_(
+        _platforms_emailcenter.c.org_id == sql.bindparam('org_id'),
+        _platforms_emailcenter.c.content_version > sql.bindparam('since')))
+
 
 class Error(Exception):
     pass
@@ -117,213 +582,270 @@ class MenuItemDoesNotExistError(Error):
 
 
 class Model(object):
-    def __init__(self, the_clock, sql_engine):
+    WEBSHOP_QUERY_SINGLE = 'single'
+    WEBSHOP_QUERY_MULTI = 'multi'
+    RECENT_WRITES_SIZE = 10000
+
+    def __init__(self, the_clock, sql_engine, webshop_query=WEBSHOP_QUERY_SINGLE,
+                 org_change_listeners=(), org_id_cache=None, compiled_cache=None,
+                 export_batch_size=500, replica_engines=(), read_your_writes_window=5,
+                 the_time=time.monotonic, subdomain_change_listeners=()):
+        if webshop_query not in (self.WEBSHOP_QUERY_SINGLE, self.WEBSHOP_QUERY_MULTI):
+            raise ValueError('Invalid webshop query mode "{}"'.format(webshop_query))
+
         self._the_clock = the_clock
         self._sql_engine = sql_engine
+        if compiled_cache is not None:
+            self._sql_engine = sql_engine.execution_options(compiled_cache=compiled_cache)
+        self._replica_engines = list(replica_engines)
+        if compiled_cache is not None:
+            self._replica_engines = [
+                e.execution_options(compiled_cache=compiled_cache) for e in self._replica_engines]
+        # Reads on behalf of a user, or of an org, who wrote within the window go to the primary,
+        # so that they see their own changes however far behind the replicas are. This only covers
+        # writes made through this process. Clients carry their own pin across processes, which
+        # start_request and finish_request deal with.
+        self._read_your_writes_window = read_your_writes_window
+        self._recent_writes = cache.LruCache(
+            max_size=self.RECENT_WRITES_SIZE, ttl=read_your_writes_window, the_time=the_time)
+        self._request = threading.local()
+        self._webshop_query = webshop_query
+        self._org_change_listeners = list(org_change_listeners)
+        self._subdomain_change_listeners = list(subdomain_change_listeners)
+        # A user's org never changes once created, so the mapping can be cached indefinitely.
+        self._org_id_cache = org_id_cache if org_id_cache is not None else cache.LruCache(0)
+        self._export_batch_size = export_batch_size
 
     def create_org(self, user_id, restaurant_name, restaurant_description, restaurant_keywords,
                    restaurant_address, restaurant_opening_hours, restaurant_image_set):
         right_now = self._the_clock.now()
-        
+        subdomain = slugify.slugify(restaurant_name)
+
         with self._sql_engine.begin() as conn:
             try:
-                create_org = _org \
-                    .insert() \
-                    .returning(*_org_columns) \
-                    .values(time_created=right_now)
-
-                result = conn.execute(create_org)
+                result = conn.execute(_create_org, time_created=right_now)
                 org_row = result.fetchone()
                 result.close()
 
-                create_org_user = _org_user \
-                    .insert() \
-                    .values(org_id=org_row['id'], user_id=user_id, time_created=right_now)
-
-                result = conn.execute(create_org_user)
+                result = conn.execute(
+                    _create_org_user,
+                    org_id=org_row['id'], user_id=user_id, time_created=right_now)
                 result.close()
 
-                create_restaurant = _restaurant \
-                    .insert() \
-                    .values(
-                        org_id=org_row['id'],
-                        time_created=right_now,
-                        name=restaurant_name,
-                        description=restaurant_description,
-                        keywords=restaurant_keywords,
-                        address=restaurant_address,
-                        opening_hours=restaurant_opening_hours,
-                        image_set=restaurant_image_set)
-
-                conn.execute(create_restaurant).close()
+                conn.execute(
+                    _create_restaurant,
+                    org_id=org_row['id'],
+                    time_created=right_now,
+                    time_updated=right_now,
+                    content_version=org_row['content_version'],
+                    name=restaurant_name,
+                    description=restaurant_description,
+                    keywords=restaurant_keywords,
+                    address=restaurant_address,
+                    opening_hours=restaurant_opening_hours,
+                    image_set=restaurant_image_set).close()
 
                 # Create basic platforms with basic info
 
-                create_platforms_website = _platforms_website \
-                    .insert() \
-                    .values(
-                        org_id=org_row['id'],
-                        time_created=right_now,
-                        subdomain=slugify.slugify(restaurant_name))
-
-                conn.execute(create_platforms_website).close()
-
-                create_platforms_callcenter = _platforms_callcenter \
-                    .insert() \
-                    .values(
-                        org_id=org_row['id'],
-                        time_created=right_now,
-                        phone_number='')
-
-                conn.execute(create_platforms_callcenter).close()
+                conn.execute(
+                    _create_platforms_website,
+                    org_id=org_row['id'],
+                    time_created=right_now,
+                    time_updated=right_now,
+                    content_version=org_row['content_version'],
+                    subdomain=subdomain).close()
 
-                create_platforms_emailcenter = _platforms_emailcenter \
-                    .insert() \
-                    .values(
-                        org_id=org_row['id'],
-                        time_created=right_now,
-                        email_name='contact')
+                conn.execute(
+                    _create_platforms_callcenter,
+                    org_id=org_row['id'],
+                    time_created=right_now,
+                    time_updated=right_now,
+                    content_version=org_row['content_version'],
+                    phone_number='').close()
 
-                conn.execute(create_platforms_emailcenter).close()
+                conn.execute(
+                    _create_platforms_emailcenter,
+                    org_id=org_row['id'],
+                    time_created=right_now,
+                    time_updated=right_now,
+                    content_version=org_row['content_version'],
+                    email_name='contact').close()
             except sql.exc.IntegrityError as e:
                 raise OrgAlreadyExistsError() from e
 
-        return _i2e(org_row)
+        self._org_id_cache.put(user_id, org_row['id'])
+        self._pin_to_primary(user_id, org_row['id'], subdomain)
+        self._notify_org_changed(org_row['id'])
+        self._notify_subdomain_changed(org_row['id'], subdomain)
+
+        return _org_serializer(org_row)
 
     def get_org(self, user_id):
-        with self._sql_engine.begin() as conn:
-            fetch_org = self._fetch_org(user_id)
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(fetch_org)
+            result = conn.execute(_fetch_org, org_id=org_id)
             org_row = result.fetchone()
             result.close()
 
             if org_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(org_row)
+        return _org_serializer(org_row)
 
 
-    def get_restaurant(self, user_id):
-        with self._sql_engine.begin() as conn:
-            fetch_restaurant = self._fetch_restaurant(user_id)
+    def get_restaurant(self, user_id, fields=None):
+        statement, serializer = _project(
+            _fetch_restaurant, _restaurant_serializer, _restaurant_columns, fields)
+
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(fetch_restaurant)
+            result = conn.execute(statement, org_id=org_id)
             restaurant_row = result.fetchone()
             result.close()
 
             if restaurant_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(restaurant_row)
+        return serializer(restaurant_row)
 
     def update_restaurant(self, user_id, **kwargs):
+        right_now = self._the_clock.now()
+
         with self._sql_engine.begin() as conn:
-            fetch_restaurant = self._fetch_restaurant(user_id, just_id=True)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            update_restaurant = _restaurant \
-                .update() \
-                .returning(*_restaurant_columns) \
-                .where(_restaurant.c.id == fetch_restaurant.as_scalar()) \
-                .values(**_e2i(kwargs))
+            content_version = self._bump_content_version(conn, org_id)
 
-            result = conn.execute(update_restaurant)
+            result = conn.execute(_update_restaurant, dict(
+                    _e2i(kwargs), time_updated=right_now, content_version=content_version,
+                    where_org_id=org_id))
             restaurant_row = result.fetchone()
             result.close()
 
             if restaurant_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(restaurant_row)
+        self._pin_to_primary(user_id, restaurant_row['org_id'])
+        self._notify_org_changed(restaurant_row['org_id'])
+
+        return _restaurant_serializer(restaurant_row)
 
     def create_menu_section(self, user_id, name, description):
         right_now = self._the_clock.now()
-        
+
         with self._sql_engine.begin() as conn:
-            fetch_org = self._fetch_org(user_id, just_id=True)
-            
-            create_menu_section = _menu_section \
-                .insert() \
-                .returning(*_menu_section_columns) \
-                .values(
-                    org_id=fetch_org.as_scalar(),
-                    time_created=right_now,
-                    name=name,
-                    description=description)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(create_menu_section)
+            content_version = self._bump_content_version(conn, org_id)
+
+            result = conn.execute(
+                _create_menu_section,
+                org_id=org_id,
+                time_created=right_now,
+                time_updated=right_now,
+                content_version=content_version,
+                name=name,
+                description=description)
             menu_section_row = result.fetchone()
             result.close()
 
             if menu_section_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(menu_section_row)
+        self._pin_to_primary(user_id, menu_section_row['org_id'])
+        self._notify_org_changed(menu_section_row['org_id'])
 
-    def get_all_menu_sections(self, user_id):
-        with self._sql_engine.begin() as conn:
-            fetch_menu_sections = sql \
-                .select(_menu_section_columns) \
-                .select_from(_org_user
-                             .join(_org, _org.c.id == _org_user.c.org_id)
-                             .join(_menu_section, _menu_section.c.org_id == _org_user.c.org_id)) \
-                .where(sql.and_(
-                    _org_user.c.user_id == user_id,
-                    _menu_section.c.time_archived == None))
-
-            result = conn.execute(fetch_menu_sections)
+        return _menu_section_serializer(menu_section_row)
+
+    def get_all_menu_sections(self, user_id, fields=None):
+        statement, serializer = _project(
+            _fetch_menu_sections, _menu_section_serializer, _menu_section_columns, fields)
+
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                return []
+
+            result = conn.execute(statement, org_id=org_id)
             menu_sections_rows = result.fetchall()
             result.close()
 
-        return [_i2e(s) for s in menu_sections_rows]
+        return [serializer(s) for s in menu_sections_rows]
+
+    def get_menu_sections_page(self, user_id, limit, after_id=0, fields=None):
+        """Get at most limit menu sections with ids greater than after_id, in id order.
+
+        Returns the sections and the id to continue after, or None if this is the last page.
+        """
+
+        statement, serializer = _project(
+            _fetch_menu_sections_page, _menu_section_serializer, _menu_section_columns, fields)
+        return self._get_page(statement, serializer, user_id, limit, after_id)
 
     def get_menu_section(self, user_id, section_id):
-        with self._sql_engine.begin() as conn:
-            fetch_menu_section = self._fetch_menu_section(user_id, section_id)
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise MenuSectionDoesNotExistError()
 
-            result = conn.execute(fetch_menu_section)
+            result = conn.execute(_fetch_menu_section, org_id=org_id, section_id=section_id)
             menu_section_row = result.fetchone()
             result.close()
 
             if menu_section_row is None:
                 raise MenuSectionDoesNotExistError()
 
-            fetch_menu_items = self._fetch_menu_items_for_section(user_id, section_id)
-
-            result = conn.execute(fetch_menu_items)
+            result = conn.execute(
+                _fetch_menu_items_for_section, org_id=org_id, section_id=section_id)
             menu_items_rows = result.fetchall()
             result.close()
 
-        menu_section = _i2e(menu_section_row)
-        menu_section['items'] = {str(mi['id']):_i2e(mi) for mi in menu_items_rows}
+        menu_section = _menu_section_serializer(menu_section_row)
+        menu_section['items'] = {str(mi['id']):_menu_item_serializer(mi) for mi in menu_items_rows}
 
         return menu_section
 
     def update_menu_section(self, user_id, section_id, **kwargs):
+        right_now = self._the_clock.now()
+
         with self._sql_engine.begin() as conn:
-            fetch_menu_section = self._fetch_menu_section(user_id, section_id, True)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise MenuSectionDoesNotExistError()
 
-            update_menu_section = _menu_section \
-                .update() \
-                .returning(*_menu_section_columns) \
-                .values(**_e2i(kwargs)) \
-                .where(_menu_section.c.id == fetch_menu_section.as_scalar())
+            content_version = self._bump_content_version(conn, org_id)
 
-            result = conn.execute(update_menu_section)
+            result = conn.execute(
+                _update_menu_section,
+                dict(
+                    _e2i(kwargs), time_updated=right_now, content_version=content_version,
+                    where_org_id=org_id, where_id=section_id))
             menu_section_row = result.fetchone()
             result.close()
 
             if menu_section_row is None:
                 raise MenuSectionDoesNotExistError()
 
-            fetch_menu_items = self._fetch_menu_items_for_section(user_id, section_id)
-
-            result = conn.execute(fetch_menu_items)
+            result = conn.execute(
+                _fetch_menu_items_for_section, org_id=org_id, section_id=section_id)
             menu_items_rows = result.fetchall()
             result.close()
 
-        menu_section = _i2e(menu_section_row)
-        menu_section['items'] = {str(mi['id']):_i2e(mi) for mi in menu_items_rows}
+        self._pin_to_primary(user_id, menu_section_row['org_id'])
+        self._notify_org_changed(menu_section_row['org_id'])
+
+        menu_section = _menu_section_serializer(menu_section_row)
+        menu_section['items'] = {str(mi['id']):_menu_item_serializer(mi) for mi in menu_items_rows}
 
         return menu_section
 
@@ -331,51 +853,54 @@ class Model(object):
         right_now = self._the_clock.now()
 
         with self._sql_engine.begin() as conn:
-            fetch_menu_section = self._fetch_menu_section(user_id, section_id, True)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise MenuSectionDoesNotExistError()
 
-            update_menu_section = _menu_section \
-                .update() \
-                .values(time_archived=right_now) \
-                .where(_menu_section.c.id == fetch_menu_section.as_scalar())
+            content_version = self._bump_content_version(conn, org_id)
 
-            result = conn.execute(update_menu_section)
-            rowcount = result.rowcount
+            result = conn.execute(
+                _archive_menu_section,
+                time_archived=right_now, time_updated=right_now, content_version=content_version,
+                where_org_id=org_id, where_id=section_id)
+            menu_section_row = result.fetchone()
             result.close()
 
-            if rowcount != 1:
+            if menu_section_row is None:
                 raise MenuSectionDoesNotExistError()
 
-            fetch_menu_items = self._fetch_menu_items_for_section(user_id, section_id, True)
-
-            update_menu_items = _menu_item \
-                .update() \
-                .values(time_archived=right_now) \
-                .where(_menu_item.c.id.in_(fetch_menu_items))
-
-            result = conn.execute(update_menu_items)
+            result = conn.execute(
+                _archive_menu_items_for_section,
+                time_archived=right_now, time_updated=right_now, content_version=content_version,
+                where_org_id=org_id, where_section_id=section_id)
             result.close()
 
+        self._pin_to_primary(user_id, menu_section_row['org_id'])
+        self._notify_org_changed(menu_section_row['org_id'])
+
     def create_menu_item(self, user_id, section_id, name, description, keywords,
                          ingredients, image_set):
         right_now = self._the_clock.now()
-        
+
         with self._sql_engine.begin() as conn:
-            fetch_org = self._fetch_org(user_id, just_id=True)
-            
-            create_menu_item = _menu_item \
-                .insert() \
-                .returning(*_menu_item_columns) \
-                .values(
-                    org_id=fetch_org.as_scalar(),
-                    section_id=section_id,
-                    time_created=right_now,
-                    name=name,
-                    description=description,
-                    keywords=keywords,
-                    ingredients=ingredients,
-                    image_set=image_set)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(create_menu_item)
+            content_version = self._bump_content_version(conn, org_id)
+
+            result = conn.execute(
+                _create_menu_item,
+                org_id=org_id,
+                section_id=section_id,
+                time_created=right_now,
+                time_updated=right_now,
+                content_version=content_version,
+                name=name,
+                description=description,
+                keywords=keywords,
+                ingredients=ingredients,
+                image_set=image_set)
             menu_item_row = result.fetchone()
             result.close()
 
@@ -383,261 +908,626 @@ class Model(object):
                 # Or section does not exist
                 raise OrgDoesNotExistError()
 
-        return _i2e(menu_item_row)
+        self._pin_to_primary(user_id, menu_item_row['org_id'])
+        self._notify_org_changed(menu_item_row['org_id'])
+
+        return _menu_item_serializer(menu_item_row)
+
+    def create_menu_items(self, user_id, menu_items):
+        """Create several menu items, possibly across sections, in a single statement."""
+
+        right_now = self._the_clock.now()
 
-    def get_all_menu_items(self, user_id):
         with self._sql_engine.begin() as conn:
-            fetch_menu_items = sql \
-                .select(_menu_item_columns) \
-                .select_from(_org_user
-                             .join(_org, _org.c.id == _org_user.c.org_id)
-                             .join(_menu_item, _menu_item.c.org_id == _org_user.c.org_id)) \
-                .where(sql.and_(
-                    _org_user.c.user_id == user_id,
-                    _menu_item.c.time_archived == None))
-
-            result = conn.execute(fetch_menu_items)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
+
+            content_version = self._bump_content_version(conn, org_id)
+
+            section_ids = {mi['sectionId'] for mi in menu_items}
+
+            result = conn.execute(
+                _fetch_menu_section_ids, org_id=org_id, section_ids=list(section_ids))
+            existing_section_ids = {row['id'] for row in result.fetchall()}
+            result.close()
+
+            if existing_section_ids != section_ids:
+                raise MenuSectionDoesNotExistError()
+
+            create_menu_items = _create_menu_item.values([
+                dict(
+                    _e2i(mi), org_id=org_id, time_created=right_now, time_updated=right_now,
+                    content_version=content_version) for mi in menu_items])
+
+            result = conn.execute(create_menu_items)
             menu_items_rows = result.fetchall()
             result.close()
 
-        return [_i2e(s) for s in menu_items_rows]
+        self._pin_to_primary(user_id, org_id)
+        self._notify_org_changed(org_id)
+
+        # Ids come from a sequence, so they are in the order the items were given in.
+        menu_items_rows = sorted(menu_items_rows, key=lambda mi: mi['id'])
+
+        return [_menu_item_serializer(mi) for mi in menu_items_rows]
+
+    def import_menu(self, user_id, menu_sections):
+        """Create several menu sections, each with its menu items, in a single transaction.
+
+        Sections are inserted with one statement and then items with another, whatever their
+        number, and the content version is bumped just once for the whole import.
+        """
+
+        right_now = self._the_clock.now()
 
-    def get_menu_item(self, user_id, item_id):
         with self._sql_engine.begin() as conn:
-            fetch_menu_item = self._fetch_menu_item(user_id, item_id)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
+
+            content_version = self._bump_content_version(conn, org_id)
+
+            create_menu_sections = _create_menu_section.values([{
+                'org_id': org_id,
+                'time_created': right_now,
+                'time_updated': right_now,
+                'content_version': content_version,
+                'name': ms['name'],
+                'description': ms['description']
+            } for ms in menu_sections])
+
+            result = conn.execute(create_menu_sections)
+            # Ids come from a sequence, so they are in the order the sections were given in.
+            menu_sections_rows = sorted(result.fetchall(), key=lambda ms: ms['id'])
+            result.close()
+
+            menu_items = []
+            for menu_section_row, menu_section in zip(menu_sections_rows, menu_sections):
+                for mi in menu_section['items']:
+                    menu_items.append(dict(
+                        _e2i(mi), org_id=org_id, section_id=menu_section_row['id'],
+                        time_created=right_now, time_updated=right_now,
+                        content_version=content_version))
+
+            menu_items_rows = []
+            if len(menu_items) > 0:
+                result = conn.execute(_import_menu_items.values(menu_items))
+                menu_items_rows = sorted(result.fetchall(), key=lambda mi: mi['id'])
+                result.close()
+
+        self._pin_to_primary(user_id, org_id)
+        self._notify_org_changed(org_id)
+
+        imported_menu_sections = []
+        imported_menu_sections_by_id = {}
+        for ms in menu_sections_rows:
+            menu_section = _menu_section_serializer(ms)
+            menu_section['items'] = {}
+            imported_menu_sections.append(menu_section)
+            imported_menu_sections_by_id[ms['id']] = menu_section
+
+        for mi in menu_items_rows:
+            imported_menu_sections_by_id[mi['section_id']]['items'][str(mi['id'])] = \
+                _menu_item_serializer(mi)
+
+        return imported_menu_sections
+
+    def export_menu(self, user_id):
+        """Export all the menu sections and then all the menu items of an org.
+
+        The org is resolved straight away, but the rows are read lazily, from a server-side cursor
+        and a batch at a time, by the returned iterator. It produces a list per batch, holding a
+        {'menuSection': ...} or {'menuItem': ...} dict per row. Both queries run in the same
+        repeatable read transaction, which lasts until the iterator is exhausted or closed.
+        """
+
+        read_engine = self._read_engine(user_id)
+
+        with read_engine.begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+
+        if org_id is None:
+            raise OrgDoesNotExistError()
+
+        return self._export_menu(read_engine, org_id)
+
+    def _export_menu(self, read_engine, org_id):
+        conn = read_engine.connect().execution_options(
+            stream_results=True, isolation_level='REPEATABLE READ')
+
+        try:
+            with conn.begin():
+                exports = [
+                    (_export_menu_sections, 'menuSection', _menu_section_serializer),
+                    (_export_menu_items, 'menuItem', _menu_item_with_section_id_serializer)]
+
+                for statement, key, serializer in exports:
+                    result = conn.execute(statement, org_id=org_id)
+                    try:
+                        while True:
+                            rows = result.fetchmany(self._export_batch_size)
+                            if len(rows) == 0:
+                                break
+                            yield [{key: serializer(row)} for row in rows]
+                    finally:
+                        result.close()
+        finally:
+            conn.close()
+
+    def get_all_menu_items(self, user_id, fields=None):
+        statement, serializer = _project(
+            _fetch_menu_items, _menu_item_serializer, _menu_item_columns, fields)
+
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                return []
+
+            result = conn.execute(statement, org_id=org_id)
+            menu_items_rows = result.fetchall()
+            result.close()
+
+        return [serializer(s) for s in menu_items_rows]
+
+    def get_menu_items_page(self, user_id, limit, after_id=0, fields=None):
+        """Get at most limit menu items with ids greater than after_id, in id order.
+
+        Returns the items and the id to continue after, or None if this is the last page.
+        """
+
+        statement, serializer = _project(
+            _fetch_menu_items_page, _menu_item_serializer, _menu_item_columns, fields)
+        return self._get_page(statement, serializer, user_id, limit, after_id)
+
+    def search_menu_items(self, user_id, terms, limit, offset=0, fields=None):
+        """Find the menu items which match all the terms, best matches first.
+
+        Every term matches as a prefix of a word, so partially typed queries find results too.
+        Returns a page of at most limit items, starting offset items in, and the offset of the next
+        page, or None if this is the last one.
+        """
+
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                return [], None
+
+            return self._search_menu_items(conn, org_id, terms, limit, offset, fields)
+
+    def search_webshop_menu_items(self, subdomain, terms, limit, offset=0, fields=None):
+        """As search_menu_items, for the org behind a webshop."""
+
+        _, _, menu_items, next_offset = self.search_webshop_menu_items_with_version(
+            subdomain, terms, limit, offset, fields)
+        return menu_items, next_offset
+
+    def search_webshop_menu_items_with_version(self, subdomain, terms, limit, offset=0,
+                                               fields=None):
+        """As search_webshop_menu_items, also returning the org id and content version first."""
+
+        def search(read_engine, subdomain):
+            with read_engine.begin() as conn:
+                result = conn.execute(_fetch_org_by_subdomain, subdomain=subdomain)
+                org_row = result.fetchone()
+                result.close()
+
+                if org_row is None:
+                    raise OrgDoesNotExistError()
+
+                menu_items, next_offset = self._search_menu_items(
+                    conn, org_row['id'], terms, limit, offset, fields)
+
+            return org_row['id'], org_row['content_version'], menu_items, next_offset
+
+        return self._read_webshop(search, subdomain)
+
+    def get_menu_item(self, user_id, item_id, fields=None):
+        statement, serializer = _project(
+            _fetch_menu_item, _menu_item_serializer, _menu_item_columns, fields)
+
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise MenuItemDoesNotExistError()
 
-            result = conn.execute(fetch_menu_item)
+            result = conn.execute(statement, org_id=org_id, item_id=item_id)
             menu_item_row = result.fetchone()
             result.close()
 
             if menu_item_row is None:
                 raise MenuItemDoesNotExistError()
 
-        return _i2e(menu_item_row)
+        return serializer(menu_item_row)
 
     def update_menu_item(self, user_id, item_id, **kwargs):
+        right_now = self._the_clock.now()
+
         with self._sql_engine.begin() as conn:
-            find_menu_item = self._fetch_menu_item(user_id, item_id, True)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise MenuItemDoesNotExistError()
 
-            update_menu_item = _menu_item \
-                .update() \
-                .returning(*_menu_item_columns) \
-                .values(**_e2i(kwargs)) \
-                .where(_menu_item.c.id == find_menu_item.as_scalar())
+            content_version = self._bump_content_version(conn, org_id)
 
-            result = conn.execute(update_menu_item)
+            result = conn.execute(
+                _update_menu_item, dict(
+                    _e2i(kwargs), time_updated=right_now, content_version=content_version,
+                    where_org_id=org_id, where_id=item_id))
             menu_item_row = result.fetchone()
             result.close()
 
             if menu_item_row is None:
                 raise MenuItemDoesNotExistError()
 
-        return _i2e(menu_item_row)
+        self._pin_to_primary(user_id, menu_item_row['org_id'])
+        self._notify_org_changed(menu_item_row['org_id'])
+
+        return _menu_item_serializer(menu_item_row)
 
     def delete_menu_item(self, user_id, item_id):
         right_now = self._the_clock.now()
 
         with self._sql_engine.begin() as conn:
-            find_menu_item = self._fetch_menu_item(user_id, item_id, True)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise MenuItemDoesNotExistError()
 
-            update_menu_item = _menu_item \
-                .update() \
-                .values(time_archived=right_now) \
-                .where(_menu_item.c.id == find_menu_item.as_scalar())
+            content_version = self._bump_content_version(conn, org_id)
 
-            result = conn.execute(update_menu_item)
-            rowcount = result.rowcount
+            result = conn.execute(
+                _archive_menu_item,
+                time_archived=right_now, time_updated=right_now, content_version=content_version,
+                where_org_id=org_id, where_id=item_id)
+            menu_item_row = result.fetchone()
             result.close()
 
-            if rowcount != 1:
+            if menu_item_row is None:
                 raise MenuItemDoesNotExistError()
 
+        self._pin_to_primary(user_id, menu_item_row['org_id'])
+        self._notify_org_changed(menu_item_row['org_id'])
+
     def get_platforms_website(self, user_id):
-        with self._sql_engine.begin() as conn:
-            fetch_platforms_website = self._fetch_platforms_website(user_id)
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(fetch_platforms_website)
+            result = conn.execute(_fetch_platforms_website, org_id=org_id)
             platforms_website_row = result.fetchone()
             result.close()
 
             if platforms_website_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(platforms_website_row)
+        return _platforms_website_serializer(platforms_website_row)
 
     def update_platforms_website(self, user_id, **kwargs):
+        right_now = self._the_clock.now()
+
         with self._sql_engine.begin() as conn:
-            find_platforms_website_id = self._fetch_platforms_website(user_id, True)
-            
-            update_platforms_website = _platforms_website \
-                .update() \
-                .returning(*_platforms_website_columns) \
-                .values(**_e2i(kwargs)) \
-                .where(_platforms_website.c.id == find_platforms_website_id.as_scalar())
-
-            result = conn.execute(update_platforms_website)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
+
+            content_version = self._bump_content_version(conn, org_id)
+
+            result = conn.execute(
+                _update_platforms_website, dict(
+                    _e2i(kwargs), time_updated=right_now, content_version=content_version,
+                    where_org_id=org_id))
             platforms_website_row = result.fetchone()
             result.close()
-            
+
             if platforms_website_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(platforms_website_row)
+        self._pin_to_primary(
+            user_id, platforms_website_row['org_id'], platforms_website_row['subdomain'])
+        self._notify_org_changed(platforms_website_row['org_id'])
+        self._notify_subdomain_changed(
+            platforms_website_row['org_id'], platforms_website_row['subdomain'])
+
+        return _platforms_website_serializer(platforms_website_row)
 
     def get_platforms_callcenter(self, user_id):
-        with self._sql_engine.begin() as conn:
-            fetch_platforms_callcenter = self._fetch_platforms_callcenter(user_id)
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(fetch_platforms_callcenter)
+            result = conn.execute(_fetch_platforms_callcenter, org_id=org_id)
             platforms_callcenter_row = result.fetchone()
             result.close()
 
             if platforms_callcenter_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(platforms_callcenter_row)
+        return _platforms_callcenter_serializer(platforms_callcenter_row)
 
     def update_platforms_callcenter(self, user_id, **kwargs):
+        right_now = self._the_clock.now()
+
         with self._sql_engine.begin() as conn:
-            find_platforms_callcenter_id = self._fetch_platforms_callcenter(user_id, True)
-            
-            update_platforms_callcenter = _platforms_callcenter \
-                .update() \
-                .returning(*_platforms_callcenter_columns) \
-                .values(**_e2i(kwargs)) \
-                .where(_platforms_callcenter.c.id == find_platforms_callcenter_id.as_scalar())
-
-            result = conn.execute(update_platforms_callcenter)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
+
+            content_version = self._bump_content_version(conn, org_id)
+
+            result = conn.execute(
+                _update_platforms_callcenter, dict(
+                    _e2i(kwargs), time_updated=right_now, content_version=content_version,
+                    where_org_id=org_id))
             platforms_callcenter_row = result.fetchone()
             result.close()
-            
+
             if platforms_callcenter_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(platforms_callcenter_row)
+        self._pin_to_primary(user_id, platforms_callcenter_row['org_id'])
+        self._notify_org_changed(platforms_callcenter_row['org_id'])
+
+        return _platforms_callcenter_serializer(platforms_callcenter_row)
 
     def get_platforms_emailcenter(self, user_id):
-        with self._sql_engine.begin() as conn:
-            fetch_platforms_emailcenter = self._fetch_platforms_emailcenter(user_id)
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
 
-            result = conn.execute(fetch_platforms_emailcenter)
+            result = conn.execute(_fetch_platforms_emailcenter, org_id=org_id)
             platforms_emailcenter_row = result.fetchone()
             result.close()
 
             if platforms_emailcenter_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(platforms_emailcenter_row)
+        return _platforms_emailcenter_serializer(platforms_emailcenter_row)
 
     def update_platforms_emailcenter(self, user_id, **kwargs):
+        right_now = self._the_clock.now()
+
         with self._sql_engine.begin() as conn:
-            find_platforms_emailcenter_id = self._fetch_platforms_emailcenter(user_id, True)
-            
-            update_platforms_emailcenter = _platforms_emailcenter \
-                .update() \
-                .returning(*_platforms_emailcenter_columns) \
-                .values(**_e2i(kwargs)) \
-                .where(_platforms_emailcenter.c.id == find_platforms_emailcenter_id.as_scalar())
-
-            result = conn.execute(update_platforms_emailcenter)
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
+
+            content_version = self._bump_content_version(conn, org_id)
+
+            result = conn.execute(
+                _update_platforms_emailcenter, dict(
+                    _e2i(kwargs), time_updated=right_now, content_version=content_version,
+                    where_org_id=org_id))
             platforms_emailcenter_row = result.fetchone()
             result.close()
-            
+
             if platforms_emailcenter_row is None:
                 raise OrgDoesNotExistError()
 
-        return _i2e(platforms_emailcenter_row)
+        self._pin_to_primary(user_id, platforms_emailcenter_row['org_id'])
+        self._notify_org_changed(platforms_emailcenter_row['org_id'])
+
+        return _platforms_emailcenter_serializer(platforms_emailcenter_row)
+
+    def get_org_content_version(self, user_id):
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                raise OrgDoesNotExistError()
+
+            result = conn.execute(_fetch_org_content_version, org_id=org_id)
+            org_row = result.fetchone()
+            result.close()
+
+            if org_row is None:
+                raise OrgDoesNotExistError()
+
+        return org_row['id'], org_row['content_version']
+
+    def get_webshop_routes(self):
+        """The subdomain and org id of every webshop, as (subdomain, org_id) pairs."""
+
+        with self._replica_engine().begin() as conn:
+            result = conn.execute(_fetch_webshop_routes)
+            routes = [(row['subdomain'], row['org_id']) for row in result]
+            result.close()
+
+        return routes
+
+    def get_webshop_content_version(self, subdomain):
+        return self._read_webshop(self._get_webshop_content_version, subdomain)
+
+    def _get_webshop_content_version(self, read_engine, subdomain):
+        with read_engine.begin() as conn:
+            result = conn.execute(_fetch_webshop_content_version, subdomain=subdomain)
+            org_row = result.fetchone()
+            result.close()
+
+            if org_row is None:
+                raise OrgDoesNotExistError()
+
+        return org_row['id'], org_row['content_version']
 
     def get_webshop_info(self, subdomain):
+        _, _, webshop_info = self.get_webshop_info_with_version(subdomain)
+        return webshop_info
+
+    def get_webshop_info_with_version(self, subdomain):
+        if self._webshop_query == self.WEBSHOP_QUERY_SINGLE:
+            return self._read_webshop(self._get_webshop_info_single_query, subdomain)
+        else:
+            return self._read_webshop(self._get_webshop_info_multi_query, subdomain)
+
+    def get_webshop_changes(self, subdomain, since):
+        """The webshop data which changed after content version since, archived data included.
+
+        Returns the org id, the current content version, to be given as since next time, and the
+        changes. The restaurant and the platforms are None when they did not change.
+        """
+
+        def read_changes(read_engine, subdomain):
+            # A single snapshot, so the changes are exactly those up to the returned version.
+            conn = read_engine.connect().execution_options(isolation_level='REPEATABLE READ')
+
+            try:
+                with conn.begin():
+                    result = conn.execute(_fetch_org_by_subdomain, subdomain=subdomain)
+                    org_row = result.fetchone()
+                    result.close()
+
+                    if org_row is None:
+                        raise OrgDoesNotExistError()
+
+                    changes = {}
+                    for statement, key, serializer, single in [
+                            (_fetch_restaurant_changes, 'restaurant',
+                             _restaurant_change_serializer, True),
+                            (_fetch_menu_section_changes, 'menuSections',
+                             _menu_section_change_serializer, False),
+                            (_fetch_menu_item_changes, 'menuItems',
+                             _menu_item_change_serializer, False),
+                            (_fetch_platforms_website_changes, 'website',
+                             _platforms_website_change_serializer, True),
+                            (_fetch_platforms_callcenter_changes, 'callcenter',
+                             _platforms_callcenter_change_serializer, True),
+                            (_fetch_platforms_emailcenter_changes, 'emailcenter',
+                             _platforms_emailcenter_change_serializer, True)]:
+                        result = conn.execute(statement, org_id=org_row['id'], since=since)
+                        rows = result.fetchall()
+                        result.close()
+
+                        if single:
+                            changes[key] = serializer(rows[0]) if len(rows) > 0 else None
+                        else:
+                            changes[key] = [serializer(row) for row in rows]
+            finally:
+                conn.close()
+
+            webshop_changes = {
+                'contentVersion': org_row['content_version'],
+                'restaurant': changes['restaurant'],
+                'menuSections': changes['menuSections'],
+                'menuItems': changes['menuItems'],
+                'platforms': {
+                    'website': changes['website'],
+                    'callcenter': changes['callcenter'],
+                    'emailcenter': changes['emailcenter']
+                }
+            }
+
+            return org_row['id'], org_row['content_version'], webshop_changes
+
+        return self._read_webshop(read_changes, subdomain)
+
+    def get_org_webshop_info_with_version(self, org_id):
+        """As get_webshop_info_with_version, for an org, returning its subdomain instead of its id.
+
+        It always reads from the primary, so it sees every write committed before it started.
+        """
+
         with self._sql_engine.begin() as conn:
-            # TODO(horia141): Filter for archivedness etc.
-            fetch_org_by_subdomain = sql \
-                .select(_org_columns) \
-                .select_from(_org.join(_platforms_website, _org.c.id == _platforms_website.c.org_id)) \
-                .where(_platforms_website.c.subdomain == subdomain)
+            result = conn.execute(_fetch_platforms_website, org_id=org_id)
+            platforms_website_row = result.fetchone()
+            result.close()
+
+        if platforms_website_row is None:
+            raise OrgDoesNotExistError()
 
-            result = conn.execute(fetch_org_by_subdomain)
+        subdomain = platforms_website_row['subdomain']
+
+        if self._webshop_query == self.WEBSHOP_QUERY_SINGLE:
+            webshop_org_id, content_version, webshop_info = \
+                self._get_webshop_info_single_query(self._sql_engine, subdomain)
+        else:
+            webshop_org_id, content_version, webshop_info = \
+                self._get_webshop_info_multi_query(self._sql_engine, subdomain)
+
+        # The org moved to another subdomain in between, and another org took this one.
+        if webshop_org_id != org_id:
+            raise OrgDoesNotExistError()
+
+        return subdomain, content_version, webshop_info
+
+    def _get_webshop_info_single_query(self, read_engine, subdomain):
+        with read_engine.begin() as conn:
+            result = conn.execute(_fetch_webshop_info, subdomain=subdomain)
+            webshop_info_row = result.fetchone()
+            result.close()
+
+        if webshop_info_row is None or \
+           webshop_info_row['general'] is None or \
+           webshop_info_row['website'] is None or \
+           webshop_info_row['callcenter'] is None or \
+           webshop_info_row['emailcenter'] is None:
+            raise OrgDoesNotExistError()
+
+        webshop_info = {
+            'general': webshop_info_row['general'],
+            'menu': {'sections': webshop_info_row['sections'] or {}},
+            'platforms': {
+                'website': webshop_info_row['website'],
+                'callcenter': webshop_info_row['callcenter'],
+                'emailcenter': webshop_info_row['emailcenter']
+            }
+        }
+
+        return webshop_info_row['org_id'], webshop_info_row['content_version'], webshop_info
+
+    def _get_webshop_info_multi_query(self, read_engine, subdomain):
+        with read_engine.begin() as conn:
+            result = conn.execute(_fetch_org_by_subdomain, subdomain=subdomain)
             org_row = result.fetchone()
             result.close()
 
             if org_row is None:
                 raise OrgDoesNotExistError()
 
-            fetch_restaurant = sql \
-                .select(_restaurant_columns) \
-                .select_from(_restaurant) \
-                .where(_restaurant.c.org_id == org_row['id'])
-
-            result = conn.execute(fetch_restaurant)
+            result = conn.execute(_fetch_restaurant, org_id=org_row['id'])
             restaurant_row = result.fetchone()
             result.close()
 
             if restaurant_row is None:
                 raise OrgDoesNotExistError()
 
-            fetch_menu_sections = sql \
-                .select(_menu_section_columns) \
-                .select_from(_menu_section) \
-                .where(_menu_section.c.org_id == org_row['id'])
-
-            result = conn.execute(fetch_menu_sections)
+            result = conn.execute(_fetch_menu_sections, org_id=org_row['id'])
             menu_section_rows = result.fetchall()
             result.close()
 
-            fetch_menu_items = sql \
-                .select(_menu_item_columns + [_menu_item.c.section_id]) \
-                .select_from(_menu_item) \
-                .where(_menu_item.c.org_id == org_row['id'])
-
-            result = conn.execute(fetch_menu_items)
+            result = conn.execute(_fetch_menu_items_with_section_id, org_id=org_row['id'])
             menu_item_rows = result.fetchall()
             result.close()
 
-            fetch_platforms_website = sql \
-                .select(_platforms_website_columns) \
-                .select_from(_platforms_website) \
-                .where(_platforms_website.c.org_id == org_row['id'])
-
-            result = conn.execute(fetch_platforms_website)
+            result = conn.execute(_fetch_platforms_website, org_id=org_row['id'])
             platforms_website_row = result.fetchone()
             result.close()
 
             if platforms_website_row is None:
                 raise OrgDoesNotExistError()
 
-            fetch_platforms_callcenter = sql \
-                .select(_platforms_callcenter_columns) \
-                .select_from(_platforms_callcenter) \
-                .where(_platforms_callcenter.c.org_id == org_row['id'])
-
-            result = conn.execute(fetch_platforms_callcenter)
+            result = conn.execute(_fetch_platforms_callcenter, org_id=org_row['id'])
             platforms_callcenter_row = result.fetchone()
             result.close()
 
-            fetch_platforms_emailcenter = sql \
-                .select(_platforms_emailcenter_columns) \
-                .select_from(_platforms_emailcenter) \
-                .where(_platforms_emailcenter.c.org_id == org_row['id'])
-
-            result = conn.execute(fetch_platforms_emailcenter)
+            result = conn.execute(_fetch_platforms_emailcenter, org_id=org_row['id'])
             platforms_emailcenter_row = result.fetchone()
             result.close()
 
             if platforms_emailcenter_row is None:
                 raise OrgDoesNotExistError()
 
-        restaurant = _i2e(restaurant_row)
-        menu_sections = {str(ms['id']):_i2e(ms) for ms in menu_section_rows}
-        menu_items = [_i2e(mi) for mi in menu_item_rows]
-        platforms_website = _i2e(platforms_website_row)
-        platforms_callcenter = _i2e(platforms_callcenter_row)
-        platforms_emailcenter = _i2e(platforms_emailcenter_row)
+        restaurant = _restaurant_serializer(restaurant_row)
+        menu_sections = {str(ms['id']):_menu_section_serializer(ms) for ms in menu_section_rows}
+        platforms_website = _platforms_website_serializer(platforms_website_row)
+        platforms_callcenter = _platforms_callcenter_serializer(platforms_callcenter_row)
+        platforms_emailcenter = _platforms_emailcenter_serializer(platforms_emailcenter_row)
 
         for ms in menu_sections.values():
             ms['items'] = {}
-        for mi in menu_items:
-            menu_sections[str(mi['sectionId'])]['items'][str(mi['id'])] = mi
-            del mi['sectionId']
+        for mi in menu_item_rows:
+            menu_sections[str(mi['section_id'])]['items'][str(mi['id'])] = \
+                _menu_item_serializer(mi)
 
         webshop_info = {
             'general': restaurant,
@@ -649,90 +1539,169 @@ class Model(object):
             }
         }
 
-        return webshop_info
+        return org_row['id'], org_row['content_version'], webshop_info
 
     @staticmethod
-    def _fetch_org(user_id, just_id=False):
-        return sql \
-            .select([_org.c.id] if just_id else _org_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)) \
-            .where(_org_user.c.user_id == user_id)
+    def _bump_content_version(conn, org_id):
+        """Moves the org to a new content version, and returns it.
 
-    @staticmethod
-    def _fetch_restaurant(user_id, just_id=False):
-        return sql \
-            .select([_restaurant.c.id] if just_id else _restaurant_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_restaurant, _restaurant.c.org_id == _org_user.c.org_id)) \
-            .where(_org_user.c.user_id == user_id)
+        This locks the org row until the transaction ends, so the writes to an org are serialized
+        and their content versions follow the order in which they commit. Writes call it first,
+        and stamp every row they change with the new version.
+        """
+        result = conn.execute(_bump_content_version, org_id=org_id)
+        content_version = result.scalar()
+        result.close()
+        return content_version
 
-    @staticmethod
-    def _fetch_menu_section(user_id, section_id, just_id=False):
-        return sql \
-            .select([_menu_section.c.id] if just_id else _menu_section_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_menu_section, _menu_section.c.org_id == _org_user.c.org_id)) \
-            .where(sql.and_(
-                _org_user.c.user_id == user_id,
-                _menu_section.c.id == section_id,
-                _menu_section.c.time_archived == None))
+    def add_org_change_listener(self, listener):
+        """Tell listener about org changes too, for listeners which need the model themselves."""
 
-    @staticmethod
-    def _fetch_menu_item(user_id, item_id, just_id=False):
-        return sql \
-            .select([_menu_item.c.id] if just_id else _menu_item_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_menu_item, _menu_item.c.org_id == _org_user.c.org_id)) \
-            .where(sql.and_(
-                _org_user.c.user_id == user_id,
-                _menu_item.c.id == item_id,
-                _menu_item.c.time_archived == None))
+        self._org_change_listeners.append(listener)
 
-    @staticmethod
-    def _fetch_menu_items_for_section(user_id, section_id, just_id=False):
-        return sql \
-            .select([_menu_item.c.id] if just_id else _menu_item_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_menu_item, _menu_item.c.org_id == _org_user.c.org_id)) \
-            .where(sql.and_(
-                _org_user.c.user_id == user_id,
-                _menu_item.c.section_id == section_id,
-                _menu_item.c.time_archived == None))
+    def start_request(self, pinned_until):
+        """Start handling a request in this thread, for a client pinned to the primary until then.
 
-    @staticmethod
-    def _fetch_platforms_website(user_id, just_id=False):
-        return sql \
-            .select([_platforms_website.c.id] if just_id else _platforms_website_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_platforms_website,
-                               _platforms_website.c.org_id == _org_user.c.org_id)) \
-            .where(_org_user.c.user_id == user_id)
+        pinned_until is a Unix time, as returned by finish_request for an earlier request of the
+        same client, or None. Times which are past, or further away than the read your writes
+        window, are ignored.
+        """
 
-    @staticmethod
-    def _fetch_platforms_callcenter(user_id, just_id=False):
-        return sql \
-            .select([_platforms_callcenter.c.id] if just_id else _platforms_callcenter_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_platforms_callcenter,
-                               _platforms_callcenter.c.org_id == _org_user.c.org_id)) \
-            .where(_org_user.c.user_id == user_id)
+        right_now = self._the_clock.now().timestamp()
+        if pinned_until is not None and \
+           not right_now < pinned_until <= right_now + self._read_your_writes_window:
+            pinned_until = None
+
+        self._request.pinned_until = pinned_until
+        self._request.wrote = False
+
+    def finish_request(self):
+        """Finish handling the request in this thread.
+
+        Returns the Unix time until which the client's reads should go to the primary, when the
+        request wrote anything, or None.
+        """
+
+        wrote = getattr(self._request, 'wrote', False)
+        self._request.pinned_until = None
+        self._request.wrote = False
+
+        if not wrote:
+            return None
+
+        return self._the_clock.now().timestamp() + self._read_your_writes_window
+
+    def _notify_org_changed(self, org_id):
+        for listener in self._org_change_listeners:
+            listener.on_org_changed(org_id)
+
+    def _notify_subdomain_changed(self, org_id, subdomain):
+        for listener in self._subdomain_change_listeners:
+            listener.on_subdomain_changed(org_id, subdomain)
+
+    def _pin_to_primary(self, user_id, org_id, subdomain=None):
+        self._recent_writes.put(('user', user_id), True)
+        self._recent_writes.put(('org', org_id), True)
+        if subdomain is not None:
+            self._recent_writes.put(('subdomain', subdomain), True)
+        self._request.wrote = True
+
+    def _pinned_request(self):
+        return getattr(self._request, 'pinned_until', None) is not None
+
+    def _read_engine(self, user_id):
+        """The engine for a read on behalf of a user: the primary if they wrote recently.
+
+        A user who has no org cached yet is only recognised by their own writes, whereas one who
+        has is also recognised by the writes of others to the same org.
+        """
+
+        if len(self._replica_engines) == 0 or self._pinned_request() or \
+           self._recent_writes.get(('user', user_id), False) or \
+           self._recent_writes.get(('org', self._org_id_cache.get(user_id)), False):
+            return self._sql_engine
+
+        return self._replica_engine()
+
+    def _replica_engine(self):
+        """Any of the replicas, or the primary when there are none."""
+
+        if len(self._replica_engines) == 0:
+            return self._sql_engine
+
+        return random.choice(self._replica_engines)
+
+    def _read_webshop(self, read, subdomain):
+        """Run read(engine, subdomain) against a replica, and again against the primary if needed.
+
+        Webshops are read by subdomain, so the org is only known once a replica has answered. When
+        it was changed recently the primary gets the final say. So it does when the replica knows
+        of no such webshop, but only for subdomains which were just created or renamed, so unknown
+        hosts cost a single read.
+        """
+
+        if len(self._replica_engines) == 0 or self._pinned_request():
+            return read(self._sql_engine, subdomain)
+
+        try:
+            webshop = read(self._replica_engine(), subdomain)
+        except OrgDoesNotExistError:
+            if not self._recent_writes.get(('subdomain', subdomain), False):
+                raise
+            return read(self._sql_engine, subdomain)
+
+        if self._recent_writes.get(('org', webshop[0]), False):
+            return read(self._sql_engine, subdomain)
+
+        return webshop
+
+    def _get_page(self, statement, serializer, user_id, limit, after_id):
+        with self._read_engine(user_id).begin() as conn:
+            org_id = self._resolve_org_id(conn, user_id)
+            if org_id is None:
+                return [], None
+
+            # One row past the page tells whether there is a next page, without a count.
+            result = conn.execute(statement, org_id=org_id, after_id=after_id, limit=limit + 1)
+            rows = result.fetchall()
+            result.close()
+
+        if len(rows) > limit:
+            return [serializer(r) for r in rows[:limit]], rows[limit - 1]['id']
+
+        return [serializer(r) for r in rows], None
 
     @staticmethod
-    def _fetch_platforms_emailcenter(user_id, just_id=False):
-        return sql \
-            .select([_platforms_emailcenter.c.id] if just_id else _platforms_emailcenter_columns) \
-            .select_from(_org_user
-                         .join(_org, _org.c.id == _org_user.c.org_id)
-                         .join(_platforms_emailcenter,
-                               _platforms_emailcenter.c.org_id == _org_user.c.org_id)) \
-            .where(_org_user.c.user_id == user_id)
+    def _search_menu_items(conn, org_id, terms, limit, offset, fields):
+        statement, serializer = _project(
+            _search_menu_items, _menu_item_serializer, _menu_item_columns, fields)
+        # Terms are words, without any tsquery syntax, so they are safe to join up like this.
+        query = ' & '.join('{}:*'.format(t) for t in terms)
+        result = conn.execute(
+            statement, org_id=org_id, query=query, offset=offset, limit=limit + 1)
+        rows = result.fetchall()
+        result.close()
+
+        if len(rows) > limit:
+            return [serializer(r) for r in rows[:limit]], offset + limit
+
+        return [serializer(r) for r in rows], None
+
+    def _resolve_org_id(self, conn, user_id):
+        org_id = self._org_id_cache.get(user_id)
+        if org_id is not None:
+            return org_id
+
+        result = conn.execute(_fetch_org_id, user_id=user_id)
+        org_user_row = result.fetchone()
+        result.close()
+
+        # Users without an org are not cached, since they can create one at any moment.
+        if org_user_row is None:
+            return None
+
+        self._org_id_cache.put(user_id, org_user_row['org_id'])
+        return org_user_row['org_id']
 
 
 def _ec(t):
@@ -740,14 +1709,4 @@ def _ec(t):
 
 
 def _e2i(d):
-    return {inflection.underscore(k):v for k,v in d.items()}
-
-
-def _i2e(d):
-    o = {}
-    for k, v in d.items():
-        if isinstance(v, datetime.datetime):
-            o[inflection.camelize(k, False) + 'Ts'] = int(v.timestamp())
-        else:
-            o[inflection.camelize(k, False)] = v
-    return o
+    return {_internal_names.get(k) or inflection.underscore(k):v for k,v in d.items()}
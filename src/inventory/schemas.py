@@ -493,6 +493,27 @@ MENU_SECTIONS_RESPONSE = {
 }
 
 
+MENU_SECTIONS_PAGE_RESPONSE = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu sections page response',
+    'description': 'A page of menu sections, in id order',
+    'type': 'object',
+    'properties': {
+        'menuSections': {
+            'description': 'The menu sections in this page',
+            'type': 'array',
+            'items': MENU_SECTION
+        },
+        'next': {
+            'description': 'The cursor for the next page, or null if this is the last page',
+            'type': ['string', 'null']
+        }
+    },
+    'required': ['menuSections', 'next'],
+    'additionalProperties': False
+}
+
+
 MENU_SECTION_UPDATE_REQUEST = {
     '$schema': 'http://json-schema.org/draft-04/schema#',
     'title': 'Menu section update request',
@@ -557,6 +578,85 @@ MENU_ITEMS_CREATION_REQUEST = {
 }
 
 
+MENU_ITEMS_BULK_CREATION_REQUEST = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu items bulk creation request',
+    'description': 'Creation request for several menu items at once',
+    'type': 'array',
+    'items': MENU_ITEMS_CREATION_REQUEST,
+    'minItems': 1,
+    'maxItems': 1000
+}
+
+
+MENU_IMPORT_ITEM = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu import item',
+    'description': 'A menu item to create as part of a menu import',
+    'type': 'object',
+    'properties': {
+        'name': {
+            'description': 'The name of the menu item',
+            'type': 'string'
+        },
+        'description': {
+            'description': 'The description of the menu item',
+            'type': 'string'
+        },
+        'keywords': KEYWORDS,
+        'ingredients': INGREDIENTS,
+        'imageSet': IMAGE_SET,
+    },
+    'required': ['name', 'description', 'keywords', 'ingredients', 'imageSet'],
+    'additionalProperties': False
+}
+
+
+MENU_IMPORT_SECTION = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu import section',
+    'description': 'A menu section to create, with all its items, as part of a menu import',
+    'type': 'object',
+    'properties': {
+        'name': {
+            'description': 'The name of the menu section',
+            'type': 'string'
+        },
+        'description': {
+            'description': 'The description of the menu section',
+            'type': 'string'
+        },
+        'items': {
+            'description': 'The menu items for this section',
+            'type': 'array',
+            'items': MENU_IMPORT_ITEM,
+            'maxItems': 1000
+        }
+    },
+    'required': ['name', 'description', 'items'],
+    'additionalProperties': False
+}
+
+
+MENU_IMPORT_REQUEST = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu import request',
+    'description': 'Request to create a whole menu at once',
+    'type': 'object',
+    'properties': {
+        'sections': {
+            'description': 'The menu sections, in order',
+            'type': 'array',
+            'items': MENU_IMPORT_SECTION,
+            'minItems': 1,
+            'maxItems': 200
+        }
+    },
+    'required': ['sections'],
+    'additionalProperties': False
+}
+
+
 MENU_ITEMS_RESPONSE = {
     '$schema': 'http://json-schema.org/draft-04/schema#',
     'title': 'Menu items response',
@@ -574,6 +674,48 @@ MENU_ITEMS_RESPONSE = {
 }
 
 
+MENU_ITEMS_PAGE_RESPONSE = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu items page response',
+    'description': 'A page of menu items, in id order',
+    'type': 'object',
+    'properties': {
+        'menuItems': {
+            'description': 'The menu items in this page',
+            'type': 'array',
+            'items': MENU_ITEM
+        },
+        'next': {
+            'description': 'The cursor for the next page, or null if this is the last page',
+            'type': ['string', 'null']
+        }
+    },
+    'required': ['menuItems', 'next'],
+    'additionalProperties': False
+}
+
+
+MENU_ITEMS_SEARCH_RESPONSE = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Menu items search response',
+    'description': 'A page of the menu items matching a search, best matches first',
+    'type': 'object',
+    'properties': {
+        'menuItems': {
+            'description': 'The matching menu items in this page',
+            'type': 'array',
+            'items': MENU_ITEM
+        },
+        'next': {
+            'description': 'The cursor for the next page, or null if this is the last page',
+            'type': ['string', 'null']
+        }
+    },
+    'required': ['menuItems', 'next'],
+    'additionalProperties': False
+}
+
+
 MENU_ITEM_UPDATE_REQUEST = {
     '$schema': 'http://json-schema.org/draft-04/schema#',
     'title': 'Menu item update request',
@@ -720,3 +862,133 @@ WEBSHOP_INFO_RESPONSE = {
     'required': ['webshopInfo'],
     'additionalProperties': False
 }
+
+
+def _projection(schema):
+    """The schema for objects with only some of the fields of those described by schema.
+
+    Only the id is always there.
+    """
+
+    return dict(schema, required=['id'])
+
+
+def _projection_response(response_schema, key):
+    """The schema for a response like response_schema, with projections at key."""
+
+    value_schema = response_schema['properties'][key]
+    if value_schema['type'] == 'array':
+        value_schema = dict(value_schema, items=_projection(value_schema['items']))
+    else:
+        value_schema = _projection(value_schema)
+
+    return dict(
+        response_schema, properties=dict(response_schema['properties'], **{key: value_schema}))
+
+
+RESTAURANT_PROJECTION_RESPONSE = _projection_response(RESTAURANT_RESPONSE, 'restaurant')
+MENU_SECTIONS_PROJECTION_RESPONSE = _projection_response(MENU_SECTIONS_RESPONSE, 'menuSections')
+MENU_SECTIONS_PAGE_PROJECTION_RESPONSE = _projection_response(
+    MENU_SECTIONS_PAGE_RESPONSE, 'menuSections')
+MENU_ITEMS_PROJECTION_RESPONSE = _projection_response(MENU_ITEMS_RESPONSE, 'menuItems')
+MENU_ITEMS_PAGE_PROJECTION_RESPONSE = _projection_response(MENU_ITEMS_PAGE_RESPONSE, 'menuItems')
+MENU_ITEMS_SEARCH_PROJECTION_RESPONSE = _projection_response(
+    MENU_ITEMS_SEARCH_RESPONSE, 'menuItems')
+MENU_ITEM_PROJECTION_RESPONSE = _projection_response(MENU_ITEM_RESPONSE, 'menuItem')
+
+
+_TIME_UPDATED = {
+    'description': 'The time this last changed, in UTC',
+    'type': 'integer',
+}
+
+
+_TIME_ARCHIVED = {
+    'description': 'The time this was archived, in UTC, or null if it was not',
+    'type': ['integer', 'null'],
+}
+
+
+def _change(schema, title, **properties):
+    """The schema for a changed object of the kind schema describes, with some extra properties.
+
+    The extra properties are all required. Nested collections are not part of a change.
+    """
+
+    base_properties = {k: v for k, v in schema['properties'].items() if k != 'items'}
+
+    return dict(
+        schema, title=title, properties=dict(base_properties, **properties),
+        required=schema['required'] + sorted(properties))
+
+
+def _nullable(schema):
+    return {'anyOf': [{'type': 'null'}, schema]}
+
+
+RESTAURANT_CHANGE = _change(RESTAURANT, 'Restaurant change', timeUpdatedTs=_TIME_UPDATED)
+MENU_SECTION_CHANGE = _change(
+    MENU_SECTION, 'Menu section change',
+    timeUpdatedTs=_TIME_UPDATED, timeArchivedTs=_TIME_ARCHIVED)
+MENU_ITEM_CHANGE = _change(
+    MENU_ITEM, 'Menu item change',
+    sectionId={'description': 'The id of the section of the menu item', 'type': 'integer'},
+    timeUpdatedTs=_TIME_UPDATED, timeArchivedTs=_TIME_ARCHIVED)
+PLATFORMS_WEBSITE_CHANGE = _change(
+    PLATFORMS_WEBSITE, 'Website platform change', timeUpdatedTs=_TIME_UPDATED)
+PLATFORMS_CALLCENTER_CHANGE = _change(
+    PLATFORMS_CALLCENTER, 'Callcenter platform change', timeUpdatedTs=_TIME_UPDATED)
+PLATFORMS_EMAILCENTER_CHANGE = _change(
+    PLATFORMS_EMAILCENTER, 'Emailcenter platform change', timeUpdatedTs=_TIME_UPDATED)
+
+
+WEBSHOP_CHANGES = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Webshop changes',
+    'description': 'What changed in a shop after a content version, archived data included',
+    'type': 'object',
+    'properties': {
+        'contentVersion': {
+            'description': 'The content version the changes go up to',
+            'type': 'integer',
+        },
+        'restaurant': _nullable(RESTAURANT_CHANGE),
+        'menuSections': {
+            'description': 'The changed menu sections',
+            'type': 'array',
+            'items': MENU_SECTION_CHANGE
+        },
+        'menuItems': {
+            'description': 'The changed menu items',
+            'type': 'array',
+            'items': MENU_ITEM_CHANGE
+        },
+        'platforms': {
+            'title': 'Platforms changes',
+            'description': 'The changed platforms, with null for those which did not change',
+            'type': 'object',
+            'properties': {
+                'website': _nullable(PLATFORMS_WEBSITE_CHANGE),
+                'callcenter': _nullable(PLATFORMS_CALLCENTER_CHANGE),
+                'emailcenter': _nullable(PLATFORMS_EMAILCENTER_CHANGE)
+            },
+            'required': ['website', 'callcenter', 'emailcenter'],
+            'additionalProperties': False
+        }
+    },
+    'required': ['contentVersion', 'restaurant', 'menuSections', 'menuItems', 'platforms'],
+    'additionalProperties': False
+}
+
+
+WEBSHOP_CHANGES_RESPONSE = {
+    '$schema': 'http://json-schema.org/draft-04/schema#',
+    'title': 'Webshop changes response',
+    'description': 'Response for the changes to a shop',
+    'type': 'object',
+    'properties': {
+        'webshopChanges': WEBSHOP_CHANGES
+    },
+    'required': ['webshopChanges'],
+    'additionalProperties': False
+}
@@ -5,13 +5,18 @@ from wsgiref import simple_server
 import clock
 import falcon
 import falcon_cors
-import sqlalchemy
-import startup_migrations
+import sqlalchemy.util
 
 import identity.client as identity
+import inventory.auth as auth
+import inventory.cache as cache
+import inventory.compression as compression
 import inventory.config as config
+import inventory.database as database
 import inventory.handlers as inventory
+import inventory.instrumentation as instrumentation
 import inventory.model as model
+import inventory.snapshots as snapshots
 import inventory.validation as validation
 
 
@@ -20,124 +25,296 @@ def debug_error_handler(ex, req, resp, params):
     raise ex
 
 
-startup_migrations.migrate(config.DATABASE_URL, config.MIGRATIONS_PATH)
-
-
-id_validator = validation.IdValidator()
-restaurant_name_validator = validation.RestaurantNameValidator()
-restaurant_description_validator = validation.RestaurantDescriptionValidator()
-keywords_validator = validation.KeywordsValidator()
-ingredients_validator = validation.IngredientsValidator()
-restaurant_address_validator = validation.RestaurantAddressValidator()
-restaurant_opening_hours_validator = validation.RestaurantOpeningHoursValidator()
-image_set_validator = validation.ImageSetValidator()
-org_creation_request_validator = validation.OrgCreationRequestValidator(
-    restaurant_name_validator=restaurant_name_validator,
-    restaurant_description_validator=restaurant_description_validator,
-    keywords_validator=keywords_validator,
-    restaurant_address_validator=restaurant_address_validator,
-    restaurant_opening_hours_validator=restaurant_opening_hours_validator,
-    image_set_validator=image_set_validator)
-restaurant_update_request_validator = validation.RestaurantUpdateRequestValidator(
-    restaurant_name_validator=restaurant_name_validator,
-    restaurant_description_validator=restaurant_description_validator,
-    keywords_validator=keywords_validator,
-    restaurant_address_validator=restaurant_address_validator,
-    restaurant_opening_hours_validator=restaurant_opening_hours_validator,
-    image_set_validator=image_set_validator)
-menu_sections_creation_request_validator = validation.MenuSectionsCreationRequestValidator(
-    name_validator=restaurant_name_validator,
-    description_validator=restaurant_description_validator)
-menu_section_update_request_validator = validation.MenuSectionUpdateRequestValidator(
-    name_validator=restaurant_name_validator,
-    description_validator=restaurant_description_validator)
-menu_items_creation_request_validator = validation.MenuItemsCreationRequestValidator(
-    id_validator=id_validator,
-    name_validator=restaurant_name_validator,
-    description_validator=restaurant_description_validator,
-    keywords_validator=keywords_validator,
-    ingredients_validator=ingredients_validator,
-    image_set_validator=image_set_validator)
-menu_item_update_request_validator = validation.MenuItemUpdateRequestValidator(
-    id_validator=id_validator,
-    name_validator=restaurant_name_validator,
-    description_validator=restaurant_description_validator,
-    keywords_validator=keywords_validator,
-    ingredients_validator=ingredients_validator,
-    image_set_validator=image_set_validator)
-platforms_website_update_request_validator = validation.PlatformsWebsiteUpdateRequestValidator()
-platforms_callcenter_update_request_validator = \
-    validation.PlatformsCallcenterUpdateRequestValidator()
-platforms_emailcenter_update_request_validator = \
-    validation.PlatformsEmailcenterUpdateRequestValidator()
-host_to_subdomain_validator = \
-    validation.HostToSubdomainValidator()
-
-the_clock = clock.Clock()
-sql_engine = sqlalchemy.create_engine(config.DATABASE_URL, echo=True)
-model = model.Model(the_clock, sql_engine)
-
-org_resource = inventory.OrgResource(
-    org_creation_request_validator=org_creation_request_validator,
-    model=model)
-
-restaurant_resource = inventory.RestaurantResource(
-    restaurant_update_request_validator=restaurant_update_request_validator,
-    model=model)
-
-menu_sections_resource = inventory.MenuSectionsResource(
-    menu_sections_creation_request_validator=menu_sections_creation_request_validator,
-    model=model)
-
-menu_section_resource = inventory.MenuSectionResource(
-    menu_section_update_request_validator=menu_section_update_request_validator,
-    model=model)
-
-menu_items_resource = inventory.MenuItemsResource(
-    menu_items_creation_request_validator=menu_items_creation_request_validator,
-    model=model)
-
-menu_item_resource = inventory.MenuItemResource(
-    menu_item_update_request_validator=menu_item_update_request_validator,
-    model=model)
-
-platforms_website_resource = inventory.PlatformsWebsiteResource(
-    platforms_website_update_request_validator=platforms_website_update_request_validator,
-    model=model)
-
-platforms_callcenter_resource = inventory.PlatformsCallcenterResource(
-    platforms_callcenter_update_request_validator=platforms_callcenter_update_request_validator,
-    model=model)
-
-platforms_emailcenter_resource = inventory.PlatformsEmailcenterResource(
-    platforms_emailcenter_update_request_validator=platforms_emailcenter_update_request_validator,
-    model=model)
-
-webshop_info_resource = inventory.WebshopInfoResource(
-    host_to_subdomain_validator=host_to_subdomain_validator,
-    model=model)
-
-auth_middleware = identity.AuthMiddleware(config.IDENTITY_SERVICE_DOMAIN)
-cors_middleware = falcon_cors.CORS(
-    allow_origins_list=config.CLIENTS,
-    allow_headers_list=['Authorization', 'Content-Type'],
-    allow_all_methods=True).middleware
-
-app = falcon.API(middleware=[auth_middleware, cors_middleware])
-
-if config.ENV != 'PROD':
-    app.add_error_handler(Exception, handler=debug_error_handler)
-
-app.add_route('/org', org_resource)
-app.add_route('/org/restaurant', restaurant_resource)
-app.add_route('/org/menu/sections', menu_sections_resource)
-app.add_route('/org/menu/sections/{section_id}', menu_section_resource)
-app.add_route('/org/menu/items', menu_items_resource)
-app.add_route('/org/menu/items/{item_id}', menu_item_resource)
-app.add_route('/org/platforms/website', platforms_website_resource)
-app.add_route('/org/platforms/callcenter', platforms_callcenter_resource)
-app.add_route('/org/platforms/emailcenter', platforms_emailcenter_resource)
-app.add_route('/webshop', webshop_info_resource)
+def create_app(startup_timer):
+    """Build the app, with all its validators, caches, database access and resources.
+
+    Nothing here touches the database, so this is safe to run in a master process which forks
+    workers later. Each phase is timed with startup_timer.
+    """
+
+    with startup_timer.phase('validators'):
+        id_validator = validation.IdValidator()
+        page_request_validator = validation.PageRequestValidator()
+        search_request_validator = validation.SearchRequestValidator()
+        changes_request_validator = validation.ChangesRequestValidator()
+        restaurant_fields_validator = validation.FieldsValidator(model.RESTAURANT_FIELDS)
+        menu_section_fields_validator = validation.FieldsValidator(model.MENU_SECTION_FIELDS)
+        menu_item_fields_validator = validation.FieldsValidator(model.MENU_ITEM_FIELDS)
+        restaurant_name_validator = validation.RestaurantNameValidator()
+        restaurant_description_validator = validation.RestaurantDescriptionValidator()
+        keywords_validator = validation.KeywordsValidator()
+        ingredients_validator = validation.IngredientsValidator()
+        restaurant_address_validator = validation.RestaurantAddressValidator()
+        restaurant_opening_hours_validator = validation.RestaurantOpeningHoursValidator()
+        image_set_validator = validation.ImageSetValidator()
+        org_creation_request_validator = validation.OrgCreationRequestValidator(
+            restaurant_name_validator=restaurant_name_validator,
+            restaurant_description_validator=restaurant_description_validator,
+            keywords_validator=keywords_validator,
+            restaurant_address_validator=restaurant_address_validator,
+            restaurant_opening_hours_validator=restaurant_opening_hours_validator,
+            image_set_validator=image_set_validator)
+        restaurant_update_request_validator = validation.RestaurantUpdateRequestValidator(
+            restaurant_name_validator=restaurant_name_validator,
+            restaurant_description_validator=restaurant_description_validator,
+            keywords_validator=keywords_validator,
+            restaurant_address_validator=restaurant_address_validator,
+            restaurant_opening_hours_validator=restaurant_opening_hours_validator,
+            image_set_validator=image_set_validator)
+        menu_sections_creation_request_validator = validation.MenuSectionsCreationRequestValidator(
+            name_validator=restaurant_name_validator,
+            description_validator=restaurant_description_validator)
+        menu_section_update_request_validator = validation.MenuSectionUpdateRequestValidator(
+            name_validator=restaurant_name_validator,
+            description_validator=restaurant_description_validator)
+        menu_items_creation_request_validator = validation.MenuItemsCreationRequestValidator(
+            id_validator=id_validator,
+            name_validator=restaurant_name_validator,
+            description_validator=restaurant_description_validator,
+            keywords_validator=keywords_validator,
+            ingredients_validator=ingredients_validator,
+            image_set_validator=image_set_validator)
+        menu_item_update_request_validator = validation.MenuItemUpdateRequestValidator(
+            id_validator=id_validator,
+            name_validator=restaurant_name_validator,
+            description_validator=restaurant_description_validator,
+            keywords_validator=keywords_validator,
+            ingredients_validator=ingredients_validator,
+            image_set_validator=image_set_validator)
+        menu_import_request_validator = validation.MenuImportRequestValidator(
+            name_validator=restaurant_name_validator,
+            description_validator=restaurant_description_validator,
+            keywords_validator=keywords_validator,
+            ingredients_validator=ingredients_validator,
+            image_set_validator=image_set_validator)
+        platforms_website_update_request_validator = \
+            validation.PlatformsWebsiteUpdateRequestValidator()
+        platforms_callcenter_update_request_validator = \
+            validation.PlatformsCallcenterUpdateRequestValidator()
+        platforms_emailcenter_update_request_validator = \
+            validation.PlatformsEmailcenterUpdateRequestValidator()
+        host_to_subdomain_validator = \
+            validation.HostToSubdomainValidator()
+        response_validator = validation.ResponseValidator(
+            mode=config.RESPONSE_VALIDATION,
+            sample_rate=config.RESPONSE_VALIDATION_SAMPLE_RATE)
+
+    with startup_timer.phase('caches'):
+        webshop_cache = cache.WebshopCache(
+            max_size=config.WEBSHOP_CACHE_SIZE,
+            ttl=config.WEBSHOP_CACHE_TTL)
+        org_id_cache = cache.LruCache(max_size=config.ORG_ID_CACHE_SIZE)
+        token_cache = auth.TokenCache(
+            max_size=config.AUTH_CACHE_SIZE,
+            ttl=config.AUTH_CACHE_TTL)
+        token_verifier = None
+        if len(config.AUTH_TOKEN_KEYS) > 0:
+            token_verifier = auth.TokenVerifier(
+                keys=config.AUTH_TOKEN_KEYS,
+                audience=config.AUTH_TOKEN_AUDIENCE)
+        webshop_routes = cache.WebshopRoutes(
+            master_domain=config.MASTER_DOMAIN,
+            negative_cache_size=config.WEBSHOP_NEGATIVE_CACHE_SIZE,
+            negative_ttl=config.WEBSHOP_NEGATIVE_CACHE_TTL,
+            # The model is only created below, and the routes are only loaded by the worker.
+            load_routes=lambda: the_model.get_webshop_routes())
+        compressor = compression.Compressor(
+            min_size=config.COMPRESSION_MIN_SIZE,
+            gzip_level=config.COMPRESSION_GZIP_LEVEL,
+            brotli_quality=config.COMPRESSION_BROTLI_QUALITY)
+
+    with startup_timer.phase('database'):
+        the_clock = clock.Clock()
+        sql_engine, *replica_engines = [
+            database.create_engine(
+                url,
+                pool_size=config.DATABASE_POOL_SIZE,
+                max_overflow=config.DATABASE_MAX_OVERFLOW,
+                pool_timeout=config.DATABASE_POOL_TIMEOUT,
+                pool_recycle=config.DATABASE_POOL_RECYCLE,
+                pool_pre_ping=config.DATABASE_POOL_PRE_PING,
+                echo=config.DATABASE_ECHO)
+            for url in [config.DATABASE_URL] + config.DATABASE_REPLICA_URLS]
+        statement_preparation_timer = instrumentation.StatementPreparationTimer()
+        for e in [sql_engine] + replica_engines:
+            statement_preparation_timer.install(e)
+        the_model = model.Model(
+            the_clock, sql_engine,
+            webshop_query=config.WEBSHOP_QUERY,
+            org_change_listeners=[webshop_cache],
+            org_id_cache=org_id_cache,
+            # Bounded, as before SQLAlchemy 1.4 the cache is keyed by statement, and statements
+            # built per request, such as multi-row inserts, would each add an entry.
+            compiled_cache=(sqlalchemy.util.LRUCache(config.SQL_COMPILED_CACHE_SIZE)
+                            if config.SQL_COMPILED_CACHE else None),
+            export_batch_size=config.EXPORT_BATCH_SIZE,
+            replica_engines=replica_engines,
+            read_your_writes_window=config.READ_YOUR_WRITES_WINDOW,
+            subdomain_change_listeners=[webshop_routes])
+
+        snapshot_store = None
+        snapshot_publisher = None
+        if config.WEBSHOP_SNAPSHOTS_PATH is not None:
+            snapshot_store = snapshots.SnapshotStore(config.WEBSHOP_SNAPSHOTS_PATH, compressor)
+            snapshot_publisher = snapshots.SnapshotPublisher(
+                snapshot_store, the_model, response_validator)
+            the_model.add_org_change_listener(snapshot_publisher)
+
+    with startup_timer.phase('resources'):
+        org_resource = inventory.OrgResource(
+            org_creation_request_validator=org_creation_request_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        restaurant_resource = inventory.RestaurantResource(
+            restaurant_update_request_validator=restaurant_update_request_validator,
+            fields_validator=restaurant_fields_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_sections_resource = inventory.MenuSectionsResource(
+            menu_sections_creation_request_validator=menu_sections_creation_request_validator,
+            page_request_validator=page_request_validator,
+            fields_validator=menu_section_fields_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_section_resource = inventory.MenuSectionResource(
+            menu_section_update_request_validator=menu_section_update_request_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_items_resource = inventory.MenuItemsResource(
+            menu_items_creation_request_validator=menu_items_creation_request_validator,
+            page_request_validator=page_request_validator,
+            fields_validator=menu_item_fields_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_items_search_resource = inventory.MenuItemsSearchResource(
+            search_request_validator=search_request_validator,
+            fields_validator=menu_item_fields_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_item_resource = inventory.MenuItemResource(
+            menu_item_update_request_validator=menu_item_update_request_validator,
+            fields_validator=menu_item_fields_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_import_resource = inventory.MenuImportResource(
+            menu_import_request_validator=menu_import_request_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        menu_export_resource = inventory.MenuExportResource(model=the_model)
+
+        platforms_website_resource = inventory.PlatformsWebsiteResource(
+            platforms_website_update_request_validator=platforms_website_update_request_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        platforms_callcenter_resource = inventory.PlatformsCallcenterResource(
+            platforms_callcenter_update_request_validator=(
+                platforms_callcenter_update_request_validator),
+            model=the_model,
+            response_validator=response_validator)
+
+        platforms_emailcenter_resource = inventory.PlatformsEmailcenterResource(
+            platforms_emailcenter_update_request_validator=(
+                platforms_emailcenter_update_request_validator),
+            model=the_model,
+            response_validator=response_validator)
+
+        webshop_info_resource = inventory.WebshopInfoResource(
+            host_to_subdomain_validator=host_to_subdomain_validator,
+            webshop_routes=webshop_routes,
+            model=the_model,
+            response_validator=response_validator,
+            webshop_cache=webshop_cache,
+            compressor=compressor,
+            snapshot_store=snapshot_store,
+            snapshot_publisher=snapshot_publisher)
+
+        webshop_menu_items_search_resource = inventory.WebshopMenuItemsSearchResource(
+            host_to_subdomain_validator=host_to_subdomain_validator,
+            webshop_routes=webshop_routes,
+            search_request_validator=search_request_validator,
+            fields_validator=menu_item_fields_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        webshop_changes_resource = inventory.WebshopChangesResource(
+            host_to_subdomain_validator=host_to_subdomain_validator,
+            webshop_routes=webshop_routes,
+            changes_request_validator=changes_request_validator,
+            model=the_model,
+            response_validator=response_validator)
+
+        metrics_resource = inventory.MetricsResource(
+            sources={
+                'responseValidation': response_validator.stats,
+                'webshopCache': webshop_cache.stats,
+                'webshopRoutes': webshop_routes.stats,
+                'authCache': token_cache.stats,
+                'authTokenVerification': (
+                    token_verifier.stats if token_verifier is not None else lambda: None),
+                'compression': compressor.stats,
+                'statementPreparation': statement_preparation_timer.stats,
+                # The pool is replaced after a fork, so it is looked up on every call.
+                'connectionPool': lambda: sql_engine.pool.stats(),
+                'replicaConnectionPools': lambda: [e.pool.stats() for e in replica_engines],
+                'startup': startup_timer.stats
+            })
+
+    with startup_timer.phase('app'):
+        statement_preparation_middleware = instrumentation.StatementPreparationMiddleware(
+            statement_preparation_timer)
+        compression_middleware = compression.CompressionMiddleware(compressor)
+        read_your_writes_middleware = inventory.ReadYourWritesMiddleware(the_model)
+        auth_middleware = auth.CachingAuthMiddleware(
+            identity.AuthMiddleware(config.IDENTITY_SERVICE_DOMAIN), token_cache, token_verifier)
+        cors_middleware = falcon_cors.CORS(
+            allow_origins_list=config.CLIENTS,
+            allow_headers_list=[
+                'Authorization', 'Content-Type', inventory.ReadYourWritesMiddleware.HEADER],
+            expose_headers_list=[inventory.ReadYourWritesMiddleware.HEADER],
+            allow_all_methods=True).middleware
+
+        # Responses go through the middleware last to first, so compression sees the final body.
+        app = falcon.API(
+            middleware=[
+                compression_middleware, statement_preparation_middleware,
+                read_your_writes_middleware, auth_middleware, cors_middleware])
+
+        if config.ENV != 'PROD':
+            app.add_error_handler(Exception, handler=debug_error_handler)
+
+        app.add_route('/org', org_resource)
+        app.add_route('/org/restaurant', restaurant_resource)
+        app.add_route('/org/menu/sections', menu_sections_resource)
+        app.add_route('/org/menu/sections/{section_id}', menu_section_resource)
+        app.add_route('/org/menu/items', menu_items_resource)
+        app.add_route('/org/menu/items/search', menu_items_search_resource)
+        app.add_route('/org/menu/items/{item_id}', menu_item_resource)
+        app.add_route('/org/menu/import', menu_import_resource)
+        app.add_route('/org/menu/export', menu_export_resource)
+        app.add_route('/org/platforms/website', platforms_website_resource)
+        app.add_route('/org/platforms/callcenter', platforms_callcenter_resource)
+        app.add_route('/org/platforms/emailcenter', platforms_emailcenter_resource)
+        app.add_route('/webshop', webshop_info_resource)
+        app.add_route('/webshop/search', webshop_menu_items_search_resource)
+        app.add_route('/webshop/changes', webshop_changes_resource)
+
+        if config.EXPOSE_METRICS:
+            app.add_route('/metrics', metrics_resource)
+
+    return app
+
+
+startup_timer = instrumentation.StartupTimer()
+app = create_app(startup_timer)
 
 
 def main():
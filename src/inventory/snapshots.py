@@ -0,0 +1,206 @@
+"""Webshop snapshots, published to files as orgs change and served without the database.
+
+Each webshop is kept as <subdomain>.json in the snapshot directory, holding the body of GET
+/webshop, and, when it is large enough to be worth compressing, as <subdomain>.json.gzip and
+<subdomain>.json.br too. Every file starts with the plain ETag on a line of its own. Files are
+replaced atomically, so readers see either the old or the new snapshot, never a mix of the two.
+
+All the workers which write to a directory must share it, as must those which read it. Publishing
+an org happens under an exclusive lock on <org_id>.lock, and the webshop is read from the model
+only once it is held. So whichever worker publishes last writes data at least as new as every
+write before it. The subdomain each org was last published under is kept in <org_id>.subdomain,
+so its old snapshot can be removed when it changes.
+"""
+
+import collections
+import contextlib
+import fcntl
+import logging
+import os
+import os.path
+import tempfile
+
+import inventory.codec as codec
+import inventory.compiled_schemas as compiled_schemas
+import inventory.compression as compression
+import inventory.etags as etags
+import inventory.model as model
+
+
+_log = logging.getLogger(__name__)
+
+
+# The stream is positioned at the start of the body, and length bytes long. The encoding is None
+# for the plain snapshot, and compressible tells whether clients might get other encodings.
+Snapshot = collections.namedtuple(
+    'Snapshot', ['etag', 'encoding', 'compressible', 'stream', 'length'])
+
+
+class SnapshotStore(object):
+    """The snapshot files in a directory."""
+
+    EXTENSION = '.json'
+    # Longer than any ETag line.
+    MAX_HEADER_SIZE = 256
+
+    def __init__(self, path, compressor):
+        self._path = path
+        self._compressor = compressor
+        os.makedirs(path, exist_ok=True)
+
+    def open(self, subdomain, accept_encoding):
+        """The snapshot of a webshop, in the encoding the client prefers, or None if there is none.
+
+        The caller must close the stream of the snapshot, or hand it to something which does.
+        """
+
+        plain = self._open(subdomain, None)
+        if plain is None:
+            return None
+
+        compressible = self._compressor.compressible(plain.length)
+        encoding = self._compressor.negotiate(accept_encoding, plain.length)
+        encoded = self._open(subdomain, encoding) if encoding is not None else None
+
+        if encoded is None:
+            return plain._replace(compressible=compressible)
+
+        plain.stream.close()
+        return encoded._replace(compressible=compressible)
+
+    def write(self, org_id, subdomain, etag, body):
+        """Replace the snapshot of an org, removing the one under its old subdomain if it moved."""
+
+        previous_subdomain = self._read_subdomain(org_id)
+        if previous_subdomain is not None and previous_subdomain != subdomain:
+            self._remove(previous_subdomain)
+
+        encodings = compression.ENCODINGS if self._compressor.compressible(len(body)) else ()
+        header = etag.encode('ascii') + b'\n'
+
+        # The encoded snapshots go first, so none is left behind which is older than the plain one.
+        for encoding in compression.ENCODINGS:
+            if encoding in encodings:
+                self._replace(
+                    self._file_path(subdomain, encoding),
+                    header + self._compressor.compress(encoding, body))
+            else:
+                self._unlink(self._file_path(subdomain, encoding))
+        self._replace(self._file_path(subdomain, None), header + body)
+
+        self._replace(self._subdomain_path(org_id), subdomain.encode('utf-8'))
+
+    def remove(self, org_id):
+        """Remove the snapshot of an org, if there is one."""
+
+        subdomain = self._read_subdomain(org_id)
+        if subdomain is not None:
+            self._remove(subdomain)
+        self._unlink(self._subdomain_path(org_id))
+
+    @contextlib.contextmanager
+    def lock(self, org_id):
+        """Hold the publishing lock of an org, across all the processes sharing the directory."""
+
+        with open(os.path.join(self._path, '{}.lock'.format(org_id)), 'ab') as lock_file:
+            # Closing the file releases the lock.
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _open(self, subdomain, encoding):
+        # Unbuffered, so the offset of the file descriptor is that of the stream. The server's
+        # wsgi.file_wrapper may send the file with sendfile, from wherever the descriptor points.
+        try:
+            stream = open(self._file_path(subdomain, encoding), 'rb', buffering=0)
+        except FileNotFoundError:
+            return None
+
+        try:
+            header = stream.read(self.MAX_HEADER_SIZE)
+            etag_size = header.index(b'\n')
+            etag = header[:etag_size].decode('ascii')
+            stream.seek(etag_size + 1)
+            length = os.fstat(stream.fileno()).st_size - stream.tell()
+        except Exception:
+            stream.close()
+            raise
+
+        return Snapshot(etag, encoding, False, stream, length)
+
+    def _remove(self, subdomain):
+        for encoding in compression.ENCODINGS:
+            self._unlink(self._file_path(subdomain, encoding))
+        self._unlink(self._file_path(subdomain, None))
+
+    def _read_subdomain(self, org_id):
+        try:
+            with open(self._subdomain_path(org_id), 'rb') as subdomain_file:
+                return subdomain_file.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    def _replace(self, file_path, data):
+        with tempfile.NamedTemporaryFile(dir=self._path, prefix='.', delete=False) as temp_file:
+            try:
+                temp_file.write(data)
+            except Exception:
+                os.unlink(temp_file.name)
+                raise
+
+        os.replace(temp_file.name, file_path)
+
+    @staticmethod
+    def _unlink(file_path):
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+
+    def _file_path(self, subdomain, encoding):
+        # Subdomains are slugs, so they are safe to use as file names.
+        file_name = subdomain + self.EXTENSION
+        if encoding is not None:
+            file_name += '.' + encoding
+        return os.path.join(self._path, file_name)
+
+    def _subdomain_path(self, org_id):
+        return os.path.join(self._path, '{}.subdomain'.format(org_id))
+
+
+class SnapshotPublisher(object):
+    """Republishes the snapshot of an org whenever the model reports it changed."""
+
+    def __init__(self, snapshot_store, model, response_validator):
+        self._snapshot_store = snapshot_store
+        self._model = model
+        self._response_validator = response_validator
+
+    def on_org_changed(self, org_id):
+        # The write which got here was already committed, so a failure must not fail it. A
+        # snapshot which could not be republished is removed instead, and readers go to the model.
+        try:
+            self.publish(org_id)
+        except Exception:
+            _log.exception('Could not publish the snapshot of org {}'.format(org_id))
+            try:
+                self._snapshot_store.remove(org_id)
+            except OSError:
+                _log.exception('Could not remove the snapshot of org {}'.format(org_id))
+
+    def publish(self, org_id):
+        with self._snapshot_store.lock(org_id):
+            try:
+                subdomain, content_version, webshop_info = \
+                    self._model.get_org_webshop_info_with_version(org_id)
+            except model.OrgDoesNotExistError:
+                self._snapshot_store.remove(org_id)
+                return
+
+            response = {'webshopInfo': webshop_info}
+
+            self._response_validator.validate(
+                'GET /webshop', response, compiled_schemas.WEBSHOP_INFO_RESPONSE)
+
+            self._snapshot_store.write(
+                org_id, subdomain, etags.content_etag(org_id, content_version),
+                codec.dumps(response))
@@ -1,16 +1,24 @@
 """Identity validation."""
 
+import base64
+import collections
 import datetime
-import json
+import logging
+import random
 import re
+import threading
 
 import jsonschema
 import phonenumbers
 import slugify
 import validate_email
 
+import inventory.codec as codec
+import inventory.compiled_schemas as compiled_schemas
 import inventory.config as config
-import inventory.schemas as schemas
+
+
+_log = logging.getLogger(__name__)
 
 
 class Error(Exception):
@@ -44,7 +52,7 @@ class ImageSetValidator(object):
 
     def validate(self, image_set_raw):
         try:
-            jsonschema.validate(image_set_raw, schemas.IMAGE_SET)
+            compiled_schemas.IMAGE_SET.validate(image_set_raw)
 
             for i in range(len(image_set_raw)):
                 if image_set_raw[i]['orderNo'] != i:
@@ -70,7 +78,7 @@ class KeywordsValidator(object):
 
     def validate(self, keywords_raw):
         try:
-            jsonschema.validate(keywords_raw, schemas.KEYWORDS)
+            compiled_schemas.KEYWORDS.validate(keywords_raw)
             keywords_unsorted = [kw.strip() for kw in keywords_raw]
 
             if any(kw == '' for kw in keywords_unsorted):
@@ -97,7 +105,7 @@ class IngredientsValidator(object):
 
     def validate(self, ingredients_raw):
         try:
-            jsonschema.validate(ingredients_raw, schemas.INGREDIENTS)
+            compiled_schemas.INGREDIENTS.validate(ingredients_raw)
             ingredients_unsorted = [kw.strip() for kw in ingredients_raw]
 
             if any(kw == '' for kw in ingredients_unsorted):
@@ -176,7 +184,7 @@ class RestaurantOpeningHoursValidator(object):
 
     def validate(self, opening_hours_raw):
         try:
-            jsonschema.validate(opening_hours_raw, schemas.RESTAURANT_OPENING_HOURS)
+            compiled_schemas.RESTAURANT_OPENING_HOURS.validate(opening_hours_raw)
             
             self._validate_interval('weekday', opening_hours_raw['weekday'])
             self._validate_interval('saturday', opening_hours_raw['saturday'])
@@ -212,8 +220,8 @@ class OrgCreationRequestValidator(object):
 
     def validate(self, org_creation_request_raw):
         try:
-            org_creation_request = json.loads(org_creation_request_raw)
-            jsonschema.validate(org_creation_request, schemas.ORG_CREATION_REQUEST)
+            org_creation_request = codec.loads(org_creation_request_raw)
+            compiled_schemas.ORG_CREATION_REQUEST.validate(org_creation_request)
 
             org_creation_request['name'] = \
                 self._restaurant_name_validator.validate(org_creation_request['name'])
@@ -256,8 +264,8 @@ class RestaurantUpdateRequestValidator(object):
 
     def validate(self, restaurant_update_request_raw):
         try:
-            restaurant_update_request = json.loads(restaurant_update_request_raw)
-            jsonschema.validate(restaurant_update_request, schemas.RESTAURANT_UPDATE_REQUEST)
+            restaurant_update_request = codec.loads(restaurant_update_request_raw)
+            compiled_schemas.RESTAURANT_UPDATE_REQUEST.validate(restaurant_update_request)
 
             if 'name' in restaurant_update_request:
                 restaurant_update_request['name'] = \
@@ -308,10 +316,8 @@ class MenuSectionsCreationRequestValidator(object):
 
     def validate(self, menu_sections_creation_request_raw):
         try:
-            menu_sections_creation_request = json.loads(menu_sections_creation_request_raw)
-            jsonschema.validate(
-                menu_sections_creation_request,
-                schemas.MENU_SECTIONS_CREATION_REQUEST)
+            menu_sections_creation_request = codec.loads(menu_sections_creation_request_raw)
+            compiled_schemas.MENU_SECTIONS_CREATION_REQUEST.validate(menu_sections_creation_request)
 
             menu_sections_creation_request['name'] = \
                 self._name_validator.validate(menu_sections_creation_request['name'])
@@ -339,10 +345,8 @@ class MenuSectionUpdateRequestValidator(object):
 
     def validate(self, menu_section_update_request_raw):
         try:
-            menu_section_update_request = json.loads(menu_section_update_request_raw)
-            jsonschema.validate(
-                menu_section_update_request,
-                schemas.MENU_SECTION_UPDATE_REQUEST)
+            menu_section_update_request = codec.loads(menu_section_update_request_raw)
+            compiled_schemas.MENU_SECTION_UPDATE_REQUEST.validate(menu_section_update_request)
 
             if 'name' in menu_section_update_request:
                 menu_section_update_request['name'] = \
@@ -376,22 +380,20 @@ class MenuItemsCreationRequestValidator(object):
         self._image_set_validator = image_set_validator
 
     def validate(self, menu_items_creation_request_raw):
+        """Validate a request for one menu item, or a list of them, returning a list either way."""
+
         try:
-            menu_items_creation_request = json.loads(menu_items_creation_request_raw)
-            jsonschema.validate(menu_items_creation_request, schemas.MENU_ITEMS_CREATION_REQUEST)
-
-            menu_items_creation_request['sectionId'] = \
-                self._id_validator.validate(menu_items_creation_request['sectionId'])
-            menu_items_creation_request['name'] = \
-                self._name_validator.validate(menu_items_creation_request['name'])
-            menu_items_creation_request['description'] = \
-                self._description_validator.validate(menu_items_creation_request['description'])
-            menu_items_creation_request['keywords'] = \
-                self._keywords_validator.validate(menu_items_creation_request['keywords'])
-            menu_items_creation_request['ingredients'] = \
-                self._ingredients_validator.validate(menu_items_creation_request['ingredients'])
-            menu_items_creation_request['imageSet'] = \
-                self._image_set_validator.validate(menu_items_creation_request['imageSet'])
+            menu_items_creation_request = codec.loads(menu_items_creation_request_raw)
+
+            if isinstance(menu_items_creation_request, list):
+                compiled_schemas.MENU_ITEMS_BULK_CREATION_REQUEST.validate(
+                    menu_items_creation_request)
+            else:
+                compiled_schemas.MENU_ITEMS_CREATION_REQUEST.validate(menu_items_creation_request)
+                menu_items_creation_request = [menu_items_creation_request]
+
+            for menu_item_creation_request in menu_items_creation_request:
+                self._validate_menu_item(menu_item_creation_request)
         except ValueError as e:
             raise Error('Could not decode menu items creation request') from e
         except jsonschema.ValidationError as e:
@@ -403,6 +405,69 @@ class MenuItemsCreationRequestValidator(object):
 
         return menu_items_creation_request
 
+    def _validate_menu_item(self, menu_item_creation_request):
+        menu_item_creation_request['sectionId'] = \
+            self._id_validator.validate(menu_item_creation_request['sectionId'])
+        menu_item_creation_request['name'] = \
+            self._name_validator.validate(menu_item_creation_request['name'])
+        menu_item_creation_request['description'] = \
+            self._description_validator.validate(menu_item_creation_request['description'])
+        menu_item_creation_request['keywords'] = \
+            self._keywords_validator.validate(menu_item_creation_request['keywords'])
+        menu_item_creation_request['ingredients'] = \
+            self._ingredients_validator.validate(menu_item_creation_request['ingredients'])
+        menu_item_creation_request['imageSet'] = \
+            self._image_set_validator.validate(menu_item_creation_request['imageSet'])
+
+
+class MenuImportRequestValidator(object):
+    """Validator for a request to import a whole menu."""
+
+    MAX_ITEMS = 5000
+
+    def __init__(self, name_validator, description_validator, keywords_validator,
+                 ingredients_validator, image_set_validator):
+        self._name_validator = name_validator
+        self._description_validator = description_validator
+        self._keywords_validator = keywords_validator
+        self._ingredients_validator = ingredients_validator
+        self._image_set_validator = image_set_validator
+
+    def validate(self, menu_import_request_raw):
+        try:
+            menu_import_request = codec.loads(menu_import_request_raw)
+            compiled_schemas.MENU_IMPORT_REQUEST.validate(menu_import_request)
+
+            items_count = sum(len(ms['items']) for ms in menu_import_request['sections'])
+            if items_count > self.MAX_ITEMS:
+                raise Error('Too many menu items {}'.format(items_count))
+
+            for menu_section in menu_import_request['sections']:
+                menu_section['name'] = self._name_validator.validate(menu_section['name'])
+                menu_section['description'] = \
+                    self._description_validator.validate(menu_section['description'])
+
+                for menu_item in menu_section['items']:
+                    menu_item['name'] = self._name_validator.validate(menu_item['name'])
+                    menu_item['description'] = \
+                        self._description_validator.validate(menu_item['description'])
+                    menu_item['keywords'] = \
+                        self._keywords_validator.validate(menu_item['keywords'])
+                    menu_item['ingredients'] = \
+                        self._ingredients_validator.validate(menu_item['ingredients'])
+                    menu_item['imageSet'] = \
+                        self._image_set_validator.validate(menu_item['imageSet'])
+        except ValueError as e:
+            raise Error('Could not decode menu import request') from e
+        except jsonschema.ValidationError as e:
+            raise Error('Could not structurally validate menu import request') from e
+        except Error as e:
+            raise Error('Could not validate menu import request') from e
+        except Exception as e:
+            raise Error('Other error') from e
+
+        return menu_import_request
+
 
 class MenuItemUpdateRequestValidator(object):
     """Validator for a menu item update request."""
@@ -418,10 +483,8 @@ class MenuItemUpdateRequestValidator(object):
 
     def validate(self, menu_item_update_request_raw):
         try:
-            menu_item_update_request = json.loads(menu_item_update_request_raw)
-            jsonschema.validate(
-                menu_item_update_request,
-                schemas.MENU_ITEM_UPDATE_REQUEST)
+            menu_item_update_request = codec.loads(menu_item_update_request_raw)
+            compiled_schemas.MENU_ITEM_UPDATE_REQUEST.validate(menu_item_update_request)
 
             if 'name' in menu_item_update_request:
                 menu_item_update_request['name'] = \
@@ -464,10 +527,9 @@ class PlatformsWebsiteUpdateRequestValidator(object):
 
     def validate(self, platforms_website_update_request_raw):
         try:
-            platforms_website_update_request = json.loads(platforms_website_update_request_raw)
-            jsonschema.validate(
-                platforms_website_update_request,
-                schemas.PLATFORMS_WEBSITE_UPDATE_REQUEST)
+            platforms_website_update_request = codec.loads(platforms_website_update_request_raw)
+            compiled_schemas.PLATFORMS_WEBSITE_UPDATE_REQUEST.validate(
+                platforms_website_update_request)
 
             if 'subdomain' in platforms_website_update_request:
                 subdomain = platforms_website_update_request['subdomain']
@@ -496,10 +558,9 @@ class PlatformsCallcenterUpdateRequestValidator(object):
     def validate(self, platforms_callcenter_update_request_raw):
         try:
             platforms_callcenter_update_request = \
-                json.loads(platforms_callcenter_update_request_raw)
-            jsonschema.validate(
-                platforms_callcenter_update_request,
-                schemas.PLATFORMS_CALLCENTER_UPDATE_REQUEST)
+                codec.loads(platforms_callcenter_update_request_raw)
+            compiled_schemas.PLATFORMS_CALLCENTER_UPDATE_REQUEST.validate(
+                platforms_callcenter_update_request)
 
             if 'phoneNumber' in platforms_callcenter_update_request:
                 phone_number_raw = platforms_callcenter_update_request['phoneNumber']
@@ -535,10 +596,9 @@ class PlatformsEmailcenterUpdateRequestValidator(object):
     def validate(self, platforms_emailcenter_update_request_raw):
         try:
             platforms_emailcenter_update_request = \
-                json.loads(platforms_emailcenter_update_request_raw)
-            jsonschema.validate(
-                platforms_emailcenter_update_request,
-                schemas.PLATFORMS_EMAILCENTER_UPDATE_REQUEST)
+                codec.loads(platforms_emailcenter_update_request_raw)
+            compiled_schemas.PLATFORMS_EMAILCENTER_UPDATE_REQUEST.validate(
+                platforms_emailcenter_update_request)
 
             if 'emailName' in platforms_emailcenter_update_request:
                 email_name = platforms_emailcenter_update_request['emailName']
@@ -582,3 +642,205 @@ class HostToSubdomainValidator(object):
             raise Error('Subdomain "{}" is not valid'.format(subdomain))
 
         return subdomain
+
+
+class PageRequestValidator(object):
+    """Validator for the limit and cursor query parameters of a paginated listing.
+
+    Cursors are opaque to clients. They hold the id of the last row in the page, and the next page
+    starts right after it.
+    """
+
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def validate(self, limit_raw, cursor_raw):
+        """Return (limit, after_id), or None when the listing is not paginated at all."""
+
+        if limit_raw is None and cursor_raw is None:
+            return None
+
+        try:
+            limit = int(limit_raw) if limit_raw is not None else self.DEFAULT_LIMIT
+            if not 1 <= limit <= self.MAX_LIMIT:
+                raise Error('Limit {} is out of range'.format(limit))
+
+            after_id = 0
+            if cursor_raw is not None:
+                cursor = codec.loads(
+                    base64.urlsafe_b64decode(cursor_raw + '=' * (-len(cursor_raw) % 4)))
+                after_id = cursor['afterId']
+                if not isinstance(after_id, int) or after_id < 0:
+                    raise Error('Cursor id {} is invalid'.format(after_id))
+        except (ValueError, TypeError, KeyError) as e:
+            raise Error('Could not decode page request') from e
+
+        return limit, after_id
+
+    def cursor(self, after_id):
+        """The cursor for the page starting after the row with after_id."""
+
+        cursor = base64.urlsafe_b64encode(codec.dumps({'afterId': after_id}))
+        return cursor.decode('ascii').rstrip('=')
+
+
+class FieldsValidator(object):
+    """Validator for the fields query parameter, which selects a subset of an object's fields.
+
+    It is a list of field names, each of which must be among those given at construction time.
+    """
+
+    def __init__(self, fields):
+        self._fields = frozenset(fields)
+
+    def validate(self, fields_raw):
+        """Return the selected fields, or None when all of them are wanted."""
+
+        if fields_raw is None:
+            return None
+
+        fields = frozenset(f.strip() for f in fields_raw)
+
+        if len(fields) == 0:
+            raise Error('No fields')
+
+        if not fields <= self._fields:
+            raise Error('Unknown fields {}'.format(', '.join(sorted(fields - self._fields))))
+
+        return fields
+
+
+class SearchRequestValidator(object):
+    """Validator for the q, limit and cursor query parameters of a search.
+
+    The query is split into its words, ignoring punctuation. Results are ranked rather than in id
+    order, so cursors hold the offset of the next page instead of an id.
+    """
+
+    TERM_RE = re.compile(r'[^\W_]+')
+    MAX_QUERY_LENGTH = 200
+    MAX_TERMS = 10
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 100
+    MAX_OFFSET = 1000
+
+    def validate(self, query_raw, limit_raw, cursor_raw):
+        """Return (terms, limit, offset)."""
+
+        if query_raw is None or len(query_raw) > self.MAX_QUERY_LENGTH:
+            raise Error('Search query is missing or too long')
+
+        terms = self.TERM_RE.findall(query_raw.lower())
+        if not 1 <= len(terms) <= self.MAX_TERMS:
+            raise Error('Search query has {} terms'.format(len(terms)))
+
+        try:
+            limit = int(limit_raw) if limit_raw is not None else self.DEFAULT_LIMIT
+            if not 1 <= limit <= self.MAX_LIMIT:
+                raise Error('Limit {} is out of range'.format(limit))
+
+            offset = 0
+            if cursor_raw is not None:
+                cursor = codec.loads(
+                    base64.urlsafe_b64decode(cursor_raw + '=' * (-len(cursor_raw) % 4)))
+                offset = cursor['offset']
+                if not isinstance(offset, int) or not 0 <= offset <= self.MAX_OFFSET:
+                    raise Error('Cursor offset {} is invalid'.format(offset))
+        except (ValueError, TypeError, KeyError) as e:
+            raise Error('Could not decode search request') from e
+
+        return terms, limit, offset
+
+    def cursor(self, offset):
+        """The cursor for the page starting offset results in, or None past MAX_OFFSET.
+
+        Searches stop at MAX_OFFSET, so no cursor is handed out which validate would reject.
+        """
+
+        if offset > self.MAX_OFFSET:
+            return None
+
+        cursor = base64.urlsafe_b64encode(codec.dumps({'offset': offset}))
+        return cursor.decode('ascii').rstrip('=')
+
+
+class ChangesRequestValidator(object):
+    """Validator for the since query parameter of a changes request.
+
+    It is a content version, as found in a previous changes response or in an ETag, and 0 asks for
+    everything.
+    """
+
+    MAX_SINCE = 2**63 - 1
+
+    def validate(self, since_raw):
+        """Return the content version to list the changes after."""
+
+        if since_raw is None:
+            raise Error('Missing since')
+
+        try:
+            since = int(since_raw)
+        except ValueError as e:
+            raise Error('Could not decode since') from e
+
+        if not 0 <= since <= self.MAX_SINCE:
+            raise Error('Since {} is out of range'.format(since))
+
+        return since
+
+
+class ResponseValidator(object):
+    """Validator for responses, which checks them according to an enforcement mode.
+
+    In the "always" mode every response is checked against its schema, in the "sampled" mode
+    only a random fraction of them are, while in the "off" mode none are. A response which
+    violates its schema is still sent out. The violation is counted for the route and logged.
+    """
+
+    ALWAYS = 'always'
+    SAMPLED = 'sampled'
+    OFF = 'off'
+
+    def __init__(self, mode, sample_rate=1.0, the_random=random.random):
+        if mode not in (self.ALWAYS, self.SAMPLED, self.OFF):
+            raise ValueError('Invalid response validation mode "{}"'.format(mode))
+
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError('Invalid response validation sample rate {}'.format(sample_rate))
+
+        self._mode = mode
+        self._sample_rate = sample_rate
+        self._the_random = the_random
+        self._lock = threading.Lock()
+        self._checked = collections.Counter()
+        self._violations = collections.Counter()
+
+    def validate(self, route, response, compiled_schema):
+        if self._mode == self.OFF:
+            return
+
+        if self._mode == self.SAMPLED and self._the_random() >= self._sample_rate:
+            return
+
+        is_valid = compiled_schema.is_valid(response)
+
+        with self._lock:
+            self._checked[route] += 1
+            if not is_valid:
+                self._violations[route] += 1
+
+        if not is_valid:
+            try:
+                compiled_schema.validate(response)
+            except jsonschema.ValidationError as e:
+                _log.error('Response for "%s" violates its schema: %s', route, e.message)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self._mode,
+                'sampleRate': self._sample_rate,
+                'checked': dict(self._checked),
+                'violations': dict(self._violations)
+            }
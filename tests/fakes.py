@@ -0,0 +1,22 @@
+"""Stand-ins for the clocks the code under test reads."""
+
+import datetime
+
+
+class FakeTime(object):
+    """A time function returning now, which tests move by hand, and which moves by step per call."""
+
+    def __init__(self, now=0.0, step=0.0):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class Clock(object):
+    """The wall clock, in UTC, as the model wants it."""
+
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
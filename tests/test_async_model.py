@@ -0,0 +1,48 @@
+import re
+import unittest
+
+import sqlalchemy as sql
+
+import inventory.async_model as async_model
+import inventory.model as model
+
+
+class StatementTestCase(unittest.TestCase):
+    def test_parameters_in_order(self):
+        """Parameters become $n in the order they appear in the SQL, whatever order they come in."""
+        menu_item = model._menu_item
+        statement = async_model._Statement(
+            sql.select([menu_item.c.id])
+            .where(sql.and_(
+                menu_item.c.id > sql.bindparam('after_id'),
+                menu_item.c.org_id == sql.bindparam('org_id')))
+            .order_by(menu_item.c.id)
+            .limit(sql.bindparam('limit')))
+
+        self.assertRegex(statement.sql, r'(?s)\.id > \$1 AND .*\.org_id = \$2 .* LIMIT \$3')
+        self.assertEqual(statement.args(org_id=1, limit=10, after_id=5), [5, 1, 10])
+
+    def test_casts_are_kept(self):
+        """Postgres casts are not mistaken for parameters."""
+        statement = async_model._Statement(
+            sql.select([sql.literal_column("'{}'::jsonb")])
+            .where(model._org.c.id == sql.bindparam('org_id')))
+
+        self.assertIn("'{}'::jsonb", statement.sql)
+        self.assertIn('= $1', statement.sql)
+        self.assertEqual(statement.args(org_id=3), [3])
+
+    def test_model_statements(self):
+        """Every statement AsyncModel runs numbers its parameters from $1, one per argument."""
+        for name, statement in vars(async_model).items():
+            if not isinstance(statement, async_model._Statement):
+                continue
+
+            with self.subTest(statement=name):
+                numbers = sorted(set(int(n) for n in re.findall(r'\$(\d+)', statement.sql)))
+                self.assertNotRegex(statement.sql, r'(?<![:\w]):\d')
+                self.assertEqual(numbers, list(range(1, len(statement._names) + 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import unittest
+
+from aiohttp import test_utils
+from aiohttp import web
+
+import inventory.async_server as async_server
+import inventory.cache as cache
+import inventory.codec as codec
+import inventory.compression as compression
+import inventory.config as config
+import inventory.model as model
+import inventory.validation as validation
+
+
+class FakeAsyncModel(object):
+    """Stands in for AsyncModel, with a single webshop and a count of the queries."""
+
+    def __init__(self):
+        self.webshops = {'pizza': (1, 7, {'title': 'Pizza', 'items': ['Pizza'] * 100})}
+        self.calls = []
+
+    async def get_webshop_content_version(self, subdomain):
+        self.calls.append('get_webshop_content_version')
+        org_id, content_version, _ = self._webshop(subdomain)
+        return org_id, content_version
+
+    async def get_webshop_info_with_version(self, subdomain):
+        self.calls.append('get_webshop_info_with_version')
+        return self._webshop(subdomain)
+
+    def _webshop(self, subdomain):
+        if subdomain not in self.webshops:
+            raise model.OrgDoesNotExistError('Org does not exist')
+        return self.webshops[subdomain]
+
+
+class WebshopInfoTestCase(unittest.TestCase):
+    PIZZA_HOST = 'pizza.{}'.format(config.MASTER_DOMAIN)
+    PASTA_HOST = 'pasta.{}'.format(config.MASTER_DOMAIN)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.model = FakeAsyncModel()
+        self.app = web.Application()
+        self.app['model'] = self.model
+
+        self.saved = (async_server.response_validator, async_server.webshop_cache,
+                      async_server.webshop_routes, async_server.compressor)
+        async_server.response_validator = validation.ResponseValidator(
+            mode=validation.ResponseValidator.OFF)
+        async_server.webshop_cache = cache.WebshopCache(max_size=10, ttl=30)
+        async_server.webshop_routes = cache.WebshopRoutes(
+            master_domain=config.MASTER_DOMAIN, negative_cache_size=10, negative_ttl=30)
+        async_server.compressor = compression.Compressor(
+            min_size=256, encodings=[compression.GZIP])
+
+    def tearDown(self):
+        (async_server.response_validator, async_server.webshop_cache,
+         async_server.webshop_routes, async_server.compressor) = self.saved
+        self.loop.close()
+
+    def _get(self, host, headers=None):
+        request_headers = {'Host': host}
+        request_headers.update(headers or {})
+        request = test_utils.make_mocked_request(
+            'GET', '/webshop', headers=request_headers, app=self.app)
+        return self.loop.run_until_complete(async_server.webshop_info(request))
+
+    def test_get(self):
+        """GET /webshop returns the webshop and its ETag."""
+        response = self._get(self.PIZZA_HOST)
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['ETag'], '"1-7"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(
+            codec.loads(response.body), {'webshopInfo': self.model.webshops['pizza'][2]})
+
+    def test_not_modified(self):
+        """GET /webshop with a matching If-None-Match is a 304, with the headers of the 200."""
+        self._get(self.PIZZA_HOST)
+        response = self._get(self.PIZZA_HOST, {'If-None-Match': '"1-7"'})
+
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['ETag'], '"1-7"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(self.model.calls, ['get_webshop_info_with_version'])
+
+    def test_not_modified_compressed(self):
+        """GET /webshop with the gzip ETag is a 304 with that ETag, without reading the webshop."""
+        response = self._get(
+            self.PIZZA_HOST, {'If-None-Match': '"1-7-gzip"', 'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['ETag'], '"1-7-gzip"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(self.model.calls, ['get_webshop_content_version'])
+
+        self._get(self.PIZZA_HOST)
+        response = self._get(
+            self.PIZZA_HOST, {'If-None-Match': '"1-7-gzip"', 'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.headers['ETag'], '"1-7-gzip"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_stale_etag(self):
+        """GET /webshop with an old ETag returns the webshop."""
+        response = self._get(self.PIZZA_HOST, {'If-None-Match': '"1-6"'})
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['ETag'], '"1-7"')
+
+    def test_not_found(self):
+        """GET /webshop for an unknown webshop is a 404, and the host is remembered as missing."""
+        response = self._get(self.PASTA_HOST)
+
+        self.assertEqual(response.status, 404)
+        self.assertTrue(async_server.webshop_routes.is_missing(self.PASTA_HOST))
+
+        response = self._get(self.PASTA_HOST)
+
+        self.assertEqual(response.status, 404)
+        self.assertEqual(self.model.calls, ['get_webshop_info_with_version'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import hmac
+import json
+import unittest
+
+import falcon
+import falcon.testing
+
+import inventory.auth as auth
+import tests.fakes as fakes
+
+
+def _token(claims, key=b'secret', alg='HS256'):
+    def encode(data):
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+    signing_input = '{}.{}'.format(
+        encode(json.dumps({'alg': alg, 'typ': 'JWT'}).encode('utf-8')),
+        encode(json.dumps(claims).encode('utf-8')))
+    signature = hmac.new(key, signing_input.encode('ascii'), hashlib.sha256).digest()
+    return '{}.{}'.format(signing_input, encode(signature))
+
+
+class FakeIdentityMiddleware(object):
+    """A stand-in for identity.AuthMiddleware, which counts the calls to the identity service."""
+
+    def __init__(self):
+        self.users = {}
+        self.calls = 0
+
+    def process_resource(self, req, resp, resource, params=None):
+        if getattr(resource, 'AUTH_NOT_REQUIRED', False):
+            return
+
+        self.calls += 1
+        user = self.users.get(req.get_header('Authorization'))
+        if user is None:
+            raise falcon.HTTPUnauthorized(title='Unauthorized', description='Unauthorized')
+        req.context['user'] = user
+
+
+class UserResource(object):
+    def on_get(self, req, resp):
+        resp.body = json.dumps(req.context['user'])
+
+
+class PublicResource(object):
+    AUTH_NOT_REQUIRED = True
+
+    def on_get(self, req, resp):
+        resp.body = json.dumps('user' in req.context)
+
+
+class CachingAuthMiddlewareTestCase(falcon.testing.TestCase):
+    def setUp(self):
+        super(CachingAuthMiddlewareTestCase, self).setUp()
+        self.the_time = fakes.FakeTime(now=1000.0)
+        self.identity = FakeIdentityMiddleware()
+        self.token_cache = auth.TokenCache(max_size=10, ttl=60, the_time=self.the_time)
+        self.token_verifier = auth.TokenVerifier(
+            keys=['old', 'secret'], audience='inventory', the_time=self.the_time)
+        self.api = falcon.API(middleware=[
+            auth.CachingAuthMiddleware(self.identity, self.token_cache, self.token_verifier)])
+        self.api.add_route('/user', UserResource())
+        self.api.add_route('/public', PublicResource())
+
+    def _get(self, token, path='/user'):
+        return self.simulate_get(path, headers={'Authorization': 'Bearer ' + token})
+
+    def test_repeat_tokens_skip_identity(self):
+        """Only the first use of a token goes to the identity service, until the cache expires."""
+        self.identity.users['Bearer opaque'] = {'id': 7}
+
+        for _ in range(3):
+            self.assertEqual(self._get('opaque').json, {'id': 7})
+        self.the_time.now += 60
+        self.assertEqual(self._get('opaque').json, {'id': 7})
+
+        self.assertEqual(self.identity.calls, 2)
+        self.assertEqual(
+            self.token_cache.stats(), {'size': 1, 'hits': 2, 'misses': 2, 'revoked': 0})
+
+    def test_rejected_tokens_are_not_cached(self):
+        """Tokens the identity service turns away are asked about every time."""
+        for _ in range(2):
+            self.assertEqual(self._get('unknown').status, falcon.HTTP_401)
+
+        self.assertEqual(self.identity.calls, 2)
+
+    def test_revocation(self):
+        """Revoked tokens, and all tokens of a revoked user, go to the identity service again."""
+        self.identity.users['Bearer one'] = {'id': 7}
+        self.identity.users['Bearer two'] = {'id': 7}
+        self._get('one')
+        self._get('two')
+
+        self.token_cache.revoke('Bearer one')
+        self._get('one')
+        self.token_cache.revoke_user(7)
+        self._get('one')
+        self._get('two')
+
+        self.assertEqual(self.identity.calls, 5)
+
+    def test_local_verification(self):
+        """Forged, expired and foreign tokens are turned away without calling identity."""
+        valid = _token({'sub': 'auth0|1', 'aud': 'inventory', 'exp': 1030})
+        self.identity.users['Bearer ' + valid] = {'id': 7}
+
+        for token in [
+                _token({'aud': 'inventory', 'exp': 1030}, key=b'forged'),
+                _token({'aud': 'inventory', 'exp': 1000}),
+                _token({'aud': 'other', 'exp': 1030}),
+                valid[:-2]]:
+            self.assertEqual(self._get(token).status, falcon.HTTP_401)
+        self.assertEqual(self.identity.calls, 0)
+
+        self.assertEqual(self._get(valid).json, {'id': 7})
+        self.assertEqual(self._get(valid).json, {'id': 7})
+        self.assertEqual(self.identity.calls, 1)
+
+        # The cached user goes with the token, well before the cache would have expired it.
+        self.the_time.now = 1030
+        self.assertEqual(self._get(valid).status, falcon.HTTP_401)
+        self.assertEqual(self.token_verifier.stats(), {
+            'verified': 2, 'rejected': 5, 'notVerifiable': 0})
+
+    def test_auth_not_required(self):
+        """Resources which need no auth are left to the wrapped middleware."""
+        self.assertEqual(self._get('unknown', '/public').json, False)
+        self.assertEqual(self.simulate_get('/public').json, False)
+        self.assertEqual(self.identity.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+import inventory.cache as cache
+import tests.fakes as fakes
+
+
+class LruCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        """The least recently used entry goes first once the cache is full."""
+        lru_cache = cache.LruCache(max_size=2)
+
+        lru_cache.put('a', 1)
+        lru_cache.put('b', 2)
+        lru_cache.get('a')
+        lru_cache.put('c', 3)
+
+        self.assertEqual(lru_cache.get('a'), 1)
+        self.assertIsNone(lru_cache.get('b'))
+        self.assertEqual(lru_cache.get('c'), 3)
+
+    def test_expires_entries(self):
+        """Entries are gone once their time to live passes."""
+        the_time = fakes.FakeTime()
+        lru_cache = cache.LruCache(max_size=2, ttl=10, the_time=the_time)
+
+        lru_cache.put('a', 1)
+        the_time.now = 9.9
+        self.assertEqual(lru_cache.get('a'), 1)
+        the_time.now = 10.0
+        self.assertIsNone(lru_cache.get('a'))
+        self.assertEqual(len(lru_cache), 0)
+
+    def test_zero_size_holds_nothing(self):
+        """A cache of size zero is disabled."""
+        lru_cache = cache.LruCache(max_size=0)
+
+        lru_cache.put('a', 1)
+
+        self.assertIsNone(lru_cache.get('a'))
+
+
+class WebshopCacheTestCase(unittest.TestCase):
+    def test_invalidates_by_org(self):
+        """A change to an org drops just its entries."""
+        webshop_cache = cache.WebshopCache(max_size=10, ttl=60)
+
+        one = cache.WebshopResponse(1, '"1-1"', b'{"one"}', {})
+        two = cache.WebshopResponse(2, '"2-1"', b'{"two"}', {})
+
+        webshop_cache.put('one', one, webshop_cache.generation())
+        webshop_cache.put('two', two, webshop_cache.generation())
+        webshop_cache.on_org_changed(1)
+
+        self.assertIsNone(webshop_cache.get('one'))
+        self.assertEqual(webshop_cache.get('two'), two)
+        self.assertEqual(webshop_cache.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+    def test_ignores_responses_loaded_before_a_change(self):
+        """A response loaded before a write, but stored after it, is not cached."""
+        webshop_cache = cache.WebshopCache(max_size=10, ttl=60)
+
+        generation = webshop_cache.generation()
+        webshop_cache.on_org_changed(1)
+        webshop_cache.put('one', cache.WebshopResponse(1, '"1-1"', b'{"stale"}', {}), generation)
+
+        self.assertIsNone(webshop_cache.get('one'))
+
+
+class WebshopRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.the_time = fakes.FakeTime()
+        self.webshop_routes = cache.WebshopRoutes(
+            master_domain='example.com', negative_cache_size=2, negative_ttl=30,
+            the_time=self.the_time)
+        self.webshop_routes.load([('pizza', 1), ('pasta', 2)])
+
+    def test_loaded_and_renamed(self):
+        """Loaded hosts are known, and a subdomain change replaces the old host of the org."""
+        self.webshop_routes.on_subdomain_changed(1, 'pizzeria')
+
+        self.assertIsNone(self.webshop_routes.get('pizza.example.com'))
+        self.assertEqual(self.webshop_routes.get('pizzeria.example.com'), 'pizzeria')
+        self.assertEqual(self.webshop_routes.get('pasta.example.com'), 'pasta')
+
+    def test_missing_expire(self):
+        """Missing hosts are turned away until their time to live runs out."""
+        self.webshop_routes.missing('pasta.example.com')
+        self.webshop_routes.missing('salad.example.com')
+
+        self.assertIsNone(self.webshop_routes.get('pasta.example.com'))
+        self.assertTrue(self.webshop_routes.is_missing('pasta.example.com'))
+        self.the_time.now = 30.0
+        self.assertFalse(self.webshop_routes.is_missing('salad.example.com'))
+        self.assertEqual(
+            self.webshop_routes.stats(),
+            {'size': 1, 'missingSize': 1, 'known': 0, 'turnedAway': 1})
+
+    def test_loaded_once_on_first_lookup(self):
+        """Routes are loaded on the first lookup only, and a failed load is not retried."""
+        loads = []
+
+        def load_routes():
+            loads.append(True)
+            raise RuntimeError('No database')
+
+        webshop_routes = cache.WebshopRoutes(
+            master_domain='example.com', negative_cache_size=2, negative_ttl=30,
+            load_routes=load_routes)
+
+        self.assertEqual(loads, [])
+        self.assertIsNone(webshop_routes.get('pizza.example.com'))
+        self.assertIsNone(webshop_routes.get('pizza.example.com'))
+        self.assertEqual(loads, [True])
+
+    def test_found_clears_missing(self):
+        """A host which turns out to exist is no longer turned away."""
+        self.webshop_routes.missing('salad.example.com')
+        self.webshop_routes.found('salad.example.com', 'salad', 3)
+
+        self.assertFalse(self.webshop_routes.is_missing('salad.example.com'))
+        self.assertEqual(self.webshop_routes.get('salad.example.com'), 'salad')
+
+
+if __name__ == '__main__':
+    unittest.main()
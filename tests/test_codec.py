@@ -0,0 +1,40 @@
+import unittest
+
+import inventory.codec as codec
+
+
+class CodecTestCase(unittest.TestCase):
+    DOCUMENT = {
+        'id': 1,
+        'name': 'Piță cu brânză',
+        'uri': 'http://example.com/a.png',
+        'keywords': ['cheese', 'flour'],
+        'openingHours': {'weekday': {'start': {'hour': 8, 'minute': 0}}},
+        'archived': None,
+        'visible': True
+    }
+
+    def test_round_trip(self):
+        """Documents survive encoding and decoding, from bytes or str."""
+        data = codec.dumps(self.DOCUMENT)
+
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(codec.loads(data), self.DOCUMENT)
+        self.assertEqual(codec.loads(data.decode('utf-8')), self.DOCUMENT)
+
+    def test_stdlib_compatible(self):
+        """The stdlib fallback reads what the selected implementation writes, and vice versa."""
+        self.assertEqual(codec._stdlib_loads(codec.dumps(self.DOCUMENT)), self.DOCUMENT)
+        self.assertEqual(codec.loads(codec._stdlib_dumps(self.DOCUMENT)), self.DOCUMENT)
+
+    def test_malformed_input(self):
+        """Malformed input raises a ValueError."""
+        for data in [b'{"id": ', b'', b'\xff\xfe', '{"id": 1,}']:
+            with self.assertRaises(ValueError):
+                codec.loads(data)
+            with self.assertRaises(ValueError):
+                codec._stdlib_loads(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import jsonschema
+
+import inventory.compiled_schemas as compiled_schemas
+import inventory.schemas as schemas
+
+
+class CompiledSchemaTestCase(unittest.TestCase):
+    IMAGE = {'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}
+    MENU_ITEM = {
+        'id': 1,
+        'timeCreatedTs': 1000,
+        'name': 'Pizza',
+        'description': 'Tasty',
+        'keywords': ['cheese'],
+        'ingredients': ['flour', 'tomatoes'],
+        'imageSet': [IMAGE]
+    }
+
+    def test_every_schema_is_compiled(self):
+        """Each schema constant has a compiled counterpart with the same name."""
+        for name, value in vars(schemas).items():
+            if isinstance(value, dict) and '$schema' in value:
+                self.assertIsInstance(
+                    getattr(compiled_schemas, name), compiled_schemas.CompiledSchema)
+
+    def test_valid_instances(self):
+        """Valid instances pass the compiled validators."""
+        compiled_schemas.MENU_ITEM.validate(self.MENU_ITEM)
+        compiled_schemas.MENU_ITEMS_RESPONSE.validate({'menuItems': [self.MENU_ITEM]})
+        compiled_schemas.MENU_SECTION_UPDATE_REQUEST.validate({'name': 'Drinks'})
+        compiled_schemas.MENU_SECTION.validate({
+            'id': 1, 'timeCreatedTs': 1000, 'name': 'Pizza', 'description': '',
+            'items': {'1': self.MENU_ITEM}})
+        compiled_schemas.MENU_ITEMS_PROJECTION_RESPONSE.validate(
+            {'menuItems': [{'id': 1, 'name': 'Pizza'}, self.MENU_ITEM]})
+
+    def test_invalid_instances(self):
+        """Invalid instances raise the same errors as jsonschema.validate."""
+        cases = [
+            (schemas.MENU_ITEM, dict(self.MENU_ITEM, id=True)),
+            (schemas.MENU_ITEM, dict(self.MENU_ITEM, id=1.0)),
+            (schemas.MENU_ITEM, dict(self.MENU_ITEM, extra='field')),
+            (schemas.MENU_ITEM, {k: v for k, v in self.MENU_ITEM.items() if k != 'name'}),
+            (schemas.IMAGE, dict(self.IMAGE, width=10)),
+            (schemas.KEYWORDS, ['a', 1]),
+            (schemas.MENU_SECTION_UPDATE_REQUEST, {}),
+            (schemas.MENU_ITEMS_BULK_CREATION_REQUEST, []),
+            (schemas.MENU_SECTION, {
+                'id': 1, 'timeCreatedTs': 1000, 'name': 'Pizza', 'description': '',
+                'items': {'one': self.MENU_ITEM}}),
+            (schemas.MENU_ITEMS_PROJECTION_RESPONSE, {'menuItems': [{'name': 'Pizza'}]}),
+            (schemas.MENU_ITEMS_PROJECTION_RESPONSE, {'menuItems': [{'id': 1, 'price': 10}]}),
+        ]
+
+        for schema, instance in cases:
+            compiled = compiled_schemas.CompiledSchema(schema)
+            self.assertFalse(compiled.is_valid(instance))
+
+            with self.assertRaises(jsonschema.ValidationError) as expected:
+                jsonschema.validate(instance, schema)
+            with self.assertRaises(jsonschema.ValidationError) as actual:
+                compiled.validate(instance)
+
+            self.assertEqual(str(expected.exception), str(actual.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
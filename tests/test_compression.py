@@ -0,0 +1,58 @@
+import gzip
+import unittest
+
+import inventory.compression as compression
+
+
+class CompressionTestCase(unittest.TestCase):
+    BODY = b'{"menuItems": [' + b','.join([b'{"name": "Pizza", "imageSet": []}'] * 100) + b']}'
+
+    def setUp(self):
+        self.compressor = compression.Compressor(min_size=1024, encodings=[compression.GZIP])
+
+    def test_negotiate(self):
+        """The accepted encoding is picked, unless refused, not accepted or the body is small."""
+        size = len(self.BODY)
+
+        self.assertEqual(self.compressor.negotiate('gzip, deflate', size), compression.GZIP)
+        self.assertEqual(self.compressor.negotiate('deflate;q=1, *;q=0.5', size), compression.GZIP)
+        self.assertEqual(self.compressor.negotiate('GZIP;q=0.1', size), compression.GZIP)
+        self.assertIsNone(self.compressor.negotiate(None, size))
+        self.assertIsNone(self.compressor.negotiate('deflate', size))
+        self.assertIsNone(self.compressor.negotiate('gzip;q=0', size))
+        self.assertIsNone(self.compressor.negotiate('gzip;q=bad', size))
+        self.assertIsNone(self.compressor.negotiate('gzip', 1023))
+        self.assertEqual(self.compressor.preferred('gzip'), compression.GZIP)
+        self.assertIsNone(self.compressor.preferred(None))
+
+    def test_encode_reuses_encoded_bodies(self):
+        """Bodies are compressed once per encoding when the compressed ones are kept."""
+        encoded_bodies = {}
+
+        first, encoding = self.compressor.encode('gzip', self.BODY, encoded_bodies)
+        second, _ = self.compressor.encode('gzip', self.BODY, encoded_bodies)
+
+        self.assertEqual(encoding, compression.GZIP)
+        self.assertIs(first, second)
+        self.assertEqual(gzip.decompress(first), self.BODY)
+        self.assertLess(len(first), len(self.BODY))
+        self.assertEqual(self.compressor.stats()['encodings']['gzip']['compressed'], 1)
+        self.assertEqual(self.compressor.stats()['encodings']['gzip']['reused'], 1)
+        self.assertEqual(self.compressor.encode('identity', self.BODY), (self.BODY, None))
+
+    def test_etags(self):
+        """Compressed representations have their own ETag, which maps back to the plain one."""
+        etag = compression.encoded_etag('"1-2"', compression.GZIP)
+
+        self.assertEqual(etag, '"1-2-gzip"')
+        self.assertEqual(compression.decoded_etag(etag), '"1-2"')
+        self.assertEqual(compression.decoded_etag('"1-2"'), '"1-2"')
+
+    def test_unsupported_encodings(self):
+        """Only the encodings which can be produced are allowed."""
+        with self.assertRaises(ValueError):
+            compression.Compressor(min_size=0, encodings=['deflate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+import inventory.database as database
+
+
+class AfterForkTestCase(unittest.TestCase):
+    def test_fresh_pool(self):
+        """After a fork engines get an empty pool, and inherited connections are left open."""
+        sql_engine = database.create_engine('sqlite://', pool_size=1)
+        inherited = sql_engine.raw_connection()
+        inherited_pool = sql_engine.pool
+
+        database.after_fork()
+
+        self.assertIsNot(sql_engine.pool, inherited_pool)
+        self.assertEqual(sql_engine.pool.checkedout(), 0)
+        self.assertEqual(sql_engine.pool.stats()['checkouts'], 0)
+        self.assertEqual(inherited.cursor().execute('SELECT 1').fetchone()[0], 1)
+
+        with sql_engine.connect() as conn:
+            self.assertEqual(conn.execute('SELECT 1').scalar(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,19 @@
+import shutil
+import tempfile
 import unittest
 
+import falcon
 import falcon.testing
 
+import inventory.cache as cache
+import inventory.codec as codec
+import inventory.compression as compression
+import inventory.config as config
+import inventory.handlers as handlers
+import inventory.model as model
+import inventory.snapshots as snapshots
+import inventory.validation as validation
+
 
 class OrgResourceTestCase(falcon.testing.TestCase):
     def test_get(self):
@@ -9,5 +21,173 @@ class OrgResourceTestCase(falcon.testing.TestCase):
         pass
 
 
+class FailingHostToSubdomainValidator(object):
+    def validate(self, host):
+        raise AssertionError('Host {} should not be validated'.format(host))
+
+
+class WebshopSubdomainTestCase(unittest.TestCase):
+    def test_missing_hosts_skip_validation(self):
+        """Hosts in the negative cache are turned away before they are validated."""
+        webshop_routes = cache.WebshopRoutes(
+            master_domain='example.com', negative_cache_size=10, negative_ttl=30)
+        webshop_routes.missing('junk.example.com')
+        req = falcon.Request(falcon.testing.create_environ(host='junk.example.com'))
+
+        with self.assertRaises(falcon.HTTPNotFound):
+            handlers._webshop_subdomain(FailingHostToSubdomainValidator(), webshop_routes, req)
+
+
+
+class FakeWebshopModel(object):
+    def __init__(self):
+        self.webshops = {'pizza': (1, 7, {'title': 'Pizza', 'items': ['Pizza'] * 100})}
+        self.calls = []
+
+    def get_webshop_content_version(self, subdomain):
+        self.calls.append('get_webshop_content_version')
+        org_id, content_version, _ = self._webshop(subdomain)
+        return org_id, content_version
+
+    def get_webshop_info_with_version(self, subdomain):
+        self.calls.append('get_webshop_info_with_version')
+        return self._webshop(subdomain)
+
+    def get_org_webshop_info_with_version(self, org_id):
+        org_id, content_version, webshop_info = self.webshops['pizza']
+        return 'pizza', content_version, webshop_info
+
+    def _webshop(self, subdomain):
+        if subdomain not in self.webshops:
+            raise model.OrgDoesNotExistError()
+        return self.webshops[subdomain]
+
+
+class WebshopInfoResourceTestCase(unittest.TestCase):
+    HOST = 'pizza.{}'.format(config.MASTER_DOMAIN)
+    GZIP_HEADERS = {'If-None-Match': '"1-7-gzip"', 'Accept-Encoding': 'gzip'}
+
+    def setUp(self):
+        self.model = FakeWebshopModel()
+        self.compressor = compression.Compressor(min_size=256, encodings=[compression.GZIP])
+        self.response_validator = validation.ResponseValidator(validation.ResponseValidator.OFF)
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _client(self, snapshot_store=None):
+        api = falcon.API()
+        api.add_route('/webshop', handlers.WebshopInfoResource(
+            validation.HostToSubdomainValidator(),
+            cache.WebshopRoutes(
+                master_domain=config.MASTER_DOMAIN, negative_cache_size=10, negative_ttl=30),
+            self.model, self.response_validator, cache.WebshopCache(max_size=10, ttl=30),
+            self.compressor, snapshot_store))
+        return falcon.testing.TestClient(api)
+
+    def _get(self, client, headers):
+        headers = dict(headers, Host=self.HOST)
+        return client.simulate_get('/webshop', headers=headers)
+
+    def assertNotModifiedCompressed(self, response):
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], '"1-7-gzip"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_not_modified_compressed(self):
+        """A 304 for the gzip ETag carries it and Vary, as the 200 it stands for does."""
+        client = self._client()
+
+        response = self._get(client, self.GZIP_HEADERS)
+        self.assertNotModifiedCompressed(response)
+        self.assertEqual(self.model.calls, ['get_webshop_content_version'])
+
+        response = self._get(client, {'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], '"1-7-gzip"')
+
+        self.assertNotModifiedCompressed(self._get(client, self.GZIP_HEADERS))
+
+        response = self._get(client, {'If-None-Match': '"1-7-gzip"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], '"1-7"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_not_modified_snapshot(self):
+        """A 304 from a snapshot carries the ETag of the encoding the 200 would be sent in."""
+        snapshot_store = snapshots.SnapshotStore(self.path, self.compressor)
+        snapshots.SnapshotPublisher(
+            snapshot_store, self.model, self.response_validator).publish(1)
+        client = self._client(snapshot_store)
+
+        self.assertNotModifiedCompressed(self._get(client, self.GZIP_HEADERS))
+        self.assertEqual(self.model.calls, [])
+
+
+
+class FakeExportModel(object):
+    BATCHES = [
+        [{'menuSection': {'id': 1, 'name': 'Pizza'}}, {'menuSection': {'id': 2, 'name': 'Pasta'}}],
+        [{'menuItem': {'id': 3, 'sectionId': 1, 'name': 'Margherita\nwith a newline'}}]]
+
+    def __init__(self):
+        self.batches_read = 0
+        self.closed = False
+
+    def get_org_content_version(self, user_id):
+        return 1, 2
+
+    def export_menu(self, user_id):
+        return self._export_menu()
+
+    def _export_menu(self):
+        try:
+            for batch in self.BATCHES:
+                self.batches_read += 1
+                yield batch
+        finally:
+            self.closed = True
+
+
+class MenuExportResourceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.model = FakeExportModel()
+        self.resource = handlers.MenuExportResource(self.model)
+
+    def _get(self):
+        req = falcon.Request(falcon.testing.create_environ(path='/org/menu/export'))
+        req.context['user'] = {'id': 10}
+        resp = falcon.Response()
+        self.resource.on_get(req, resp)
+        return resp
+
+    def test_lines(self):
+        """The export is one JSON record per line, streamed as a chunk per batch."""
+        resp = self._get()
+        chunks = list(resp.stream)
+
+        self.assertEqual(resp.content_type, 'application/x-ndjson')
+        self.assertEqual(resp.etag, '"1-2"')
+        self.assertEqual(len(chunks), len(self.model.BATCHES))
+        body = b''.join(chunks)
+        self.assertTrue(body.endswith(b'\n'))
+        self.assertEqual(
+            [codec.loads(line) for line in body.split(b'\n')[:-1]],
+            [record for batch in self.model.BATCHES for record in batch])
+        self.assertTrue(self.model.closed)
+
+    def test_client_goes_away(self):
+        """Closing the stream early, as servers do when clients go away, closes the export."""
+        resp = self._get()
+
+        next(resp.stream)
+        self.assertFalse(self.model.closed)
+        resp.stream.close()
+
+        self.assertTrue(self.model.closed)
+        self.assertEqual(self.model.batches_read, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
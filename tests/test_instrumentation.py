@@ -0,0 +1,85 @@
+import unittest
+
+import sqlalchemy
+
+import inventory.instrumentation as instrumentation
+import tests.fakes as fakes
+
+
+class StartupTimerTestCase(unittest.TestCase):
+    def test_phases(self):
+        """Phases are kept in the order they ran, including ones which failed."""
+        timer = instrumentation.StartupTimer(the_time=fakes.FakeTime(step=0.25))
+
+        with timer.phase('validators'):
+            pass
+        with self.assertRaises(ValueError):
+            with timer.phase('database'):
+                raise ValueError()
+        timer.record('worker', 2.0)
+
+        stats = timer.stats()
+        self.assertEqual([p['name'] for p in stats['phases']], ['validators', 'database', 'worker'])
+        self.assertEqual(stats['seconds'], 2.5)
+        self.assertEqual(timer.describe(), 'validators 0.250s, database 0.250s, worker 2.000s')
+
+
+class StatementPreparationTimerTestCase(unittest.TestCase):
+    def test_times_statements_and_requests(self):
+        """Every statement is timed, and only those inside a request count towards it."""
+        sql_engine = sqlalchemy.create_engine('sqlite://')
+        timer = instrumentation.StatementPreparationTimer(the_time=fakes.FakeTime(step=0.5))
+        timer.install(sql_engine)
+
+        with sql_engine.connect() as conn:
+            conn.execute(sqlalchemy.select([sqlalchemy.literal(1)])).close()
+
+            timer.begin_request()
+            conn.execute(sqlalchemy.select([sqlalchemy.literal(1)])).close()
+            conn.execute(sqlalchemy.select([sqlalchemy.literal(2)])).close()
+            timer.end_request()
+
+        stats = timer.stats()
+        self.assertEqual(stats['statements'], 3)
+        self.assertEqual(stats['seconds'], 1.5)
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['secondsPerRequest'], 1.0)
+        self.assertEqual(stats['maxSecondsPerRequest'], 1.0)
+
+    def test_no_requests(self):
+        """Stats are well defined before any request finishes."""
+        timer = instrumentation.StatementPreparationTimer()
+
+        timer.end_request()
+
+        self.assertEqual(timer.stats()['requests'], 0)
+        self.assertEqual(timer.stats()['secondsPerRequest'], 0.0)
+
+
+class MeteredQueuePoolTestCase(unittest.TestCase):
+    def test_checkouts_and_timeouts(self):
+        """Checkouts are timed, the peak use of the pool is kept, and timeouts are counted."""
+        sql_engine = sqlalchemy.create_engine(
+            'sqlite://', poolclass=instrumentation.MeteredQueuePool, pool_size=1, max_overflow=1,
+            pool_timeout=0.01)
+        sql_engine.pool._the_time = fakes.FakeTime(step=0.5)
+
+        first = sql_engine.connect()
+        second = sql_engine.connect()
+        with self.assertRaises(sqlalchemy.exc.TimeoutError):
+            sql_engine.connect()
+        second.close()
+
+        stats = sql_engine.pool.stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['waitSeconds'], 1.0)
+        self.assertEqual(stats['checkedOut'], 1)
+        self.assertEqual(stats['saturation'], 0.5)
+        self.assertEqual(stats['maxSaturation'], 1.0)
+        self.assertEqual(stats['timeouts'], 1)
+
+        first.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
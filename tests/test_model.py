@@ -0,0 +1,222 @@
+"""Model tests.
+
+The projection tests run on their own. The others need a scratch Postgres database, given through
+TEST_DATABASE_URL, and are skipped without one. The migrations are applied to it, and each test
+works on an org of its own.
+"""
+
+import datetime
+import os
+import os.path
+import random
+import unittest
+
+import sqlalchemy as sql
+
+import inventory.cache as cache
+import inventory.model as model
+import tests.fakes as fakes
+
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+MIGRATIONS_PATH = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+
+
+class ProjectTestCase(unittest.TestCase):
+    IMAGE_SET = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+    ROW = {
+        'id': 3,
+        'time_created': datetime.datetime(2017, 1, 1, tzinfo=datetime.timezone.utc),
+        'name': 'Pizza',
+        'description': 'A pizza',
+        'keywords': ['pizza'],
+        'ingredients': [{'name': 'Cheese'}],
+        'image_set': IMAGE_SET
+    }
+
+    def _project(self, fields):
+        return model._project(
+            model._fetch_menu_items_page, model._menu_item_serializer, model._menu_item_columns,
+            fields)
+
+    def _selected(self, statement):
+        return [c.name for c in statement.inner_columns]
+
+    def test_no_fields(self):
+        """Without fields, the statement and serializer are used as they are."""
+        self.assertEqual(
+            self._project(None), (model._fetch_menu_items_page, model._menu_item_serializer))
+
+    def test_fields(self):
+        """Only the id and the given fields are selected and serialized, keeping the conditions."""
+        statement, serializer = self._project(frozenset(['name', 'timeCreatedTs']))
+
+        self.assertEqual(self._selected(statement), ['id', 'time_created', 'name'])
+        self.assertEqual(
+            serializer(self.ROW), {'id': 3, 'timeCreatedTs': 1483228800, 'name': 'Pizza'})
+        self.assertEqual(
+            str(statement.whereclause), str(model._fetch_menu_items_page.whereclause))
+        self.assertIs(self._project(frozenset(['timeCreatedTs', 'name']))[0], statement)
+
+    def test_nested_fields(self):
+        """Fields holding JSON documents are selected whole, with everything nested in them."""
+        statement, serializer = self._project(frozenset(['imageSet']))
+
+        self.assertEqual(self._selected(statement), ['id', 'image_set'])
+        self.assertEqual(serializer(self.ROW), {'id': 3, 'imageSet': self.IMAGE_SET})
+
+    def test_unknown_fields(self):
+        """Unknown fields, including paths into nested documents, select only the id."""
+        statement, serializer = self._project(frozenset(['price', 'imageSet.uri', 'image_set']))
+
+        self.assertEqual(self._selected(statement), ['id'])
+        self.assertEqual(serializer(self.ROW), {'id': 3})
+        self.assertNotIn('imageSet.uri', model.MENU_ITEM_FIELDS)
+
+
+
+@unittest.skipIf(TEST_DATABASE_URL is None, 'TEST_DATABASE_URL is not set')
+class ModelTestCase(unittest.TestCase):
+    EXPORT_BATCH_SIZE = 2
+
+    @classmethod
+    def setUpClass(cls):
+        import startup_migrations
+        startup_migrations.migrate(TEST_DATABASE_URL, MIGRATIONS_PATH)
+
+        cls.sql_engine = sql.create_engine(TEST_DATABASE_URL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sql_engine.dispose()
+
+    def setUp(self):
+        self.model = model.Model(
+            fakes.Clock(), self.sql_engine,
+            org_id_cache=cache.LruCache(max_size=100),
+            export_batch_size=self.EXPORT_BATCH_SIZE)
+        self.user_id = random.randint(10**6, 10**9)
+        self.model.create_org(
+            self.user_id, 'Model {}'.format(self.user_id), 'A restaurant', [], 'Main Street',
+            {'weekday': {}, 'saturday': {}, 'sunday': {}}, [])
+
+    def _menu_item(self, name):
+        return {
+            'name': name,
+            'description': 'An item',
+            'keywords': [],
+            'ingredients': [],
+            'imageSet': []
+        }
+
+    def _import_menu(self, sections, items):
+        return self.model.import_menu(self.user_id, [
+            {'name': 'Section {}'.format(s), 'description': 'A section',
+             'items': [self._menu_item('Item {} {}'.format(s, i)) for i in range(items)]}
+            for s in range(sections)])
+
+    def _multi_query_model(self):
+        return model.Model(
+            fakes.Clock(), self.sql_engine, webshop_query=model.Model.WEBSHOP_QUERY_MULTI)
+
+    def _export(self):
+        return [r for b in self.model.export_menu(self.user_id) for r in b]
+
+    def test_import_menu(self):
+        """Sections and their items are created in the order given, in the sections given."""
+        menu_sections = self.model.import_menu(self.user_id, [
+            {'name': 'Pizza', 'description': 'A section',
+             'items': [self._menu_item('Margherita'), self._menu_item('Diavola')]},
+            {'name': 'Drinks', 'description': 'A section', 'items': []},
+            {'name': 'Pasta', 'description': 'A section',
+             'items': [self._menu_item('Carbonara')]}])
+
+        self.assertEqual([ms['name'] for ms in menu_sections], ['Pizza', 'Drinks', 'Pasta'])
+        self.assertEqual(
+            [[mi['name'] for mi in ms['items'].values()] for ms in menu_sections],
+            [['Margherita', 'Diavola'], [], ['Carbonara']])
+        self.assertEqual(
+            [ms['name'] for ms in self.model.get_all_menu_sections(self.user_id)],
+            ['Pizza', 'Drinks', 'Pasta'])
+
+        section_ids = {ms['name']: ms['id'] for ms in menu_sections}
+        menu_items = [r['menuItem'] for r in self._export() if 'menuItem' in r]
+        self.assertEqual(
+            [(mi['sectionId'], mi['name']) for mi in menu_items],
+            [(section_ids['Pizza'], 'Margherita'), (section_ids['Pizza'], 'Diavola'),
+             (section_ids['Pasta'], 'Carbonara')])
+
+    def test_import_menu_is_atomic(self):
+        """An import which fails part of the way through leaves nothing behind."""
+        content_version = self.model.get_org_content_version(self.user_id)
+        broken_menu_item = dict(self._menu_item('Diavola'), description=None)
+
+        with self.assertRaises(sql.exc.IntegrityError):
+            self.model.import_menu(self.user_id, [
+                {'name': 'Pizza', 'description': 'A section',
+                 'items': [self._menu_item('Margherita'), broken_menu_item]}])
+
+        self.assertEqual(self.model.get_all_menu_sections(self.user_id), [])
+        self.assertEqual(self.model.get_all_menu_items(self.user_id), [])
+        self.assertEqual(self.model.get_org_content_version(self.user_id), content_version)
+
+    def test_webshop_queries_agree(self):
+        """The single statement webshop query returns what the query per table one does."""
+        menu_sections = self._import_menu(3, 3)
+        self.model.delete_menu_section(self.user_id, menu_sections[1]['id'])
+        self.model.delete_menu_item(self.user_id, int(next(iter(menu_sections[0]['items']))))
+        self.model.import_menu(self.user_id, [
+            {'name': 'Empty', 'description': 'A section', 'items': []}])
+        subdomain = self.model.get_platforms_website(self.user_id)['subdomain']
+
+        single = self.model.get_webshop_info_with_version(subdomain)
+        multi = self._multi_query_model().get_webshop_info_with_version(subdomain)
+
+        self.assertEqual(single, multi)
+        sections = single[2]['menu']['sections']
+        self.assertEqual(len(sections), 3)
+        self.assertNotIn(str(menu_sections[1]['id']), sections)
+        self.assertEqual(len(sections[str(menu_sections[0]['id'])]['items']), 2)
+
+    def test_webshop_queries_agree_without_menu(self):
+        """Both webshop queries agree on a webshop with no menu, and on a missing one."""
+        subdomain = self.model.get_platforms_website(self.user_id)['subdomain']
+        multi_model = self._multi_query_model()
+
+        self.assertEqual(
+            self.model.get_webshop_info_with_version(subdomain),
+            multi_model.get_webshop_info_with_version(subdomain))
+
+        for the_model in (self.model, multi_model):
+            with self.assertRaises(model.OrgDoesNotExistError):
+                the_model.get_webshop_info_with_version('missing-{}'.format(self.user_id))
+
+    def test_export_menu(self):
+        """The menu is exported in batches, sections first, and all of it."""
+        menu_sections = self._import_menu(2, 2)
+
+        batches = list(self.model.export_menu(self.user_id))
+
+        self.assertEqual([len(b) for b in batches], [2, 2, 2])
+        records = [r for b in batches for r in b]
+        self.assertEqual(
+            [r['menuSection']['id'] for r in records[:2]], [ms['id'] for ms in menu_sections])
+        self.assertEqual(
+            [r['menuItem']['id'] for r in records[2:]],
+            sorted(int(i) for ms in menu_sections for i in ms['items']))
+        self.assertEqual(self.sql_engine.pool.checkedout(), 0)
+
+    def test_export_menu_closed_early(self):
+        """Closing an export before its end gives its connection back to the pool."""
+        self._import_menu(2, 2)
+
+        batches = self.model.export_menu(self.user_id)
+        next(batches)
+        self.assertEqual(self.sql_engine.pool.checkedout(), 1)
+        batches.close()
+
+        self.assertEqual(self.sql_engine.pool.checkedout(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+"""Query plan regression tests for the statements the model runs.
+
+These need a scratch Postgres database, given through TEST_DATABASE_URL, and are skipped without
+one. The migrations are applied to it, a few orgs are seeded and then every statement is EXPLAINed
+with sequential scans disabled. The planner then only falls back to a sequential scan, or to an
+unselective scan of some index, when no index can serve the statement's conditions. Either fails
+the test.
+"""
+
+import json
+import os
+import os.path
+import random
+import unittest
+
+import sqlalchemy as sql
+
+import inventory.model as model
+import tests.fakes as fakes
+
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+MIGRATIONS_PATH = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+
+# Statements which read a whole table on purpose, only ever run once at startup.
+WHOLE_TABLE_STATEMENTS = frozenset(['_fetch_webshop_routes'])
+
+
+def _statements():
+    """All the statements the model runs, by name. Inserts never scan, so they are left out."""
+
+    return {name: statement for name, statement in vars(model).items()
+            if isinstance(statement, (sql.sql.expression.Select, sql.sql.expression.Update))}
+
+
+def _full_scans(plan, leading_columns):
+    """The scans in the plan which read a whole table, or a whole index.
+
+    An index is only really searched when its leading column is pinned by an equality, or for a
+    full-text index, matched against a query. Otherwise Postgres still lists an "Index Cond", but
+    it reads the whole index, or the tail of it from a range start, across all orgs.
+    """
+
+    scans = []
+
+    if plan['Node Type'] == 'Seq Scan':
+        scans.append('Seq Scan on {}'.format(plan['Relation Name']))
+    elif 'Index Name' in plan:
+        leading_column = leading_columns[plan['Index Name']]
+        index_cond = plan.get('Index Cond', '')
+        if '({} = '.format(leading_column) not in index_cond and \
+           '({} @@ '.format(leading_column) not in index_cond:
+            scans.append('{} using {} without {} = or @@ ...'.format(
+                plan['Node Type'], plan['Index Name'], leading_column))
+
+    for subplan in plan.get('Plans', []):
+        scans.extend(_full_scans(subplan, leading_columns))
+
+    return scans
+
+
+@unittest.skipIf(TEST_DATABASE_URL is None, 'TEST_DATABASE_URL is not set')
+class QueryPlansTestCase(unittest.TestCase):
+    ORGS = 20
+    SECTIONS = 5
+    ITEMS = 10
+
+    @classmethod
+    def setUpClass(cls):
+        import startup_migrations
+        startup_migrations.migrate(TEST_DATABASE_URL, MIGRATIONS_PATH)
+
+        cls.sql_engine = sql.create_engine(TEST_DATABASE_URL)
+        the_model = model.Model(fakes.Clock(), cls.sql_engine)
+        image_set = [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+        menu_item = {'name': 'Item', 'description': 'An item', 'keywords': [], 'ingredients': [],
+                     'imageSet': image_set}
+        base_user_id = random.randint(10**6, 10**9)
+
+        for o in range(cls.ORGS):
+            user_id = base_user_id + o
+            the_model.create_org(
+                user_id, 'Plans {} {}'.format(base_user_id, o), 'A restaurant', [], 'Main Street',
+                {'weekday': {}, 'saturday': {}, 'sunday': {}}, image_set)
+            menu_sections = the_model.import_menu(user_id, [
+                {'name': 'Section', 'description': 'A section', 'items': [menu_item] * cls.ITEMS}
+                for _ in range(cls.SECTIONS)])
+
+            # The statements are checked against the first org. The ids after its own belong to
+            # the orgs seeded later, so paging after them is not selective on id alone.
+            if o == 0:
+                menu_section = menu_sections[0]
+                cls.org_id = the_model.get_org(user_id)['id']
+                cls.user_id = user_id
+                cls.section_id = menu_section['id']
+                cls.item_id = int(next(iter(menu_section['items'])))
+                cls.subdomain = the_model.get_platforms_website(user_id)['subdomain']
+
+        with cls.sql_engine.begin() as conn:
+            conn.execute(sql.text('ANALYZE')).close()
+
+            result = conn.execute(sql.text("""
+                SELECT i.relname, a.attname
+                FROM pg_index x
+                    JOIN pg_class i ON i.oid = x.indexrelid
+                    JOIN pg_namespace n ON n.oid = i.relnamespace
+                    JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0]
+                WHERE n.nspname = 'inventory'"""))
+            cls.leading_columns = dict(result.fetchall())
+            result.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sql_engine.dispose()
+
+    def _params(self):
+        """Parameters for every statement, and the columns which updates set, by name."""
+
+        right_now = fakes.Clock().now()
+        org_id = {'org_id': self.org_id}
+        where_org_id = {'where_org_id': self.org_id}
+
+        return {
+            '_fetch_webshop_info': {'subdomain': self.subdomain},
+            '_fetch_org_id': {'user_id': self.user_id},
+            '_fetch_org': org_id,
+            '_fetch_org_content_version': org_id,
+            '_fetch_webshop_content_version': {'subdomain': self.subdomain},
+            '_fetch_org_by_subdomain': {'subdomain': self.subdomain},
+            '_fetch_webshop_routes': {},
+            '_bump_content_version': org_id,
+            '_fetch_restaurant': org_id,
+            '_update_restaurant': dict(where_org_id, name='Restaurant'),
+            '_fetch_menu_sections': org_id,
+            '_fetch_menu_sections_page': dict(org_id, after_id=self.section_id, limit=10),
+            '_fetch_menu_section': dict(org_id, section_id=self.section_id),
+            '_fetch_menu_section_ids': dict(org_id, section_ids=[self.section_id]),
+            '_update_menu_section': dict(where_org_id, where_id=self.section_id, name='Section'),
+            '_archive_menu_section': dict(
+                where_org_id, where_id=self.section_id, time_archived=right_now),
+            '_fetch_menu_items': org_id,
+            '_fetch_menu_items_page': dict(org_id, after_id=self.item_id, limit=10),
+            '_search_menu_items': dict(org_id, query='item:*', offset=0, limit=10),
+            '_fetch_menu_items_with_section_id': org_id,
+            '_export_menu_sections': org_id,
+            '_export_menu_items': org_id,
+            '_fetch_menu_items_for_section': dict(org_id, section_id=self.section_id),
+            '_fetch_menu_item': dict(org_id, item_id=self.item_id),
+            '_update_menu_item': dict(where_org_id, where_id=self.item_id, name='Item'),
+            '_archive_menu_item': dict(
+                where_org_id, where_id=self.item_id, time_archived=right_now),
+            '_archive_menu_items_for_section': dict(
+                where_org_id, where_section_id=self.section_id, time_archived=right_now),
+            '_fetch_platforms_website': org_id,
+            '_update_platforms_website': dict(where_org_id, subdomain=self.subdomain),
+            '_fetch_platforms_callcenter': org_id,
+            '_update_platforms_callcenter': dict(where_org_id, phone_number='+40700000000'),
+            '_fetch_platforms_emailcenter': org_id,
+            '_update_platforms_emailcenter': dict(where_org_id, email_name='contact'),
+            '_fetch_restaurant_changes': dict(org_id, since=1),
+            '_fetch_menu_section_changes': dict(org_id, since=1),
+            '_fetch_menu_item_changes': dict(org_id, since=1),
+            '_fetch_platforms_website_changes': dict(org_id, since=1),
+            '_fetch_platforms_callcenter_changes': dict(org_id, since=1),
+            '_fetch_platforms_emailcenter_changes': dict(org_id, since=1),
+        }
+
+    def _plan(self, cursor, statement, params):
+        compiled = statement.compile(dialect=self.sql_engine.dialect, column_keys=list(params))
+        cursor.execute(
+            'EXPLAIN (FORMAT JSON) {}'.format(compiled), compiled.construct_params(params))
+        plan = cursor.fetchone()[0]
+        # Depending on the driver, the plan comes back decoded or as text.
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']
+
+    def test_all_statements_covered(self):
+        """Every statement the model runs has parameters here, so new ones get checked too."""
+        self.assertEqual(set(_statements()), set(self._params()))
+
+    def test_no_full_scans(self):
+        """No statement needs a sequential scan, or an unselective index scan, of any table."""
+        params = self._params()
+        conn = self.sql_engine.raw_connection()
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SET enable_seqscan = off')
+
+            for name, statement in sorted(_statements().items()):
+                if name in WHOLE_TABLE_STATEMENTS:
+                    continue
+
+                with self.subTest(statement=name):
+                    plan = self._plan(cursor, statement, params[name])
+                    self.assertEqual(_full_scans(plan, self.leading_columns), [])
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
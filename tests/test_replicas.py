@@ -0,0 +1,118 @@
+"""Read routing tests for a model with a primary and a replica.
+
+These need two scratch Postgres databases, given through TEST_DATABASE_URL for the primary and
+TEST_REPLICA_DATABASE_URL for the replica, and are skipped without them. The migrations are applied
+to both, but nothing is replicated, so data written through the model is only found by reads which
+went to the primary.
+"""
+
+import os
+import os.path
+import random
+import unittest
+
+import sqlalchemy as sql
+
+import inventory.cache as cache
+import inventory.model as model
+import tests.fakes as fakes
+
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+TEST_REPLICA_DATABASE_URL = os.getenv('TEST_REPLICA_DATABASE_URL')
+MIGRATIONS_PATH = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+
+
+@unittest.skipIf(TEST_DATABASE_URL is None or TEST_REPLICA_DATABASE_URL is None,
+                 'TEST_DATABASE_URL or TEST_REPLICA_DATABASE_URL is not set')
+class ReplicasTestCase(unittest.TestCase):
+    WINDOW = 5
+
+    @classmethod
+    def setUpClass(cls):
+        import startup_migrations
+        startup_migrations.migrate(TEST_DATABASE_URL, MIGRATIONS_PATH)
+        startup_migrations.migrate(TEST_REPLICA_DATABASE_URL, MIGRATIONS_PATH)
+
+        cls.sql_engine = sql.create_engine(TEST_DATABASE_URL)
+        cls.replica_engine = sql.create_engine(TEST_REPLICA_DATABASE_URL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sql_engine.dispose()
+        cls.replica_engine.dispose()
+
+    def setUp(self):
+        self.the_time = fakes.FakeTime()
+        self.model = model.Model(
+            fakes.Clock(), self.sql_engine,
+            org_id_cache=cache.LruCache(max_size=100),
+            replica_engines=[self.replica_engine],
+            read_your_writes_window=self.WINDOW,
+            the_time=self.the_time)
+        self.user_id = random.randint(10**6, 10**9)
+        self.org = self.model.create_org(
+            self.user_id, 'Replicas {}'.format(self.user_id), 'A restaurant', [], 'Main Street',
+            {'weekday': {}, 'saturday': {}, 'sunday': {}}, [])
+        self.subdomain = 'replicas-{}'.format(self.user_id)
+
+    def test_reads_after_write_go_to_primary(self):
+        """A user reads their own writes for the whole window, and from a replica after it."""
+        self.the_time.now += self.WINDOW - 1
+        self.assertEqual(self.model.get_org(self.user_id), self.org)
+        self.assertEqual(self.model.get_all_menu_sections(self.user_id), [])
+
+        self.the_time.now += 1
+        with self.assertRaises(model.OrgDoesNotExistError):
+            self.model.get_org(self.user_id)
+
+    def test_writes_renew_the_window(self):
+        """Every write pins the user to the primary for another window."""
+        self.the_time.now += self.WINDOW
+        menu_section = self.model.create_menu_section(self.user_id, 'Section', 'A section')
+
+        self.the_time.now += self.WINDOW - 1
+        self.assertEqual(self.model.get_all_menu_sections(self.user_id), [menu_section])
+
+        self.the_time.now += 1
+        self.assertEqual(self.model.get_all_menu_sections(self.user_id), [])
+
+    def test_webshop_falls_back_to_primary(self):
+        """Webshops the replica does not know of are read from the primary, if just created."""
+        self.the_time.now += self.WINDOW - 1
+        org_id, _ = self.model.get_webshop_content_version(self.subdomain)
+        self.assertEqual(org_id, self.org['id'])
+        webshop_info = self.model.get_webshop_info(self.subdomain)
+        self.assertEqual(webshop_info['platforms']['website']['subdomain'], self.subdomain)
+
+        self.the_time.now += 1
+        with self.assertRaises(model.OrgDoesNotExistError):
+            self.model.get_webshop_info(self.subdomain)
+        with self.assertRaises(model.OrgDoesNotExistError):
+            self.model.get_webshop_info('unknown-{}'.format(self.user_id))
+
+    def test_client_pins_cross_processes(self):
+        """A client which sends back the pin of its write reads it through another model."""
+        # Creating the org in setUp counts as a request of its own.
+        self.model.finish_request()
+        self.model.create_menu_section(self.user_id, 'Section', 'A section')
+        pinned_until = self.model.finish_request()
+        self.assertIsNotNone(pinned_until)
+
+        other_model = model.Model(
+            fakes.Clock(), self.sql_engine, replica_engines=[self.replica_engine],
+            read_your_writes_window=self.WINDOW)
+
+        other_model.start_request(pinned_until)
+        self.assertEqual(other_model.get_org(self.user_id), self.org)
+        self.assertIsNone(other_model.finish_request())
+
+        for stale_or_forged in [None, pinned_until - self.WINDOW, pinned_until + self.WINDOW]:
+            other_model.start_request(stale_or_forged)
+            with self.assertRaises(model.OrgDoesNotExistError):
+                other_model.get_org(self.user_id)
+            other_model.finish_request()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import inventory.codec as codec
+import inventory.compression as compression
+import inventory.model as model
+import inventory.snapshots as snapshots
+import inventory.validation as validation
+
+
+class FakeModel(object):
+    def __init__(self):
+        self.webshops = {}
+
+    def get_org_webshop_info_with_version(self, org_id):
+        if org_id not in self.webshops:
+            raise model.OrgDoesNotExistError()
+        return self.webshops[org_id]
+
+
+class SnapshotsTestCase(unittest.TestCase):
+    WEBSHOP_INFO = {'menu': {'sections': {}}, 'items': ['Pizza'] * 200}
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.snapshot_store = snapshots.SnapshotStore(
+            self.path, compression.Compressor(min_size=1024, encodings=[compression.GZIP]))
+        self.model = FakeModel()
+        self.publisher = snapshots.SnapshotPublisher(
+            self.snapshot_store, self.model,
+            validation.ResponseValidator(validation.ResponseValidator.OFF))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _read(self, subdomain, accept_encoding=None):
+        snapshot = self.snapshot_store.open(subdomain, accept_encoding)
+        if snapshot is None:
+            return None
+        with snapshot.stream:
+            body = snapshot.stream.read()
+        self.assertEqual(len(body), snapshot.length)
+        return snapshot.etag, snapshot.encoding, snapshot.compressible, body
+
+    def _send(self, subdomain, accept_encoding=None):
+        # Like the sendfile path of gunicorn's wsgi.file_wrapper, which starts from the offset of
+        # the file descriptor, not from that of the Python stream.
+        snapshot = self.snapshot_store.open(subdomain, accept_encoding)
+        with snapshot.stream:
+            fd = snapshot.stream.fileno()
+            offset = os.lseek(fd, 0, os.SEEK_CUR)
+            self.assertEqual(os.fstat(fd).st_size - offset, snapshot.length)
+            return os.pread(fd, snapshot.length, offset)
+
+    def test_publish_and_open(self):
+        """Published webshops are read back as they are, or precompressed."""
+        self.model.webshops[1] = ('pizza', 3, self.WEBSHOP_INFO)
+        self.publisher.on_org_changed(1)
+
+        body = codec.dumps({'webshopInfo': self.WEBSHOP_INFO})
+        self.assertEqual(self._read('pizza'), ('"1-3"', None, True, body))
+        etag, encoding, _, encoded_body = self._read('pizza', 'gzip')
+        self.assertEqual((etag, encoding), ('"1-3"', compression.GZIP))
+        self.assertEqual(gzip.decompress(encoded_body), body)
+        self.assertIsNone(self._read('pasta'))
+
+    def test_send_from_file_descriptor(self):
+        """Snapshots are positioned at the body for servers which send from the descriptor."""
+        webshop_info = {'menu': {'sections': {}}, 'items': ['Pizza'] * 1000}
+        self.model.webshops[1] = ('pizza', 3, webshop_info)
+        self.publisher.on_org_changed(1)
+
+        body = codec.dumps({'webshopInfo': webshop_info})
+        self.assertGreater(len(body), 4096)
+        self.assertEqual(self._send('pizza'), body)
+        self.assertEqual(gzip.decompress(self._send('pizza', 'gzip')), body)
+
+    def test_small_webshops_are_not_compressed(self):
+        """Small webshops are only kept as they are, and older compressed ones are removed."""
+        self.model.webshops[1] = ('pizza', 3, self.WEBSHOP_INFO)
+        self.publisher.on_org_changed(1)
+        self.model.webshops[1] = ('pizza', 4, {})
+        self.publisher.on_org_changed(1)
+
+        self.assertEqual(
+            self._read('pizza', 'gzip'), ('"1-4"', None, False, codec.dumps({'webshopInfo': {}})))
+
+    def test_subdomain_changes(self):
+        """Only the current subdomain of an org has a snapshot."""
+        self.model.webshops[1] = ('pizza', 3, self.WEBSHOP_INFO)
+        self.publisher.on_org_changed(1)
+        self.model.webshops[1] = ('pasta', 4, self.WEBSHOP_INFO)
+        self.publisher.on_org_changed(1)
+
+        self.assertIsNone(self._read('pizza'))
+        self.assertIsNone(self._read('pizza', 'gzip'))
+        self.assertEqual(self._read('pasta')[0], '"1-4"')
+
+    def test_missing_orgs_are_removed(self):
+        """Orgs which are gone lose their snapshot, and only the lock files stay behind."""
+        self.model.webshops[1] = ('pizza', 3, self.WEBSHOP_INFO)
+        self.publisher.on_org_changed(1)
+        del self.model.webshops[1]
+        self.publisher.on_org_changed(1)
+
+        self.assertIsNone(self._read('pizza'))
+        self.assertEqual(os.listdir(self.path), ['1.lock'])
+
+
+if __name__ == '__main__':
+    unittest.main()
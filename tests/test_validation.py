@@ -0,0 +1,232 @@
+import base64
+import unittest
+
+import inventory.codec as codec
+import inventory.compiled_schemas as compiled_schemas
+import inventory.validation as validation
+
+
+class MenuItemsCreationRequestValidatorTestCase(unittest.TestCase):
+    MENU_ITEM = {
+        'sectionId': 1,
+        'name': 'Pizza',
+        'description': 'Tasty',
+        'keywords': ['cheese'],
+        'ingredients': ['flour'],
+        'imageSet': [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+    }
+
+    def setUp(self):
+        self.validator = validation.MenuItemsCreationRequestValidator(
+            id_validator=validation.IdValidator(),
+            name_validator=validation.RestaurantNameValidator(),
+            description_validator=validation.RestaurantDescriptionValidator(),
+            keywords_validator=validation.KeywordsValidator(),
+            ingredients_validator=validation.IngredientsValidator(),
+            image_set_validator=validation.ImageSetValidator())
+
+    def test_single_and_bulk(self):
+        """A single item and a list of items both come out as a list."""
+        single = self.validator.validate(codec.dumps(self.MENU_ITEM))
+        bulk = self.validator.validate(
+            codec.dumps([self.MENU_ITEM, dict(self.MENU_ITEM, sectionId=2)]))
+
+        self.assertEqual(single, [self.MENU_ITEM])
+        self.assertEqual([mi['sectionId'] for mi in bulk], [1, 2])
+
+    def test_invalid_bulk(self):
+        """Empty lists, and lists with any invalid item, are rejected."""
+        for request in [[], [self.MENU_ITEM, dict(self.MENU_ITEM, sectionId=0)]]:
+            with self.assertRaises(validation.Error):
+                self.validator.validate(codec.dumps(request))
+
+
+class MenuImportRequestValidatorTestCase(unittest.TestCase):
+    MENU_ITEM = {
+        'name': 'Pizza',
+        'description': 'Tasty',
+        'keywords': ['cheese'],
+        'ingredients': ['flour'],
+        'imageSet': [{'orderNo': 0, 'uri': 'http://example.com/a.png', 'width': 800, 'height': 450}]
+    }
+
+    def setUp(self):
+        self.validator = validation.MenuImportRequestValidator(
+            name_validator=validation.RestaurantNameValidator(),
+            description_validator=validation.RestaurantDescriptionValidator(),
+            keywords_validator=validation.KeywordsValidator(),
+            ingredients_validator=validation.IngredientsValidator(),
+            image_set_validator=validation.ImageSetValidator())
+
+    def test_valid(self):
+        """Sections come out with their items, and sections may be empty."""
+        request = {'sections': [
+            {'name': 'Pizza', 'description': 'Baked', 'items': [self.MENU_ITEM, self.MENU_ITEM]},
+            {'name': 'Drinks', 'description': 'Cold', 'items': []}
+        ]}
+
+        self.assertEqual(self.validator.validate(codec.dumps(request)), request)
+
+    def test_invalid(self):
+        """No sections, any invalid item, or too many items overall are rejected."""
+        section = {'name': 'Pizza', 'description': 'Baked', 'items': [self.MENU_ITEM]}
+        too_many = [dict(section, items=[self.MENU_ITEM] * 1000)] * 6
+
+        for sections in [[], [dict(section, items=[dict(self.MENU_ITEM, name='')])], too_many]:
+            with self.assertRaises(validation.Error):
+                self.validator.validate(codec.dumps({'sections': sections}))
+
+
+class PageRequestValidatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.validator = validation.PageRequestValidator()
+
+    def test_not_paginated(self):
+        """Without a limit or a cursor the listing is not paginated."""
+        self.assertIsNone(self.validator.validate(None, None))
+
+    def test_round_trip(self):
+        """A cursor produced for an id decodes back to it, with the limit defaulted if missing."""
+        cursor = self.validator.cursor(1234)
+
+        self.assertEqual(self.validator.validate('10', cursor), (10, 1234))
+        self.assertEqual(
+            self.validator.validate(None, cursor), (self.validator.DEFAULT_LIMIT, 1234))
+        self.assertEqual(self.validator.validate('10', None), (10, 0))
+
+    def test_invalid(self):
+        """Out of range limits and malformed cursors are rejected."""
+        for limit_raw, cursor_raw in [
+                ('0', None), ('1001', None), ('ten', None), (None, 'not a cursor'),
+                (None, self.validator.cursor(-1)), (None, self.validator.cursor('1'))]:
+            with self.assertRaises(validation.Error):
+                self.validator.validate(limit_raw, cursor_raw)
+
+
+class FieldsValidatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.validator = validation.FieldsValidator(['id', 'name', 'imageSet'])
+
+    def test_valid(self):
+        """A list of known fields is accepted, and no list at all selects everything."""
+        self.assertIsNone(self.validator.validate(None))
+        self.assertEqual(self.validator.validate(['name']), frozenset(['name']))
+        self.assertEqual(self.validator.validate(['id', ' name']), frozenset(['id', 'name']))
+
+    def test_invalid(self):
+        """Unknown or empty field names are rejected."""
+        for fields_raw in [[], [''], ['name', ''], ['price'], ['name', 'image_set']]:
+            with self.assertRaises(validation.Error):
+                self.validator.validate(fields_raw)
+
+
+class SearchRequestValidatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.validator = validation.SearchRequestValidator()
+
+    def test_terms(self):
+        """The query is split into lowercase words, with punctuation dropped."""
+        self.assertEqual(
+            self.validator.validate('Piță, cu BRÂNZĂ & o:*', None, None),
+            (['piță', 'cu', 'brânză', 'o'], self.validator.DEFAULT_LIMIT, 0))
+
+    def test_round_trip(self):
+        """A cursor produced for an offset decodes back to it."""
+        cursor = self.validator.cursor(40)
+
+        self.assertEqual(self.validator.validate('pizza', '20', cursor), (['pizza'], 20, 40))
+
+    def test_walk_to_max_offset(self):
+        """Following every next cursor ends at MAX_OFFSET, without a cursor which is rejected."""
+        for limit in [1, 20, 80, self.validator.MAX_LIMIT]:
+            offsets = []
+            cursor = None
+
+            while True:
+                _, _, offset = self.validator.validate('pizza', str(limit), cursor)
+                offsets.append(offset)
+                # A search with more results than any client can page through.
+                cursor = self.validator.cursor(offset + limit)
+                if cursor is None:
+                    break
+
+            self.assertEqual(offsets, list(range(0, self.validator.MAX_OFFSET + 1, limit)))
+
+    def test_invalid(self):
+        """Empty queries, out of range limits and malformed cursors are rejected."""
+        for query_raw, limit_raw, cursor_raw in [
+                (None, None, None), ('', None, None), ('!?', None, None), ('a' * 201, None, None),
+                ('a b c d e f g h i j k', None, None), ('pizza', '0', None),
+                ('pizza', '101', None), ('pizza', None, 'not a cursor'),
+                ('pizza', None, base64.urlsafe_b64encode(
+                    codec.dumps({'offset': 1001})).decode('ascii')),
+                ('pizza', None, self.validator.cursor(-1))]:
+            with self.assertRaises(validation.Error):
+                self.validator.validate(query_raw, limit_raw, cursor_raw)
+
+
+class ChangesRequestValidatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.validator = validation.ChangesRequestValidator()
+
+    def test_valid(self):
+        """Any content version is accepted, 0 included."""
+        self.assertEqual(self.validator.validate('0'), 0)
+        self.assertEqual(self.validator.validate('1234'), 1234)
+
+    def test_invalid(self):
+        """Missing, negative, too large or non integer versions are rejected."""
+        for since_raw in [None, '', '-1', '1.5', 'ten', str(2**63)]:
+            with self.assertRaises(validation.Error):
+                self.validator.validate(since_raw)
+
+
+class ResponseValidatorTestCase(unittest.TestCase):
+    VALID_RESPONSE = {'org': {'id': 1, 'timeCreatedTs': 1000}}
+    INVALID_RESPONSE = {'org': {'id': 1}}
+
+    def test_always_counts_violations(self):
+        """In "always" mode every response is checked and violations are counted per route."""
+        response_validator = validation.ResponseValidator(validation.ResponseValidator.ALWAYS)
+
+        response_validator.validate('GET /org', self.VALID_RESPONSE, compiled_schemas.ORG_RESPONSE)
+        response_validator.validate(
+            'GET /org', self.INVALID_RESPONSE, compiled_schemas.ORG_RESPONSE)
+        response_validator.validate(
+            'POST /org', self.INVALID_RESPONSE, compiled_schemas.ORG_RESPONSE)
+
+        stats = response_validator.stats()
+        self.assertEqual(stats['checked'], {'GET /org': 2, 'POST /org': 1})
+        self.assertEqual(stats['violations'], {'GET /org': 1, 'POST /org': 1})
+
+    def test_sampled(self):
+        """In "sampled" mode only a fraction of the responses are checked."""
+        draws = iter([0.05, 0.5, 0.09])
+        response_validator = validation.ResponseValidator(
+            validation.ResponseValidator.SAMPLED, 0.1, the_random=lambda: next(draws))
+
+        for _ in range(3):
+            response_validator.validate(
+                'GET /org', self.INVALID_RESPONSE, compiled_schemas.ORG_RESPONSE)
+
+        self.assertEqual(response_validator.stats()['violations'], {'GET /org': 2})
+
+    def test_off(self):
+        """In "off" mode no response is checked."""
+        response_validator = validation.ResponseValidator(validation.ResponseValidator.OFF)
+
+        response_validator.validate(
+            'GET /org', self.INVALID_RESPONSE, compiled_schemas.ORG_RESPONSE)
+
+        self.assertEqual(response_validator.stats()['checked'], {})
+
+    def test_invalid_mode(self):
+        """Unknown modes and sample rates are rejected."""
+        with self.assertRaises(ValueError):
+            validation.ResponseValidator('sometimes')
+        with self.assertRaises(ValueError):
+            validation.ResponseValidator(validation.ResponseValidator.SAMPLED, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()